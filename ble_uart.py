@@ -3,8 +3,9 @@
 
 import bluetooth
 import struct
-import time
+import utime
 from micropython import const
+from frame_proto import Reassembler, CHUNK_MARKER
 
 # Nordic UART Service (NUS) UUIDs
 _UART_SERVICE_UUID      = bluetooth.UUID("6E400001-B5A3-F393-E0A9-E50E24DCCA9E")
@@ -15,6 +16,7 @@ _UART_TX_CHAR_UUID      = bluetooth.UUID("6E400003-B5A3-F393-E0A9-E50E24DCCA9E")
 _IRQ_CENTRAL_CONNECT    = const(1)
 _IRQ_CENTRAL_DISCONNECT = const(2)
 _IRQ_GATTS_WRITE        = const(3)
+_IRQ_CONNECTION_UPDATE  = const(27)
 
 # Properties
 _FLAG_READ              = const(0x0002)
@@ -24,6 +26,12 @@ _FLAG_NOTIFY            = const(0x0010)
 
 _MAX_ADV_BYTES          = const(31)
 
+# Advertising: fast for a while after boot or a disconnect so a central
+# finds us again quickly, then slow to save radio time
+ADV_FAST_US             = 30_000
+ADV_SLOW_US             = 1_022_500
+ADV_FAST_MS             = 30_000
+
 # ---- base62 helpers (no slicing, no rjust) ----
 _B62_ALPH_STR = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
 
@@ -49,15 +57,86 @@ def _make_suffix_from_mac(mac: bytes) -> str:
     last2 = (int(mac[-2]) << 8) | int(mac[-1])
     return _pad_left_zeros(_u16_to_base62(last2), 4)
 
+class FrameRing:
+    """
+    Bounded ring of received frames that the BLE IRQ can fill without
+    allocating. Slots are preallocated; a frame longer than a slot is cut.
+    When every slot is full the newest queued frame is replaced, so the
+    reader always ends up with the latest data, and `dropped` is counted.
+
+    The IRQ only ever moves the write counter and the reader only the read
+    counter, and a full ring never overwrites the slot being read.
+    Set `flag` to anything with a set() method (e.g. asyncio.ThreadSafeFlag)
+    to be woken when a frame arrives.
+    """
+    def __init__(self, slots=8, slot_size=128):
+        self._bufs = [bytearray(slot_size) for _ in range(slots)]
+        self._views = [memoryview(b) for b in self._bufs]
+        self._lens = [0] * slots
+        self._conns = [0] * slots
+        self._slots = slots
+        self.slot_size = slot_size
+        self._wr = 0
+        self._rd = 0
+        self.dropped = 0
+        self.conn_handle = None
+        self.flag = None
+
+    def __len__(self):
+        return self._wr - self._rd
+
+    def free(self):
+        """Slots that can take a frame without replacing one."""
+        return self._slots - (self._wr - self._rd)
+
+    def put(self, data, conn_handle=0):
+        if self._wr - self._rd >= self._slots:
+            # Full: replace the newest frame rather than the one being read
+            idx = (self._wr - 1) % self._slots
+            self.dropped += 1
+            advance = False
+        else:
+            idx = self._wr % self._slots
+            advance = True
+        buf = self._bufs[idx]
+        n = len(data)
+        if n > len(buf):
+            n = len(buf)
+            data = memoryview(data)[0:n]
+        buf[0:n] = data
+        self._lens[idx] = n
+        self._conns[idx] = conn_handle
+        if advance:
+            self._wr += 1
+        if self.flag is not None:
+            self.flag.set()
+
+    def get_into(self, buf):
+        """Copy the oldest frame into buf, return its length (0 if empty).
+        The frame's connection handle is left in `conn_handle`."""
+        if self._rd == self._wr:
+            return 0
+        idx = self._rd % self._slots
+        n = self._lens[idx]
+        buf[0:n] = self._views[idx][0:n]
+        self.conn_handle = self._conns[idx]
+        self._rd += 1
+        return n
+
+
 class BLEUART:
     """
     BLE UART-like service:
       - TX characteristic: Notify + Read (ESP32 -> client)
       - RX characteristic: Write (+ Write Without Response) (client -> ESP32)
-    Advertises as 'ericbt-<4char>'.
+    Advertises as 'ericbt-<4char>', and keeps advertising while fewer than
+    max_connections centrals are connected. Advertising starts at
+    adv_fast_us and drops to adv_slow_us after adv_fast_ms; call service()
+    every second or so to make that happen.
     """
     def __init__(self, base_name="ericbt", include_uuid_in_scan_resp=True, addr_public=True,
-                 rx_buf_size=128):
+                 rx_buf_size=128, max_connections=1, adv_fast_us=ADV_FAST_US,
+                 adv_slow_us=ADV_SLOW_US, adv_fast_ms=ADV_FAST_MS):
         self._ble = bluetooth.BLE()
         self._ble.active(True)
 
@@ -111,13 +190,25 @@ class BLEUART:
             pass
 
         self._connections = set()
+        self._conn_params = {}
+        self.max_connections = max_connections
+        self._reassemblers = {}
+        self._rx_ring = None
         self._on_receive = None
         self._on_connect = None          # NEW
         self._on_disconnect = None       # NEW
 
-        # Advertising payloads
+        # Advertising payloads, including the name-only fallback
         self._adv = self._build_adv_payload(name=adv_name)
         self._resp = self._build_scan_resp_payload(services=[_UART_SERVICE_UUID]) if include_uuid_in_scan_resp else None
+        self._adv_name_only = self._build_adv_payload(name=base_name)
+
+        self.adv_fast_us = adv_fast_us
+        self.adv_slow_us = adv_slow_us
+        self.adv_fast_ms = adv_fast_ms
+        self.adv_interval_us = 0          # 0 while not advertising
+        self._adv_started = 0
+        self.connect_ms = None            # advertising start -> last connect
 
         self._advertise()
 
@@ -134,6 +225,17 @@ class BLEUART:
         """handler(data_bytes: bytes, conn_handle: int) -> Optional[bytes]"""
         self._on_receive = handler
 
+    def set_rx_ring(self, ring):
+        """Queue incoming writes into a FrameRing instead of calling the
+        receive handler from the IRQ. Chunked messages (see frame_proto)
+        are reassembled first, up to the ring's slot size."""
+        self._rx_ring = ring
+
+    def set_tx_value(self, data: bytes):
+        """Set what a central reads from the TX characteristic (notifies
+        are sent separately and do not change it)."""
+        self._ble.gatts_write(self._tx_handle, data)
+
     def set_on_connect(self, handler):
         """handler(conn_handle: int) -> None"""
         self._on_connect = handler
@@ -155,27 +257,53 @@ class BLEUART:
             except OSError:
                 pass
 
+    def conn_params(self, conn_handle):
+        """(interval in 1.25 ms units, peripheral latency, supervision
+        timeout in 10 ms units) last reported for a connection, or None.
+        The central picks these; MicroPython has no call for a peripheral
+        to ask for others."""
+        return self._conn_params.get(conn_handle)
+
     def advertise_stop(self):
+        self.adv_interval_us = 0
         try:
             self._ble.gap_advertise(None)
         except Exception:
             pass
 
+    def service(self):
+        """Drop to the slow advertising interval once the fast window is
+        over. Returns True if the interval changed."""
+        if (self.adv_interval_us == self.adv_fast_us and self.adv_fast_us != self.adv_slow_us
+                and utime.ticks_diff(utime.ticks_ms(), self._adv_started) >= self.adv_fast_ms):
+            self._advertise(fast=False)
+            return True
+        return False
+
     # -------- IRQ handler --------
     def _irq(self, event, data):
         if event == _IRQ_CENTRAL_CONNECT:
             conn_handle, _, _ = data
             self._connections.add(conn_handle)
-            print("Central connected:", conn_handle)
+            # The stack has stopped advertising
+            if self.adv_interval_us:
+                self.connect_ms = utime.ticks_diff(utime.ticks_ms(), self._adv_started)
+                self.adv_interval_us = 0
+            print("Central connected:", conn_handle, "after", self.connect_ms, "ms advertising")
             if self._on_connect:
                 try:
                     self._on_connect(conn_handle)
                 except Exception as e:
                     print("on_connect error:", e)
+            # The stack stops advertising on connect; carry on if there is room
+            if len(self._connections) < self.max_connections:
+                self._advertise()
 
         elif event == _IRQ_CENTRAL_DISCONNECT:
             conn_handle, _, _ = data
             self._connections.discard(conn_handle)
+            self._reassemblers.pop(conn_handle, None)
+            self._conn_params.pop(conn_handle, None)
             print("Central disconnected:", conn_handle)
             if self._on_disconnect:
                 try:
@@ -184,11 +312,23 @@ class BLEUART:
                     print("on_disconnect error:", e)
             self._advertise()
 
+        elif event == _IRQ_CONNECTION_UPDATE:
+            conn_handle, interval, latency, timeout, status = data
+            if status == 0:
+                self._conn_params[conn_handle] = (interval, latency, timeout)
+                print("Connection", conn_handle, "interval", interval * 1.25, "ms, latency",
+                      latency, "timeout", timeout * 10, "ms")
+
         elif event == _IRQ_GATTS_WRITE:
             conn_handle, value_handle = data
             if value_handle == self._rx_handle:
                 incoming = self._ble.gatts_read(self._rx_handle)
-                if self._on_receive:
+                if self._rx_ring is not None:
+                    if incoming and incoming[0] == CHUNK_MARKER:
+                        self._put_chunk(incoming, conn_handle)
+                    else:
+                        self._rx_ring.put(incoming, conn_handle)
+                elif self._on_receive:
                     try:
                         resp = self._on_receive(incoming, conn_handle)
                         if isinstance(resp, (bytes, bytearray)) and len(resp) > 0:
@@ -196,11 +336,26 @@ class BLEUART:
                     except Exception as e:
                         print("on_receive error:", e)
                 else:
-                    self.notify(b"OK:" + incoming, conn_handle)
+                    self.notify(b"OK", conn_handle)
+
+    def _put_chunk(self, chunk, conn_handle):
+        # Each connection gets its own buffer, allocated on its first chunk
+        r = self._reassemblers.get(conn_handle)
+        if r is None:
+            r = Reassembler(self._rx_ring.slot_size)
+            self._reassemblers[conn_handle] = r
+        n = r.feed(chunk)
+        if n:
+            self._rx_ring.put(r.mv[0:n], conn_handle)
 
     # -------- Advertising helpers --------
-    def _advertise(self, interval_us=30_000):
+    def _advertise(self, fast=True):
+        # Fast restarts the fast window (boot, disconnect); slow keeps the
+        # time advertising started, so connect_ms covers the whole stretch
+        interval_us = self.adv_fast_us if fast else self.adv_slow_us
         self.advertise_stop()
+        if fast:
+            self._adv_started = utime.ticks_ms()
         try:
             if self._resp:
                 self._ble.gap_advertise(interval_us, adv_data=self._adv, resp_data=self._resp)
@@ -209,12 +364,12 @@ class BLEUART:
         except OSError as e:
             print("Advertising failed:", e)
             try:
-                name_only = self._build_adv_payload(name="ericbt")
-                self._ble.gap_advertise(interval_us, adv_data=name_only)
+                self._ble.gap_advertise(interval_us, adv_data=self._adv_name_only)
                 print("Fell back to name-only advertising.")
             except OSError as e2:
                 print("Fallback advertising also failed:", e2)
                 raise
+        self.adv_interval_us = interval_us
 
     @staticmethod
     def _append(payload: bytearray, adv_type: int, value: bytes):
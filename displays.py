@@ -0,0 +1,323 @@
+# displays.py - several LCDs on one I2C bus, rendered a slice at a time
+
+import utime
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+from glyph_cache import GlyphCache
+
+ROW_KEYS = ("LCD0", "LCD1", "LCD2", "LCD3")
+
+
+class Display:
+    """
+    One LCD with its own glyph cache and spinner. apply() only draws into
+    the LCD's frame buffer; render_step() sends at most a slice of the
+    changes, so a display with a lot to redraw cannot hold the bus for long.
+    latency_ms is the time from the first undrawn change to the screen
+    being up to date again. Glyphs drawn with draw_glyph() are put back if
+    their CGRAM slot is recycled for another glyph: on the page drawn to
+    and the one shown at end_update(), and on any other page once it is
+    shown.
+
+    Pages are extra frame buffers, one per owner (e.g. a BLE connection);
+    the LCD's own frame buffer is page None. draw_to() picks the page that
+    draws land in and show_page() the one flushed to the LCD, so switching
+    pages only sends the cells that differ.
+    """
+    def __init__(self, display_id, lcd, spinner=()):
+        self.id = display_id
+        self.lcd = lcd
+        self.glyphs = GlyphCache(lcd)
+        self.spinner = spinner
+        self._spin = 0
+        self.dirty = False
+        self._since = 0
+        self.latency_ms = 0
+        self.max_latency_ms = 0
+        self._base = lcd.frame
+        self._pages = {}
+        self.visible = None
+        self._drawing = None
+        # Per page: (x, y) -> name of the glyph drawn there
+        self._glyph_at = {None: {}}
+
+    def _touch(self):
+        if not self.dirty:
+            self.dirty = True
+            self._since = utime.ticks_ms()
+
+    def draw_row(self, row, text):
+        if row < self.lcd.num_lines:
+            self.lcd.draw(0, row, text)
+            self._touch()
+
+    def draw_glyph(self, x, y, name):
+        """Draw the named glyph at (x, y), uploading it to CGRAM if need
+        be."""
+        self.lcd.draw(x, y, self.glyphs.char(name))
+        self._glyph_at[self._drawing][(x, y)] = name
+
+    def _refresh_glyphs(self, key):
+        # Cells of page key showing a CGRAM slot that went to another glyph
+        # get theirs back (in a slot of its own, or the fallback if all are
+        # pinned); that can recycle more slots, so go round until none are
+        # left. The page is checked rather than the cells GlyphCache found,
+        # since those are only the ones on screen and being drawn.
+        glyph_at = self._glyph_at[key]
+        if not glyph_at:
+            return
+        drawing = self._drawing
+        self.draw_to(key)
+        frame = self.lcd.frame
+        cols = self.lcd.num_columns
+        again = True
+        while again:
+            again = False
+            for cell in glyph_at:
+                x, y = cell
+                code = frame[y * cols + x]
+                if code >= 16:
+                    # Drawn over with text since
+                    del glyph_at[cell]
+                    again = True
+                    break
+                name = glyph_at[cell]
+                if not self.glyphs.shows(code, name):
+                    self.draw_glyph(x, y, name)
+                    again = True
+        self.draw_to(drawing)
+
+    def show_status(self, text):
+        # Replaces the whole screen with a status line
+        self.lcd.erase()
+        self.draw_row(0, text)
+
+    def set_backlight(self, on):
+        if on:
+            self.lcd.backlight_on()
+        else:
+            self.lcd.backlight_off()
+
+    def _row_width(self, row):
+        # The last row leaves room for the spinner
+        lcd = self.lcd
+        if self.spinner and row == lcd.num_lines - 1:
+            return lcd.num_columns - 1
+        return lcd.num_columns
+
+    def apply(self, data):
+        """Draw a {"LCD0": ..., "BL": "on"|"off"} update."""
+        if "BL" in data:
+            self.set_backlight(data["BL"] != "off")
+        for row in range(self.lcd.num_lines):
+            key = ROW_KEYS[row]
+            if key in data:
+                self.lcd.draw(0, row, data[key][:self._row_width(row)])
+        self.end_update()
+
+    def draw_bytes(self, row, col, buf, start, end):
+        """Draw raw LCD codes from buf[start:end] at (col, row); call
+        end_update() once the whole update has been drawn."""
+        if row >= self.lcd.num_lines:
+            return
+        width = self._row_width(row) - col
+        if end - start > width:
+            end = start + width
+        if end > start:
+            self.lcd.draw_bytes(col, row, buf, start, end)
+
+    def end_update(self):
+        """Advance the spinner, redraw glyphs whose slot was recycled and
+        mark the display for rendering."""
+        lcd = self.lcd
+        if self.spinner:
+            self.draw_glyph(lcd.num_columns - 1, lcd.num_lines - 1, self.spinner[self._spin])
+            self._spin = (self._spin + 1) % len(self.spinner)
+        self._refresh_glyphs(self._drawing)
+        if self.visible != self._drawing:
+            # Uploads for a hidden page can take a slot shown on screen
+            self._refresh_glyphs(self.visible)
+        self.glyphs.stale()
+        # Glyphs drawn in this update stay pinned until here
+        self.glyphs.begin_frame()
+        self._touch()
+
+    def add_page(self, key):
+        self._pages[key] = bytearray(b" " * len(self._base))
+        self._glyph_at[key] = {}
+
+    def remove_page(self, key):
+        if self.visible == key:
+            self.show_page(None)
+        self._pages.pop(key, None)
+        self._glyph_at.pop(key, None)
+
+    def _page(self, key):
+        return self._base if key is None else self._pages[key]
+
+    def draw_to(self, key):
+        self._drawing = key
+        self.lcd.frame = self._page(key)
+
+    def show_page(self, key):
+        self.visible = key
+        self.draw_to(key)
+        # Its glyphs may have lost their slots while it was hidden
+        self._refresh_glyphs(key)
+        self.glyphs.stale()
+        self.glyphs.begin_frame()
+        self._touch()
+
+    def render_step(self, max_cells):
+        self.lcd.flush(max_cells)
+        if not self.lcd.dirty():
+            self.dirty = False
+            self.latency_ms = utime.ticks_diff(utime.ticks_ms(), self._since)
+            if self.latency_ms > self.max_latency_ms:
+                self.max_latency_ms = self.latency_ms
+
+
+class RenderScheduler:
+    """
+    Routes updates to displays and interleaves their rendering: each dirty
+    display gets one slice of at most cells_per_slice cells in turn, with a
+    yield to the event loop in between.
+
+    Top level "LCDn"/"BL" keys address display 0, as before; "D<id>" holds
+    the same keys for any display, e.g. {"D1": {"LCD3": "disk 93%"}}.
+    route() raises ValueError, drawing nothing, for an update of any other
+    shape.
+    Binary frames are drawn through the begin_frame()/row()/backlight()/
+    end_frame() calls made by frame_proto.parse().
+
+    Each sender (key, e.g. its connection handle) can have its own page on
+    every display: open_page() adds one, and route()/begin_frame() take the
+    page to draw into. One page is shown at a time and rotate() moves on
+    to the next in turn, so senders share the screen instead of
+    overwriting each other. Backlight changes from a sender whose page is
+    not shown are ignored. Without pages everything goes to page None.
+    """
+    def __init__(self, displays, cells_per_slice=16):
+        # cells_per_slice=0 sends each display's changes in one go
+        self.displays = displays
+        self.cells_per_slice = cells_per_slice
+        self._keys = ["D{}".format(d.id) for d in displays]
+        self._touched = 0
+        self.pages = []
+        self.visible = None
+        self._target = None
+
+    # -------- pages --------
+    def open_page(self, key):
+        for d in self.displays:
+            d.add_page(key)
+        self.pages.append(key)
+        if len(self.pages) == 1:
+            self.show_page(key)
+
+    def close_page(self, key):
+        if key not in self.pages:
+            return
+        if self.visible == key:
+            self.rotate()
+        self.pages.remove(key)
+        if self.visible == key:
+            self.show_page(None)
+        for d in self.displays:
+            d.remove_page(key)
+
+    def show_page(self, key):
+        self.visible = key
+        for d in self.displays:
+            d.show_page(key)
+
+    def rotate(self):
+        """Show the next sender's page. Returns True if the page changed."""
+        if len(self.pages) < 2:
+            return False
+        i = self.pages.index(self.visible) + 1 if self.visible in self.pages else 0
+        self.show_page(self.pages[i % len(self.pages)])
+        return True
+
+    def _draw_to(self, key):
+        self._target = key
+        for d in self.displays:
+            d.draw_to(key)
+
+    def route(self, data, page=None):
+        # Nothing is drawn from an update of the wrong shape
+        self._check(data, "update")
+        for key in self._keys:
+            if key in data:
+                self._check(data[key], key)
+        self._draw_to(page)
+        if self.displays and ("BL" in data or "LCD0" in data or "LCD1" in data
+                              or "LCD2" in data or "LCD3" in data):
+            self._apply(self.displays[0], data)
+        for i, key in enumerate(self._keys):
+            if key in data:
+                self._apply(self.displays[i], data[key])
+        self._draw_to(self.visible)
+
+    def _check(self, data, name):
+        if not isinstance(data, dict):
+            raise ValueError("{} must be an object".format(name))
+        for key in ROW_KEYS:
+            if key in data and not isinstance(data[key], str):
+                raise ValueError("{} must be a string".format(key))
+
+    def _apply(self, display, data):
+        if "BL" in data and self._target != self.visible:
+            data = dict(data)
+            del data["BL"]
+        display.apply(data)
+
+    # -------- frame_proto sink --------
+    def begin_frame(self, page=None):
+        self._touched = 0
+        self._draw_to(page)
+
+    def backlight(self, on):
+        if self._target == self.visible:
+            for d in self.displays:
+                d.set_backlight(on)
+
+    def row(self, display_id, row, col, buf, start, end):
+        if display_id < len(self.displays):
+            self.displays[display_id].draw_bytes(row, col, buf, start, end)
+            self._touched |= 1 << display_id
+
+    def end_frame(self):
+        for d in self.displays:
+            if self._touched & (1 << d.id):
+                d.end_update()
+        self._draw_to(self.visible)
+
+    def show_status(self, text, page=None):
+        self._draw_to(page)
+        for d in self.displays:
+            d.show_status(text)
+        self._draw_to(self.visible)
+
+    def dirty(self):
+        for d in self.displays:
+            if d.dirty:
+                return True
+        return False
+
+    def step(self):
+        """Give every dirty display one slice. Returns True while any
+        display still has changes to send."""
+        for d in self.displays:
+            if d.dirty:
+                d.render_step(self.cells_per_slice)
+        return self.dirty()
+
+    async def run(self):
+        """Render until every display is up to date, yielding to the
+        event loop between rounds."""
+        while self.step():
+            await asyncio.sleep_ms(0)
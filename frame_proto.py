@@ -0,0 +1,344 @@
+# frame_proto.py - compact binary frames for the Nordic UART characteristics
+#
+# Shared by the ESP32 firmware and the PC sender, so it sticks to what
+# MicroPython supports. JSON frames ({"LCD0": ...}) are still accepted; a
+# JSON frame starts with "{" so the first byte tells the formats apart.
+# The sender's own state per device (delta encoding, credits, change
+# filtering, round trips) is in sender/frame_state.py.
+#
+# Every binary frame starts with a 5 byte header:
+#   version (1) | type (1) | flags (1) | seq (2, little endian)
+#
+# FT_ROWS body, repeated until the end of the frame:
+#   display id (1) | row (1) | column (1) | length (1) | length LCD bytes
+# Row text is raw LCD character codes (0-7 are the CGRAM glyphs), one byte
+# per cell, written from the given column.
+#
+# FT_PATCH has the same body as FT_ROWS but only carries the cells that
+# changed, so it only applies on top of the frame sent just before it:
+# its seq must be one more than the previous frame's. FT_ROWS frames are
+# always taken and restart the sequence. A FT_PATCH with no records (and
+# no backlight flag) changes nothing and serves as a keepalive: the
+# device only acks it. The JSON keepalive is {"seq": n}.
+#
+# FT_RESYNC (device -> sender, notify) has no body; its seq is that of the
+# patch the device refused. The sender answers with a FT_ROWS frame of
+# everything.
+#
+# FT_ACK (device -> sender, notify) replaces the old "OK:" echo. Its seq
+# is the last frame the device took from that sender (JSON frames carry
+# theirs in a "seq" key; those without one are counted from 1), and the
+# body is
+#   credits (1) | frames still queued (1)
+# The sender may send frames up to seq + credits and then waits for the
+# next ack. The device acks after each render pass and every so often.
+#
+# FT_PROFILE (sender -> device) picks one of PROFILES by id (1 byte body).
+# It is not part of the FT_ROWS/FT_PATCH sequence. The device answers
+# with a FT_PROFILE notify of
+#   profile id (1) | connection interval (2, LE, 1.25 ms units) |
+#   peripheral latency (2, LE) | supervision timeout (2, LE, 10 ms units)
+# giving the connection parameters currently in use (0 if not known yet).
+#
+# FT_HELLO body (device -> sender, kept as the TX characteristic's value so
+# the sender can read it straight after connecting):
+#   capabilities (1) | largest frame accepted (2, little endian) |
+#   credits to start with (1, with CAP_CREDITS)
+#
+# Chunks: a frame (binary or JSON) longer than one write allows is split
+# into writes that each start with
+#   CHUNK_MARKER (1) | message id (1) | offset (2, LE) | total length (2, LE)
+# followed by the next piece of the frame. Chunks of a message arrive in
+# order; the device puts them back together in a preallocated buffer.
+# Frames that fit in one write are sent as they are.
+
+PROTO_VERSION = 1
+
+HEADER_SIZE = 5
+RECORD_HEADER_SIZE = 4
+
+# Frame types
+FT_ROWS = 1
+FT_HELLO = 2
+FT_PATCH = 3
+FT_RESYNC = 4
+FT_ACK = 5
+FT_PROFILE = 6
+
+# Header flags
+FL_BACKLIGHT_SET = 0x01     # backlight bit below is valid
+FL_BACKLIGHT_ON = 0x02      # backlight on (all displays)
+
+# Capabilities in FT_HELLO
+CAP_JSON = 0x01
+CAP_BINARY = 0x02
+CAP_CHUNKS = 0x04
+CAP_CREDITS = 0x08
+CAP_PROFILES = 0x10
+
+CHUNK_MARKER = 0xfe
+CHUNK_HEADER_SIZE = 6
+
+# Connection profiles: name -> (id, connection interval min and max in
+# 1.25 ms units, peripheral latency, supervision timeout in 10 ms units,
+# seconds between sender updates, ms between device acks). Each side paces
+# itself to the update and ack intervals. The connection parameters are
+# the ones the profile is meant for: the central's Bluetooth stack picks
+# the real ones (MicroPython cannot ask for them as a peripheral, nor can
+# bleak portably), so the device reports what is in use to compare.
+PROFILES = {
+    "realtime": (1, 6, 12, 0, 200, 0.1, 250),
+    "balanced": (2, 24, 40, 0, 400, 0.5, 1000),
+    "idle": (3, 80, 160, 4, 600, 2.0, 4000),
+}
+
+# Bytes added to each write on air: ATT opcode + handle, L2CAP header
+AIR_OVERHEAD = 3 + 4
+
+
+def is_binary(buf):
+    return len(buf) >= HEADER_SIZE and buf[0] == PROTO_VERSION
+
+
+def header(frame_type, flags=0, seq=0):
+    return bytes((PROTO_VERSION, frame_type, flags, seq & 0xff, (seq >> 8) & 0xff))
+
+
+def lcd_bytes(text):
+    """LCD character codes for a str (one byte per character)."""
+    if isinstance(text, (bytes, bytearray)):
+        return bytes(text)
+    return bytes([ord(c) & 0xff for c in text])
+
+
+def encode_rows(rows, display_id=0, backlight=None, seq=0):
+    """Encode a full screen update. rows is a list of str/bytes, one per
+    row from row 0; None skips a row. backlight is True, False or None
+    (leave as is)."""
+    return encode_records([(display_id, row, 0, text)
+                           for row, text in enumerate(rows) if text is not None],
+                          backlight, seq)
+
+
+def encode_records(records, backlight=None, seq=0, frame_type=FT_ROWS):
+    """Encode (display id, row, column, text) records."""
+    flags = 0
+    if backlight is not None:
+        flags |= FL_BACKLIGHT_SET
+        if backlight:
+            flags |= FL_BACKLIGHT_ON
+    out = bytearray(header(frame_type, flags, seq))
+    for display_id, row, col, text in records:
+        data = lcd_bytes(text)
+        if len(data) > 255:
+            raise ValueError("row text longer than 255 bytes")
+        out.extend(bytes((display_id, row, col, len(data))))
+        out.extend(data)
+    return bytes(out)
+
+
+def encode_patch(old_rows, new_rows, display_id=0, backlight=None, seq=0):
+    """Encode a FT_PATCH frame with the runs of cells that differ between
+    old_rows and new_rows (lists of str/bytes, one per row). Unchanged
+    gaps shorter than a record header are sent as part of the run, which
+    is cheaper than starting a new record. With no changes the frame is
+    just the header."""
+    records = []
+    for row, new in enumerate(new_rows):
+        if new is None:
+            continue
+        new = lcd_bytes(new)
+        old = lcd_bytes(old_rows[row]) if row < len(old_rows) and old_rows[row] is not None else b""
+        start = None
+        gap = 0
+        for col in range(len(new)):
+            same = col < len(old) and old[col] == new[col]
+            if not same:
+                if start is None:
+                    start = col
+                gap = 0
+            elif start is not None:
+                gap += 1
+                if gap > RECORD_HEADER_SIZE:
+                    records.append((display_id, row, start, new[start:col + 1 - gap]))
+                    start = None
+                    gap = 0
+        if start is not None:
+            records.append((display_id, row, start, new[start:len(new) - gap]))
+    return encode_records(records, backlight, seq, FT_PATCH)
+
+
+def encode_resync(seq):
+    return header(FT_RESYNC, 0, seq)
+
+
+class SeqCheck:
+    """Checks the sequence numbers of one sender's frames. accept(buf, n)
+    returns False for a FT_PATCH frame that does not follow on from the
+    last frame taken (a write was lost), after which patches are refused
+    until a FT_ROWS frame arrives. `lost` counts the gaps seen."""
+
+    def __init__(self):
+        self.expected = None
+        self.lost = 0
+
+    def accept(self, buf, n):
+        if n < HEADER_SIZE:
+            raise ValueError("short frame")
+        if buf[1] != FT_ROWS and buf[1] != FT_PATCH:
+            return True
+        seq = frame_seq(buf)
+        if buf[1] == FT_PATCH and seq != self.expected:
+            if self.expected is not None:
+                self.lost += 1
+            self.expected = None
+            return False
+        self.expected = (seq + 1) & 0xffff
+        return True
+
+
+def profile_name(profile_id):
+    for name, p in PROFILES.items():
+        if p[0] == profile_id:
+            return name
+    return None
+
+
+def encode_profile(profile_id):
+    return header(FT_PROFILE) + bytes((profile_id,))
+
+
+def encode_profile_report(profile_id, interval, latency, timeout):
+    return header(FT_PROFILE) + bytes((profile_id, interval & 0xff, interval >> 8,
+                                       latency & 0xff, latency >> 8,
+                                       timeout & 0xff, timeout >> 8))
+
+
+def parse_profile_report(buf):
+    """Returns (profile id, interval, latency, timeout) from a FT_PROFILE
+    notify, or None."""
+    if len(buf) < HEADER_SIZE + 7 or buf[0] != PROTO_VERSION or buf[1] != FT_PROFILE:
+        return None
+    return (buf[5], buf[6] | (buf[7] << 8), buf[8] | (buf[9] << 8),
+            buf[10] | (buf[11] << 8))
+
+
+def encode_hello(caps, max_frame, credits=0):
+    return header(FT_HELLO) + bytes((caps, max_frame & 0xff, (max_frame >> 8) & 0xff,
+                                     credits))
+
+
+def parse_hello(buf):
+    """Returns (capabilities, largest frame, credits) from an FT_HELLO
+    frame, or (CAP_JSON, 0, 0) for anything else (e.g. firmware that
+    predates it)."""
+    if (buf is None or len(buf) < HEADER_SIZE + 3 or buf[0] != PROTO_VERSION
+            or buf[1] != FT_HELLO):
+        return CAP_JSON, 0, 0
+    credits = buf[8] if len(buf) > HEADER_SIZE + 3 else 0
+    return buf[5], buf[6] | (buf[7] << 8), credits
+
+
+def encode_ack(seq, credits, queued):
+    return header(FT_ACK, 0, seq) + bytes((min(credits, 255), min(queued, 255)))
+
+
+def parse_ack(buf):
+    """Returns (seq, credits, queued) from an FT_ACK frame, or None."""
+    if len(buf) < HEADER_SIZE + 2 or buf[0] != PROTO_VERSION or buf[1] != FT_ACK:
+        return None
+    return frame_seq(buf), buf[5], buf[6]
+
+
+def split(msg, msg_id, write_size):
+    """The writes to send msg in, write_size bytes at most each (the ATT
+    MTU less 3). msg goes as it is if it fits."""
+    if len(msg) <= write_size:
+        return [msg]
+    step = write_size - CHUNK_HEADER_SIZE
+    if step <= 0:
+        raise ValueError("write size too small for chunk header")
+    total = len(msg)
+    out = []
+    for offset in range(0, total, step):
+        out.append(bytes((CHUNK_MARKER, msg_id & 0xff, offset & 0xff, offset >> 8,
+                          total & 0xff, total >> 8)) + msg[offset:offset + step])
+    return out
+
+
+class Reassembler:
+    """Puts chunked messages back together in a preallocated buffer of
+    `size` bytes. feed(chunk) returns the message length once its last
+    chunk is in (the message is then in buf[:n]), 0 otherwise. A chunk
+    that does not follow on from the previous one, or a message too big
+    for the buffer, drops the message and counts it in `dropped`."""
+
+    def __init__(self, size):
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.dropped = 0
+        self._id = -1
+        self._got = 0
+        self._total = 0
+
+    def feed(self, chunk):
+        n = len(chunk)
+        if n < CHUNK_HEADER_SIZE or chunk[0] != CHUNK_MARKER:
+            self.dropped += 1
+            return 0
+        msg_id = chunk[1]
+        offset = chunk[2] | (chunk[3] << 8)
+        total = chunk[4] | (chunk[5] << 8)
+        if offset == 0:
+            if self._id >= 0:
+                # The previous message never completed
+                self.dropped += 1
+            self._id = msg_id
+            self._got = 0
+            self._total = total
+        elif msg_id != self._id or offset != self._got or total != self._total:
+            if self._id >= 0:
+                self.dropped += 1
+            self._id = -1
+            return 0
+        end = offset + n - CHUNK_HEADER_SIZE
+        if end > total or total > len(self.buf):
+            self.dropped += 1
+            self._id = -1
+            return 0
+        self.buf[offset:end] = memoryview(chunk)[CHUNK_HEADER_SIZE:n]
+        self._got = end
+        if end < total:
+            return 0
+        self._id = -1
+        return total
+
+
+def frame_seq(buf):
+    return buf[3] | (buf[4] << 8)
+
+
+def parse(buf, n, sink):
+    """Parse the binary frame in buf[:n] without building any objects.
+    Calls sink.backlight(on) if the frame sets the backlight, then
+    sink.row(display_id, row, col, buf, start, end) for each record.
+    Returns the frame type; raises ValueError if the frame is malformed."""
+    if n < HEADER_SIZE or buf[0] != PROTO_VERSION:
+        raise ValueError("not a v1 frame")
+    frame_type = buf[1]
+    flags = buf[2]
+    if flags & FL_BACKLIGHT_SET:
+        sink.backlight(flags & FL_BACKLIGHT_ON)
+    if frame_type != FT_ROWS and frame_type != FT_PATCH:
+        return frame_type
+    i = HEADER_SIZE
+    while i < n:
+        if i + RECORD_HEADER_SIZE > n:
+            raise ValueError("truncated record header")
+        start = i + RECORD_HEADER_SIZE
+        end = start + buf[i + 3]
+        if end > n:
+            raise ValueError("truncated record")
+        sink.row(buf[i], buf[i + 1], buf[i + 2], buf, start, end)
+        i = end
+    return frame_type
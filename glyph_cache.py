@@ -0,0 +1,111 @@
+# Maps named custom characters onto the HD44780's 8 CGRAM slots
+
+
+class GlyphCache:
+
+    # Keeps any number of named 5x8 glyphs and uploads them to the LCD's
+    # CGRAM slots on demand with LcdApi.custom_char(). A glyph that is
+    # already resident is not uploaded again. When every slot is taken the
+    # least recently used glyph is evicted, except for glyphs used since the
+    # last begin_frame(), which are pinned so a frame never overwrites its
+    # own characters.
+    #
+    # Evicting a slot changes every cell on screen that shows that slot.
+    # Those cells are collected and handed to the renderer by stale() so it
+    # can redraw them with whatever they are meant to show. Each cell is
+    # listed once, so the list never holds more than the screen. Only the
+    # LCD's shadow and current frame buffer are looked at; a renderer with
+    # other frame buffers (Display's pages) checks their cells with shows().
+
+    def __init__(self, lcd, slots=8, fallback=" "):
+        self.lcd = lcd
+        self.fallback = fallback
+        self.glyphs = {}
+        self.slot_name = [None] * slots
+        self.slot_used = [0] * slots
+        self.pinned = [False] * slots
+        self.clock = 0
+        self.hits = 0
+        self.uploads = 0
+        self.evictions = 0
+        self._stale = []
+
+    def add(self, name, charmap):
+        # Registers (or replaces) a glyph. A resident glyph whose bitmap
+        # changed is uploaded again the next time it is used.
+        self.glyphs[name] = charmap
+        for slot, resident in enumerate(self.slot_name):
+            if resident == name:
+                self.slot_name[slot] = None
+
+    def begin_frame(self):
+        # Unpins every slot. Call before drawing each frame.
+        for slot in range(len(self.pinned)):
+            self.pinned[slot] = False
+
+    def char(self, name):
+        # Returns the character to draw for the named glyph, uploading it
+        # first if it is not resident. Returns the fallback character if
+        # every slot is pinned by the current frame.
+        self.clock += 1
+        slot = self._find(name)
+        if slot is None:
+            slot = self._victim()
+            if slot is None:
+                return self.fallback
+            self._load(slot, name)
+        else:
+            self.hits += 1
+        self.slot_used[slot] = self.clock
+        self.pinned[slot] = True
+        return chr(slot)
+
+    def shows(self, code, name):
+        # True if character code (0-15) shows the named glyph right now
+        return self.slot_name[code & 7] == name
+
+    def stale(self):
+        # Returns the (x, y) cells showing a slot that has been recycled
+        # since the last call, and forgets them.
+        cells = self._stale
+        self._stale = []
+        return cells
+
+    def _find(self, name):
+        for slot, resident in enumerate(self.slot_name):
+            if resident == name:
+                return slot
+        return None
+
+    def _victim(self):
+        victim = None
+        for slot, resident in enumerate(self.slot_name):
+            if self.pinned[slot]:
+                continue
+            if resident is None:
+                return slot
+            if victim is None or self.slot_used[slot] < self.slot_used[victim]:
+                victim = slot
+        return victim
+
+    def _load(self, slot, name):
+        if self.slot_name[slot] is not None:
+            self.evictions += 1
+            self._mark_stale(slot)
+        self.lcd.custom_char(slot, self.glyphs[name])
+        self.slot_name[slot] = name
+        self.uploads += 1
+
+    def _mark_stale(self, slot):
+        # Character codes 8-15 show the same CGRAM slots as 0-7. Cells
+        # drawn but not flushed yet count too
+        lcd = self.lcd
+        cols = lcd.num_columns
+        shadow = lcd.shadow
+        frame = lcd.frame
+        for i in range(len(shadow)):
+            if ((shadow[i] < 16 and shadow[i] & 7 == slot)
+                    or (frame[i] < 16 and frame[i] & 7 == slot)):
+                cell = (i % cols, i // cols)
+                if cell not in self._stale:
+                    self._stale.append(cell)
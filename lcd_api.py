@@ -54,6 +54,15 @@ class LcdApi:
         self.cursor_x = 0
         self.cursor_y = 0
         self.implied_newline = False
+        # DDRAM address the controller will write to next, or None if it is
+        # not known (e.g. after writing CGRAM)
+        self._addr = None
+        # Shadow copy of DDRAM (what the LCD shows) and the frame buffer that
+        # draw() writes into; flush() sends only the cells that differ.
+        self.shadow = bytearray(self.num_lines * self.num_columns)
+        self.frame = bytearray(self.num_lines * self.num_columns)
+        self.cells_written = 0
+        self.cells_skipped = 0
         self.backlight = True
         self.display_off()
         self.backlight_on()
@@ -68,6 +77,10 @@ class LcdApi:
         self.hal_write_command(self.LCD_HOME)
         self.cursor_x = 0
         self.cursor_y = 0
+        self._addr = 0
+        for i in range(len(self.shadow)):
+            self.shadow[i] = 0x20
+            self.frame[i] = 0x20
 
     def show_cursor(self):
         # Causes the cursor to be made visible
@@ -115,6 +128,7 @@ class LcdApi:
     def move_to(self, cursor_x, cursor_y):
         # Moves the cursor position to the indicated position. The cursor
         # position is zero based (i.e. cursor_x == 0 indicates first column).
+        # No command is sent if the controller is already at that address.
         self.cursor_x = cursor_x
         self.cursor_y = cursor_y
         addr = cursor_x & 0x3f
@@ -122,11 +136,17 @@ class LcdApi:
             addr += 0x40    # Lines 1 & 3 add 0x40
         if cursor_y & 2:    # Lines 2 & 3 add number of columns
             addr += self.num_columns
-        self.hal_write_command(self.LCD_DDRAM | addr)
+        if addr != self._addr:
+            self.hal_write_command(self.LCD_DDRAM | addr)
+            self._addr = addr
 
     def putchar(self, char):
         # Writes the indicated character to the LCD at the current cursor
         # position, and advances the cursor by one position.
+        #
+        # The entry mode set in __init__ (LCD_ENTRY_INC) makes the controller
+        # advance its address after every write, so the address is only sent
+        # again when the cursor wraps or the controller is somewhere else.
         if char == '\n':
             if self.implied_newline:
                 # self.implied_newline means we advanced due to a wraparound,
@@ -135,31 +155,162 @@ class LcdApi:
             else:
                 self.cursor_x = self.num_columns
         else:
-            self.hal_write_data(ord(char))
+            code = ord(char) & 0xff
+            self.move_to(self.cursor_x, self.cursor_y)
+            self.hal_write_data(code)
+            self._addr += 1
+            if self.cursor_x < self.num_columns and self.cursor_y < self.num_lines:
+                i = self.cursor_y * self.num_columns + self.cursor_x
+                self.shadow[i] = code
+                self.frame[i] = code
             self.cursor_x += 1
+        wrapped = False
         if self.cursor_x >= self.num_columns:
             self.cursor_x = 0
             self.cursor_y += 1
             self.implied_newline = (char != '\n')
+            wrapped = True
         if self.cursor_y >= self.num_lines:
             self.cursor_y = 0
-        self.move_to(self.cursor_x, self.cursor_y)
+            wrapped = True
+        if wrapped:
+            # Line 0 is not followed by line 1 in DDRAM, so re-address
+            self.move_to(self.cursor_x, self.cursor_y)
 
     def putstr(self, string):
         # Write the indicated string to the LCD at the current cursor
         # position and advances the cursor position appropriately.
+        try:
+            self.hal_batch_begin()
+            try:
+                for char in string:
+                    self.putchar(char)
+            finally:
+                self.hal_batch_end()
+        except Exception:
+            self._write_failed()
+            raise
+
+    def draw(self, cursor_x, cursor_y, string):
+        # Writes the indicated string into the frame buffer at the given
+        # position without talking to the LCD. There is no wrapping or
+        # newline handling; anything past the end of the line is dropped.
+        # Call flush() to send the changes to the LCD.
+        if cursor_y >= self.num_lines:
+            return
+        i = cursor_y * self.num_columns + cursor_x
+        end = (cursor_y + 1) * self.num_columns
         for char in string:
-            self.putchar(char)
+            if i >= end:
+                break
+            self.frame[i] = ord(char) & 0xff
+            i += 1
+
+    def draw_bytes(self, cursor_x, cursor_y, buf, start=0, end=None):
+        # Like draw(), but copies raw character codes from buf[start:end]
+        # with nothing to decode. Pass a memoryview so the slice is not a
+        # copy either.
+        if end is None:
+            end = len(buf)
+        if cursor_y >= self.num_lines or cursor_x >= self.num_columns:
+            return
+        stop = start + self.num_columns - cursor_x
+        if end < stop:
+            stop = end
+        if stop > start:
+            i = cursor_y * self.num_columns + cursor_x
+            self.frame[i:i + stop - start] = buf[start:stop]
+
+    def flush(self, max_cells=0):
+        # Sends the cells of the frame buffer which differ from the shadow
+        # copy of the LCD. Each run of changed cells costs at most one
+        # move_to, so an unchanged cell between two changed ones is simply
+        # rewritten. The cursor position is left as it was; the controller is
+        # re-addressed lazily by the next putchar(). With max_cells, stop
+        # after writing that many cells; the next flush() carries on.
+        # Returns the number of cells written. If a write fails the
+        # exception is passed on and the next flush() sends every cell.
+        cols = self.num_columns
+        frame = self.frame
+        shadow = self.shadow
+        cursor_x = self.cursor_x
+        cursor_y = self.cursor_y
+        written = 0
+        examined = len(frame)
+        try:
+            self.hal_batch_begin()
+            try:
+                for y in range(self.num_lines):
+                    base = y * cols
+                    x = 0
+                    while x < cols:
+                        if frame[base + x] == shadow[base + x]:
+                            x += 1
+                            continue
+                        end = x + 1
+                        while end < cols:
+                            if frame[base + end] != shadow[base + end]:
+                                end += 1
+                            elif end + 1 < cols and frame[base + end + 1] != shadow[base + end + 1]:
+                                end += 2
+                            else:
+                                break
+                        if max_cells and end - x > max_cells - written:
+                            end = x + max_cells - written
+                        self.move_to(x, y)
+                        for i in range(base + x, base + end):
+                            self.hal_write_data(frame[i])
+                            shadow[i] = frame[i]
+                        self._addr += end - x
+                        written += end - x
+                        x = end
+                        if max_cells and written >= max_cells:
+                            break
+                    if max_cells and written >= max_cells:
+                        examined = base + x
+                        break
+            finally:
+                self.cursor_x = cursor_x
+                self.cursor_y = cursor_y
+                self.hal_batch_end()
+        except Exception:
+            self._write_failed()
+            raise
+        self.cells_written += written
+        self.cells_skipped += examined - written
+        return written
+
+    def _write_failed(self):
+        # A write to the LCD failed, and with it whatever else was queued
+        # in the same batch, so neither the LCD's contents nor its address
+        # are known any more. Make every shadow cell differ from the frame
+        # so the next flush() sends them all again.
+        frame = self.frame
+        shadow = self.shadow
+        for i in range(len(shadow)):
+            shadow[i] = frame[i] ^ 0xff
+        self._addr = None
+
+    def dirty(self):
+        # True if the frame buffer has changes flush() has not sent yet
+        return self.frame != self.shadow
+
+    def erase(self):
+        # Blanks the frame buffer. Unlike clear() nothing is sent to the LCD
+        # (and there is no 1.5 ms wait); flush() blanks the cells in use.
+        for i in range(len(self.frame)):
+            self.frame[i] = 0x20
 
     def custom_char(self, location, charmap):
         # Write a character to one of the 8 CGRAM locations, available
         # as chr(0) through chr(7).
         location &= 0x7
         self.hal_write_command(self.LCD_CGRAM | (location << 3))
-        self.hal_sleep_us(40)
+        self.hal_wait_ready(40)
         for i in range(8):
             self.hal_write_data(charmap[i])
-            self.hal_sleep_us(40)
+            self.hal_wait_ready(40)
+        self._addr = None
         self.move_to(self.cursor_x, self.cursor_y)
 
     def hal_backlight_on(self):
@@ -172,6 +323,17 @@ class LcdApi:
         # If desired, a derived HAL class will implement this function.
         pass
 
+    def hal_batch_begin(self):
+        # Marks the start of a run of writes which may be sent to the LCD
+        # together. If desired, a derived HAL class will buffer writes until
+        # the matching hal_batch_end() call.
+        pass
+
+    def hal_batch_end(self):
+        # Marks the end of a run of writes started by hal_batch_begin().
+        # If desired, a derived HAL class will implement this function.
+        pass
+
     def hal_write_command(self, cmd):
         # Write a command to the LCD.
         # It is expected that a derived HAL class will implement this function.
@@ -182,6 +344,12 @@ class LcdApi:
         # It is expected that a derived HAL class will implement this function.
         raise NotImplementedError
 
+    def hal_wait_ready(self, usecs):
+        # Waits until the LCD is ready for the next command. usecs is the
+        # worst case execution time of the last command. A derived HAL class
+        # which can read the busy flag may return sooner.
+        self.hal_sleep_us(usecs)
+
     def hal_sleep_us(self, usecs):
         # Sleep for some time (given in microseconds)
         time.sleep_us(usecs)
\ No newline at end of file
@@ -1,128 +1,324 @@
-import time
-from ble_uart import BLEUART
-from machine import Pin, SoftI2C
-from pico_i2c_lcd import I2cLcd
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+from ble_uart import BLEUART, FrameRing
+from machine import Pin, SoftI2C, I2C
+from pico_i2c_lcd import I2cLcd, GcPolicy, calibrate_i2c
 import json
+import frame_proto
 from custom_char import get_arrow_chars
+from displays import Display, RenderScheduler
 
-# Define the LCD I2C address and dimensions
-I2C_ADDR = 0x27
-I2C_NUM_ROWS = 2
-I2C_NUM_COLS = 16
+# Define the LCDs on the I2C bus: (I2C address, rows, columns), one entry
+# per PCF8574 backpack. The list index is the display id used in payloads.
+DISPLAYS = (
+    (0x27, 2, 16),
+    # (0x26, 4, 20),
+)
+I2C_SCL = 8
+I2C_SDA = 7
+# Hardware I2C peripheral to try first; None to always bit-bang
+I2C_HW_ID = 0
+
+# Largest BLE write accepted (also the MTU asked for)
+RX_BUF_SIZE = 128
+# Largest frame accepted; bigger ones than RX_BUF_SIZE come in chunks
+MAX_FRAME = 512
+# Frames that can wait to be rendered; senders get this many credits
+RX_SLOTS = 8
+# Acks (with fresh credits) also go out this often while connected,
+# unless a central's connection profile asks for them more often
+ACK_INTERVAL_MS = 1000
+# Centrals that can be connected at once; each gets its own page of the
+# displays, shown in turn for PAGE_MS
+MAX_CENTRALS = 2
+PAGE_MS = 4000
 
 # To hold the caluclated unique BT device name
 adv_name = ""
-connected = False
 
-# Setup I2C LCD device
+# Setup I2C LCD devices
 
-i2c = SoftI2C(scl=Pin(8), sda=Pin(7), freq=500_000)
-lcd = I2cLcd(i2c, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
-lcd.backlight_on()
-lcd.clear()
-lcd.move_to(0,0)
+def make_hw_i2c(freq):
+    return I2C(I2C_HW_ID, scl=Pin(I2C_SCL), sda=Pin(I2C_SDA), freq=freq)
 
-arrow = 0
+def make_soft_i2c(freq):
+    return SoftI2C(scl=Pin(I2C_SCL), sda=Pin(I2C_SDA), freq=freq)
 
-# Update display outside of recv callback
-def update_display(data):
+# Prefer the hardware peripheral (no CPU time spent bit-banging) at the
+# fastest frequency every display reads back reliably at
+i2c_addrs = tuple(addr for addr, _, _ in DISPLAYS)
+i2c, i2c_freq, failure = None, 0, None
+if I2C_HW_ID is not None:
+    i2c, i2c_freq, failure = calibrate_i2c(make_hw_i2c, i2c_addrs)
+    if i2c is None:
+        # No such peripheral, or pins it cannot use, on this board
+        print("Hardware I2C unavailable:", failure[1])
+if i2c is None:
+    i2c, i2c_freq, failure = calibrate_i2c(make_soft_i2c, i2c_addrs)
+if i2c is None:
+    i2c, i2c_freq = make_soft_i2c(100_000), 100_000
+print("I2C backend:", type(i2c).__name__, "at", i2c_freq, "Hz" if failure is None else
+      "Hz ({} Hz failed: {})".format(*failure))
 
-    global arrow
-    print(data)
-    
-    if "BL" in data:
-        if data["BL"] == "off":
-            lcd.backlight_off()
-        else:
-            lcd.backlight_on()
-
-    #lcd.clear()
-    if "LCD0" in data:
-        lcd.move_to(0,0)
-        lcd.putstr(data["LCD0"])
-    if "LCD1" in data:
-        lcd.move_to(0,1)
-        lcd.putstr(data["LCD1"][:15])
-    
-    lcd.move_to(15,1)
-    lcd.putchar(chr(arrow))
-    arrow += 1
-    if arrow == 8:
-        arrow = 0
+# The spinner's frames, uploaded to each display's CGRAM on first use
+ARROWS = []
+for idx in range(len(get_arrow_chars())):
+    ARROWS.append("arrow{}".format(idx))
 
+displays = []
+for display_id, (addr, rows, cols) in enumerate(DISPLAYS):
+    # Collect garbage every 20 frames, or sooner if the heap gets tight
+    lcd = I2cLcd(i2c, addr, rows, cols,
+                 gc_policy=GcPolicy(frames=20, min_free=16 * 1024))
+    lcd.backlight_on()
+    lcd.clear()
+    display = Display(display_id, lcd, ARROWS)
+    for name, charmap in zip(ARROWS, get_arrow_chars()):
+        display.glyphs.add(name, charmap)
+    displays.append(display)
+    print("LCD{} at {}: {}x{}".format(display_id, hex(addr), cols, rows))
+
+scheduler = RenderScheduler(displays)
     
 
-# recieve data callback funcion
-def on_receive(rx: bytes, conn_handle: int):
+# Frames received over BLE, queued by the IRQ and drained by render_task()
+rx_ring = FrameRing(slots=RX_SLOTS, slot_size=MAX_FRAME)
+# Connects/disconnects for render_task() to act on: (conn_handle, connected)
+conn_events = []
+# Sequence checks for binary frames, and the last frame taken (what the
+# next ack carries), per connection
+seq_checks = {}
+last_seq = {}
+# Connection profile (a frame_proto.PROFILES name) each central asked for
+profiles = {}
 
-    data = {}
-    text = rx.decode("utf-8").strip()
-    data = json.loads(text)
 
-    update_display(data)    
+def decode_json(rx):
 
-    return ("OK:" + text).encode()
+    text = rx.decode("utf-8").strip()
+    return text, json.loads(text)
 
 
-# ble disconnect callback function
+# ble disconnect callback function (IRQ context: just record it)
 def on_disconnect(conn_handle: int):
 
-    global connected
-    connected = False
-
+    conn_events.append((conn_handle, False))
     print("Disconnected")
-    lcd.clear()
-    lcd.move_to(0,0)
-    lcd.putstr(f"bt: {adv_name}")
-
+    rx_ring.flag.set()
 
 
 def on_connect(conn_handle: int):
-    global connected
-    connected = True
-    # Optional: brief status flash
-    lcd.clear()
-    lcd.move_to(0, 0)
-    lcd.putstr("Connected")
+    conn_events.append((conn_handle, True))
+    rx_ring.flag.set()
+
+
+# Give each new central a page (with a brief status flash) and drop the
+# pages of those gone; once nobody is left the status page comes back
+def apply_conn_events():
+
+    while conn_events:
+        conn_handle, up = conn_events.pop(0)
+        if up:
+            scheduler.open_page(conn_handle)
+            scheduler.show_status("Connected", conn_handle)
+        else:
+            scheduler.close_page(conn_handle)
+            seq_checks.pop(conn_handle, None)
+            last_seq.pop(conn_handle, None)
+            profiles.pop(conn_handle, None)
+            if not scheduler.pages:
+                scheduler.show_status(f"bt: {adv_name}")
+
+
+# Drain the receive ring into the displays' frame buffers, so only the
+# latest content of each row is kept, then render. Runs as a task so the
+# LCDs are never driven from the BLE IRQ. Binary frames (see frame_proto)
+# are drawn straight from the receive buffer; a patch that does not follow
+# on from the last frame is dropped and a resync asked for. Each central
+# draws into its own page. Once rendered, each sender is acked with fresh
+# credits.
+async def render_task(ble):
+
+    buf = bytearray(MAX_FRAME)
+    mv = memoryview(buf)
+    while True:
+        await rx_ring.flag.wait()
+        apply_conn_events()
+        while True:
+            n = rx_ring.get_into(buf)
+            if not n:
+                break
+            conn_handle = rx_ring.conn_handle
+            if conn_handle not in scheduler.pages:
+                # Left over from a central that has gone
+                continue
+            try:
+                if buf[0] == frame_proto.PROTO_VERSION:
+                    if n > frame_proto.HEADER_SIZE and buf[1] == frame_proto.FT_PROFILE:
+                        set_profile(ble, conn_handle, buf[5])
+                        continue
+                    check = seq_checks.get(conn_handle)
+                    if check is None:
+                        check = seq_checks[conn_handle] = frame_proto.SeqCheck()
+                    if not check.accept(buf, n):
+                        print("frame lost, asking for a resync")
+                        ble.notify(frame_proto.encode_resync(frame_proto.frame_seq(buf)),
+                                   conn_handle)
+                        continue
+                    scheduler.begin_frame(conn_handle)
+                    try:
+                        frame_proto.parse(mv, n, scheduler)
+                    finally:
+                        scheduler.end_frame()
+                    # Only frames drawn are acked
+                    last_seq[conn_handle] = frame_proto.frame_seq(buf)
+                    continue
+                text, data = decode_json(bytes(mv[:n]))
+                if isinstance(data, dict) and "seq" in data:
+                    seq = data.pop("seq") & 0xffff
+                else:
+                    # A sender that does not number its JSON frames
+                    seq = (last_seq.get(conn_handle, 0) + 1) & 0xffff
+                print(data)
+                try:
+                    scheduler.route(data, conn_handle)
+                except ValueError as e:
+                    # Valid JSON of the wrong shape, e.g. {"D0": "x"}: drop
+                    # it, unacked, and keep going
+                    print("bad update:", e)
+                    continue
+                last_seq[conn_handle] = seq
+            except Exception as e:
+                print("bad frame:", e)
+        try:
+            await scheduler.run()
+        except Exception as e:
+            # An I2C error part way through; the LCD is then redrawn in
+            # full on the next pass
+            print("render failed:", e)
+        send_acks(ble)
+
+
+# The free ring slots are shared out between the senders, so a fast one
+# cannot crowd out the others
+def send_acks(ble):
+
+    credits = rx_ring.free() // max(1, len(last_seq))
+    queued = len(rx_ring)
+    for conn_handle, seq in last_seq.items():
+        ble.notify(frame_proto.encode_ack(seq, credits, queued), conn_handle)
+
+
+# Record the profile a central asked for and tell it which connection
+# parameters are in use. The central sets those; here the profile only
+# changes how often acks go out.
+def set_profile(ble, conn_handle, profile_id):
+
+    name = frame_proto.profile_name(profile_id)
+    if name is None:
+        print("unknown profile:", profile_id)
+        return
+    profiles[conn_handle] = name
+    print("profile", name, "for central", conn_handle)
+    interval, latency, timeout = ble.conn_params(conn_handle) or (0, 0, 0)
+    ble.notify(frame_proto.encode_profile_report(profile_id, interval, latency, timeout),
+               conn_handle)
+
+
+def ack_interval_ms():
+
+    if not profiles:
+        return ACK_INTERVAL_MS
+    return min(frame_proto.PROFILES[name][6] for name in profiles.values())
+
 
+# Re-send the acks now and then, so a sender that missed one (and is out
+# of credits) carries on
+async def ack_task(ble):
 
-## Setup and advertise. Set disconnect and recieve callbacks.
+    while True:
+        await asyncio.sleep_ms(ack_interval_ms())
+        send_acks(ble)
+
+
+# Let advertising drop to the slow interval once the fast window is over
+async def adv_task(ble):
+
+    while True:
+        await asyncio.sleep_ms(1000)
+        ble.service()
+
+
+# Show each central's page in turn
+async def page_task():
+
+    while True:
+        await asyncio.sleep_ms(PAGE_MS)
+        if scheduler.rotate():
+            rx_ring.flag.set()
+
+
+# Scroll the repo URL along the bottom row of the first display while
+# nobody is connected
+async def marquee_task():
+
+    s = "https://github.com/electronf99/eric-LCD-BT-thingy "
+    i = 0
+    cols = displays[0].lcd.num_columns
+
+    while True:
+        await asyncio.sleep_ms(500)
+        # Go by the pages, not the IRQ's view: until a disconnect is
+        # applied, the central's page is still the one drawn to
+        apply_conn_events()
+        if not scheduler.pages:
+            i = (i + 1) % len(s)
+            rotated = s[i:] + s[:i]
+            displays[0].draw_row(1, rotated[:cols])
+            rx_ring.flag.set()
+
+
+## Setup and advertise. Set disconnect and connect callbacks; received
+## frames go into rx_ring.
 ## Main loop
-def main():
+async def main_async():
     
     global adv_name
     
-    # Load the arrow char
-    custom = get_arrow_chars()
-    for idx, custom_char in enumerate(custom):
-        lcd.custom_char(idx, custom_char)
+    await asyncio.sleep(1)
     
-    time.sleep(1)
-    
-    ble = BLEUART(base_name="ericbt", include_uuid_in_scan_resp=True, addr_public=True)
+    ble = BLEUART(base_name="ericbt", include_uuid_in_scan_resp=True, addr_public=True,
+                  rx_buf_size=RX_BUF_SIZE, max_connections=MAX_CENTRALS)
     adv_name = ble.adv_name
+    # Tell senders which frame formats we take
+    ble.set_tx_value(frame_proto.encode_hello(
+        frame_proto.CAP_JSON | frame_proto.CAP_BINARY | frame_proto.CAP_CHUNKS |
+        frame_proto.CAP_CREDITS | frame_proto.CAP_PROFILES, MAX_FRAME,
+        RX_SLOTS // MAX_CENTRALS))
 
+    rx_ring.flag = asyncio.ThreadSafeFlag()
     ble.set_on_connect(on_connect)
     ble.set_on_disconnect(on_disconnect)
-    ble.set_on_receive(on_receive)
+    ble.set_rx_ring(rx_ring)
 
-    time.sleep(1)
+    await asyncio.sleep(1)
 
     
-    lcd.clear()
-    lcd.putstr(f"bt: {adv_name}")
+    scheduler.show_status(f"bt: {adv_name}")
+    rx_ring.flag.set()
     
-    s = "https://github.com/electronf99/eric-LCD-BT-thingy "
-    i = 0
+    asyncio.create_task(render_task(ble))
+    asyncio.create_task(ack_task(ble))
+    asyncio.create_task(page_task())
+    asyncio.create_task(adv_task(ble))
+    await marquee_task()
 
-    while True:
-        time.sleep_ms(500)
-        if not connected:
-            i = (i + 1) % len(s)
-            rotated = s[i:] + s[:i]
-            lcd.move_to(0,1)
-            lcd.putstr(rotated[:16])
+
+def main():
+    asyncio.run(main_async())
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
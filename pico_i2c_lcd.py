@@ -12,14 +12,133 @@ MASK_E  = 0x04       # P2
 SHIFT_BACKLIGHT = 3  # P3
 SHIFT_DATA      = 4  # P4-P7
 
+# Most PCF8574 bytes queued before a batch is pushed out in one writeto()
+# (a multiple of 4, the bytes per character)
+BATCH_MAX = 256
+
+# With the busy flag enabled, waits shorter than this are skipped: the next
+# 4-edge write takes longer than that on the bus anyway, and one poll costs
+# three transactions.
+BUSY_POLL_MIN_US = 200
+
+# Bus frequencies tried by calibrate_i2c(), slowest first. A batched
+# character is 4 PCF8574 bytes (36 bit times) back to back, and that has to
+# take longer than the HD44780 needs to execute the previous one (37 us, more
+# on slower clones); the PCF8574 reading back fine says nothing about that.
+# At 800 kHz it is 45 us; at 1 MHz only 36 us, so stop at 800 kHz.
+CAL_FREQS = (100_000, 200_000, 400_000, 500_000, 800_000)
+# Written to the PCF8574 and read back. E (P2) stays low so the LCD ignores
+# them and the backlight (P3) stays on.
+CAL_PATTERNS = (0x08, 0xf8, 0xa8, 0x58, 0x0b, 0xfb)
+
+class GcPolicy:
+
+    # Decides when I2cLcd runs the garbage collector. Instead of collecting
+    # after every byte, collect after every `frames` batches (e.g. putstr or
+    # flush calls), or as soon as free heap drops below `min_free` bytes.
+    # Either check is disabled by setting it to 0.
+
+    def __init__(self, frames=16, min_free=0):
+        self.frames = frames
+        self.min_free = min_free
+        self.count = 0
+        self.collections = 0
+
+    def frame_done(self):
+        self.count += 1
+        if ((self.frames and self.count >= self.frames) or
+                (self.min_free and _mem_free() < self.min_free)):
+            gc.collect()
+            self.count = 0
+            self.collections += 1
+
+
+def calibrate_i2c(make_i2c, i2c_addr, freqs=CAL_FREQS, rounds=8):
+    # Finds the fastest reliable bus frequency for the PCF8574 at i2c_addr
+    # (or for every address in a tuple of them). make_i2c(freq) returns a
+    # machine.I2C or SoftI2C running at freq. Each frequency, slowest first,
+    # has to write and read back every test pattern `rounds` times;
+    # stepping up stops at the first failure, be it a bus error (OSError)
+    # or a bus that cannot be set up at that frequency or on those pins
+    # (ValueError).
+    # Returns (i2c, freq, failure): i2c is None and freq 0 if not even the
+    # slowest worked, and failure is (freq, exception) for the frequency
+    # that failed, or None. Nothing is printed; that is up to the caller.
+    addrs = i2c_addr if isinstance(i2c_addr, tuple) else (i2c_addr,)
+    best = 0
+    failure = None
+    buf = bytearray(1)
+    for freq in freqs:
+        try:
+            i2c = make_i2c(freq)
+            for _ in range(rounds):
+                for addr in addrs:
+                    for pattern in CAL_PATTERNS:
+                        buf[0] = pattern
+                        i2c.writeto(addr, buf)
+                        i2c.readfrom_into(addr, buf)
+                        if buf[0] != pattern:
+                            raise OSError("{:02x}: read back {:02x}, wrote {:02x}".format(
+                                addr, buf[0], pattern))
+        except (OSError, ValueError) as e:
+            failure = (freq, e)
+            break
+        best = freq
+    if not best:
+        return None, 0, failure
+    # The last bus tried may have failed, so set up the winner again
+    return make_i2c(best), best, failure
+
+
+def _mem_free():
+    # gc.mem_free() only exists on MicroPython
+    try:
+        return gc.mem_free()
+    except AttributeError:
+        return 1 << 30
+
+
 class I2cLcd(LcdApi):
     
     #Implements a HD44780 character LCD connected via PCF8574 on I2C
+    #
+    # i2c can be a hardware machine.I2C or a bit-banged SoftI2C; see
+    # calibrate_i2c() for picking the bus frequency.
+    #
+    # The collector runs as gc_policy decides (a default GcPolicy() if none
+    # is given), per frame rather than after every write; the hal_write_*
+    # path itself never allocates.
+    #
+    # busy_flag=True polls the HD44780 busy flag through the PCF8574 instead
+    # of sleeping the worst case after clear/home and CGRAM writes. This
+    # needs the LCD's R/W pin wired to P1; if the flag cannot be read back
+    # the driver falls back to the fixed delays. wait_us adds up the time
+    # spent waiting and last_frame_wait_us is the wait since the previous
+    # batch ended.
 
-    def __init__(self, i2c, i2c_addr, num_lines, num_columns):
+    def __init__(self, i2c, i2c_addr, num_lines, num_columns, gc_policy=None,
+                 busy_flag=False):
         self.i2c = i2c
         self.i2c_addr = i2c_addr
-        self.i2c.writeto(self.i2c_addr, bytes([0]))
+        self.gc_policy = gc_policy if gc_policy is not None else GcPolicy()
+        self.busy_flag = False
+        self.wait_us = 0
+        self.last_frame_wait_us = 0
+        self._frame_wait_start = 0
+        # Preallocated buffers: one byte, one command/data byte (4 nibble
+        # edges), busy flag reads and the batch queue
+        self._one = bytearray(1)
+        self._cmd = bytearray(4)
+        self._rd = bytearray(1)
+        self._rd_post = bytearray(3)
+        self._buf = bytearray(BATCH_MAX)
+        self._mv = memoryview(self._buf)
+        # Views of the first n bytes of the queue (n is a multiple of 4),
+        # made the first time each length is sent and reused after that
+        self._views = [None] * (BATCH_MAX // 4 + 1)
+        self._len = 0
+        self._batch_depth = 0
+        self._write_one(0)
         utime.sleep_ms(20)   # Allow LCD time to powerup
         # Send reset 3 times
         self.hal_write_init_nibble(self.LCD_FUNCTION_RESET)
@@ -36,51 +155,142 @@ class I2cLcd(LcdApi):
         if num_lines > 1:
             cmd |= self.LCD_FUNCTION_2LINES
         self.hal_write_command(cmd)
+        if busy_flag:
+            self.busy_flag = self._probe_busy_flag()
         gc.collect()
 
+    def _write_one(self, byte):
+        self._one[0] = byte
+        self.i2c.writeto(self.i2c_addr, self._one)
+
     def hal_write_init_nibble(self, nibble):
         # Writes an initialization nibble to the LCD.
         # This particular function is only used during initialization.
         byte = ((nibble >> 4) & 0x0f) << SHIFT_DATA
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
+        self._write_one(byte | MASK_E)
+        self._write_one(byte)
         
+    def hal_batch_begin(self):
+        # Start queueing command/data bytes instead of writing them. The
+        # queue is sent as a single I2C transaction by hal_batch_end().
+        self._batch_depth += 1
+
+    def hal_batch_end(self):
+        # Send everything queued since the outermost hal_batch_begin().
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            self._flush_batch()
+            self.last_frame_wait_us = self.wait_us - self._frame_wait_start
+            self._frame_wait_start = self.wait_us
+            self.gc_policy.frame_done()
+
+    def _flush_batch(self):
+        # Write out any queued bytes in one transaction.
+        n = self._len
+        if n:
+            self._len = 0
+            view = self._views[n >> 2]
+            if view is None:
+                view = self._views[n >> 2] = self._mv[:n]
+            self.i2c.writeto(self.i2c_addr, view)
+
+    def _write_byte(self, flags, value):
+        # Write both nibbles of value, each latched on the falling edge of E.
+        hi = flags | (((value >> 4) & 0x0f) << SHIFT_DATA)
+        lo = flags | ((value & 0x0f) << SHIFT_DATA)
+        if self._batch_depth == 0:
+            buf = self._cmd
+            buf[0] = hi | MASK_E
+            buf[1] = hi
+            buf[2] = lo | MASK_E
+            buf[3] = lo
+            self.i2c.writeto(self.i2c_addr, buf)
+            return
+        buf = self._buf
+        n = self._len
+        buf[n] = hi | MASK_E
+        buf[n + 1] = hi
+        buf[n + 2] = lo | MASK_E
+        buf[n + 3] = lo
+        self._len = n + 4
+        if self._len >= BATCH_MAX:
+            self._flush_batch()
+
+    def _read_busy(self):
+        # Reads the busy flag: raise R/W with the data lines released, then
+        # clock out both nibbles. The flag is D7 of the high nibble.
+        base = MASK_RW | 0xf0 | (self.backlight << SHIFT_BACKLIGHT)
+        self._write_one(base)
+        self._write_one(base | MASK_E)
+        self.i2c.readfrom_into(self.i2c_addr, self._rd)
+        buf = self._rd_post
+        buf[0] = base
+        buf[1] = base | MASK_E
+        buf[2] = base
+        self.i2c.writeto(self.i2c_addr, buf)
+        return self._rd[0] & 0x80
+
+    def _poll_busy(self, timeout_us):
+        # Polls until the controller is ready. Returns False if it still
+        # reports busy after timeout_us.
+        t0 = utime.ticks_us()
+        while self._read_busy():
+            if utime.ticks_diff(utime.ticks_us(), t0) > timeout_us:
+                return False
+        return True
+
+    def _probe_busy_flag(self):
+        # The controller is idle after init, so a readable busy flag has to
+        # clear. Without R/W wired the data lines float high and never do.
+        try:
+            ok = self._poll_busy(10_000)
+        except (AttributeError, OSError):
+            ok = False
+        # A failed read is clocked in as a command, so re-address next time
+        self._addr = None
+        if not ok:
+            print("LCD busy flag not readable, using fixed delays")
+        return ok
+
+    def hal_wait_ready(self, usecs):
+        # Waits until the controller can take the next write, either by
+        # polling the busy flag or by sleeping the worst case usecs.
+        self._flush_batch()
+        t0 = utime.ticks_us()
+        if self.busy_flag:
+            if usecs >= BUSY_POLL_MIN_US and not self._poll_busy(2 * usecs):
+                print("LCD busy flag stuck, using fixed delays")
+                self.busy_flag = False
+                self._addr = None
+                self.hal_sleep_us(usecs)
+        else:
+            self.hal_sleep_us(usecs)
+        self.wait_us += utime.ticks_diff(utime.ticks_us(), t0)
+
+    def hal_sleep_us(self, usecs):
+        # Sleep for some time (given in microseconds)
+        if usecs >= 1000:
+            utime.sleep_ms((usecs + 999) // 1000)
+        else:
+            utime.sleep_us(usecs)
+
     def hal_backlight_on(self):
         # Allows the hal layer to turn the backlight on
-        self.i2c.writeto(self.i2c_addr, bytes([1 << SHIFT_BACKLIGHT]))
-        gc.collect()
+        self._flush_batch()
+        self._write_one(1 << SHIFT_BACKLIGHT)
         
     def hal_backlight_off(self):
         #Allows the hal layer to turn the backlight off
-        self.i2c.writeto(self.i2c_addr, bytes([0]))
-        gc.collect()
+        self._flush_batch()
+        self._write_one(0)
         
     def hal_write_command(self, cmd):
         # Write a command to the LCD. Data is latched on the falling edge of E.
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                (((cmd >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                ((cmd & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
+        self._write_byte(self.backlight << SHIFT_BACKLIGHT, cmd)
         if cmd <= 3:
             # The home and clear commands require a worst case delay of 4.1 msec
-            utime.sleep_ms(5)
-        gc.collect()
+            self.hal_wait_ready(5000)
 
     def hal_write_data(self, data):
         # Write data to the LCD. Data is latched on the falling edge of E.
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                (((data >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                ((data & 0x0f) << SHIFT_DATA))      
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
\ No newline at end of file
+        self._write_byte(MASK_RS | (self.backlight << SHIFT_BACKLIGHT), data)
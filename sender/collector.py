@@ -0,0 +1,189 @@
+"""
+Background collection of the values the sender puts on the display.
+
+Each source is a plain function sampled on its own thread every interval
+seconds, so a slow one (polling a router, say) only holds up itself. After
+every sample that changes a value the collector publishes a new Snapshot;
+readers, like the BLE loop, just take the latest one and never wait on a
+source.
+
+A source with a timeout is called on a daemon thread of its own; if it
+has not answered in time the snapshot keeps its last value, and it is not
+called again until that call returns. A call that never returns does not
+keep the process alive. A source with a max_interval is sampled less
+often while it keeps returning the same value: the wait doubles each time,
+up to max_interval, and drops back to interval on a change.
+
+    collector = Collector()
+    collector.add("cpu", psutil.cpu_percent, 2.5)
+    collector.add("load", lambda: os.getloadavg()[0], 1.0)
+    collector.start()
+    ...
+    cpu = collector.snapshot().get("cpu", 0)
+    ...
+    collector.stop()
+"""
+import threading
+import time
+from types import MappingProxyType
+
+
+class Snapshot:
+    """
+    The values of every source at one moment. values is read-only and a
+    Snapshot never changes once published; taken is its time.monotonic().
+    """
+    __slots__ = ("values", "taken")
+
+    def __init__(self, values, taken):
+        self.values = MappingProxyType(values)
+        self.taken = taken
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+
+class Source:
+    """
+    One sampled value and how it has been going: samples taken, errors
+    raised (the last good value is kept through an error), timeouts, late
+    (rounds skipped because a call that timed out had not returned yet),
+    the time the last sample took in ms and the seconds until the next.
+    """
+    def __init__(self, name, fn, interval, timeout=None, max_interval=None):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.timeout = timeout
+        self.max_interval = max_interval or interval
+        self.wait = interval
+        self.samples = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.late = 0
+        self.last_error = None
+        self.last_ms = 0.0
+        self.worst_ms = 0.0
+
+
+class _Call:
+    """
+    One call of fn on a daemon thread. done is set once it has returned,
+    with its value or the exception it raised in error.
+    """
+    def __init__(self, fn, name):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        threading.Thread(target=self._run, args=(fn,), name=name, daemon=True).start()
+
+    def _run(self, fn):
+        try:
+            self.value = fn()
+        except Exception as e:
+            self.error = e
+        self.done.set()
+
+
+class Collector:
+
+    def __init__(self):
+        self.sources = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._snapshot = Snapshot({}, time.monotonic())
+
+    def add(self, name, fn, interval, timeout=None, max_interval=None):
+        """Sample fn() every interval seconds as name, giving up on a call
+        after timeout seconds and backing off to max_interval while the
+        value does not change. Add sources before start()."""
+        self.sources[name] = Source(name, fn, interval, timeout, max_interval)
+
+    def start(self):
+        self._stop.clear()
+        for source in self.sources.values():
+            t = threading.Thread(target=self._run, args=(source,),
+                                 name=f"collector-{source.name}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=1.0):
+        """Ask the threads to finish and wait up to timeout seconds for
+        each; a source stuck in a call is left to die with the process."""
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def snapshot(self):
+        """The latest Snapshot. Never blocks on a source."""
+        return self._snapshot
+
+    def _publish(self, name, value):
+        with self._lock:
+            values = self._snapshot.values
+            if name in values and values[name] == value:
+                return False
+            values = dict(values)
+            values[name] = value
+            self._snapshot = Snapshot(values, time.monotonic())
+            return True
+
+    def _failed(self, source, e):
+        source.errors += 1
+        if source.last_error is None:
+            print(f"Collector: {source.name} failed:", e)
+        source.last_error = e
+
+    def _got(self, source, value):
+        source.samples += 1
+        if self._publish(source.name, value):
+            source.wait = source.interval
+        else:
+            source.wait = min(source.max_interval, source.wait * 2)
+
+    def _answered(self, source, call):
+        if call.error is not None:
+            self._failed(source, call.error)
+        else:
+            self._got(source, call.value)
+
+    def _run(self, source):
+        pending = None
+        while not self._stop.is_set():
+            t0 = time.monotonic()
+            if pending is not None and not pending.done.is_set():
+                # Still stuck in a call that timed out; keep the old value
+                source.late += 1
+            else:
+                if pending is not None:
+                    # It answered in the end: better late than never
+                    self._answered(source, pending)
+                    pending = None
+                if source.timeout is None:
+                    try:
+                        value = source.fn()
+                    except Exception as e:
+                        self._failed(source, e)
+                    else:
+                        self._got(source, value)
+                else:
+                    call = _Call(source.fn, f"collector-{source.name}-call")
+                    if call.done.wait(source.timeout):
+                        self._answered(source, call)
+                    else:
+                        source.timeouts += 1
+                        pending = call
+            took = time.monotonic() - t0
+            source.last_ms = took * 1000
+            source.worst_ms = max(source.worst_ms, source.last_ms)
+            # Sample on the interval, not interval after a slow sample ends
+            self._stop.wait(max(0.0, source.wait - took))
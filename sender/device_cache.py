@@ -0,0 +1,84 @@
+"""
+On-disk cache of the thingies the sender has connected to, so the next
+start can connect to the address straight away instead of scanning.
+
+Entries are kept by the name the sender was looking for, in
+~/.cache/ericbt/devices.json (or under $XDG_CACHE_HOME):
+
+    {"ericbt-04Ws": {"name": "ericbt-04Ws", "address": "AA:BB:...",
+                     "last_seen": 1760000000.0, "mtu": 247}}
+"""
+import json
+import os
+import time
+
+
+def default_path():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ericbt", "devices.json")
+
+
+class DeviceCache:
+
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        self.devices = {}
+        self.load()
+
+    def load(self):
+        """Read the cache; a missing or unreadable file is an empty one."""
+        try:
+            with open(self.path) as f:
+                devices = json.load(f)
+        except (OSError, ValueError):
+            devices = {}
+        self.devices = devices if isinstance(devices, dict) else {}
+
+    def save(self):
+        # Write a temporary file and swap it in, so a crash never leaves
+        # half a cache behind
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.devices, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def get(self, key):
+        """The entry for key, or None."""
+        entry = self.devices.get(key)
+        if not isinstance(entry, dict) or not entry.get("address"):
+            return None
+        return entry
+
+    def remember(self, key, address, name=None, mtu=None):
+        entry = {"name": name or key, "address": address, "last_seen": time.time()}
+        if mtu:
+            entry["mtu"] = mtu
+        self.devices[key] = entry
+        self._store()
+
+    def forget(self, key):
+        if self.devices.pop(key, None) is not None:
+            self._store()
+
+    def prune(self, max_age, now=None):
+        """Forget the entries last seen more than max_age seconds ago (or
+        with no usable last_seen). Returns their keys."""
+        now = time.time() if now is None else now
+        old = []
+        for key, entry in self.devices.items():
+            seen = entry.get("last_seen") if isinstance(entry, dict) else None
+            if not isinstance(seen, (int, float)) or now - seen > max_age:
+                old.append(key)
+        for key in old:
+            del self.devices[key]
+        if old:
+            self._store()
+        return old
+
+    def _store(self):
+        # A cache we cannot write only costs a scan next time
+        try:
+            self.save()
+        except OSError as e:
+            print("Could not save the device cache:", e)
@@ -1,41 +1,85 @@
 #!/usr/bin/env python3
 import asyncio
 from bleak import BleakClient, BleakScanner
-import json
 import sys
 import os
-import psutil
 from datetime import datetime
 import argparse
+import importlib
+import time
+
+# frame_proto.py lives with the firmware, one directory up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import frame_proto
+from collector import Collector
+from device_cache import DeviceCache
+from link import Link, Backoff
+from fanout import DeviceWorker, FanOut
+from push import Board, PushServer
+from pacing import Pacer
+import sources
 
 # --------------------------------------------------------------------
 # HARD-CODED PARAMETERS — EDIT THESE
 # --------------------------------------------------------------------
 DEVICE_NAME = "ericbt-04Ws"   # Your peripheral's advertised name
+# With --all, every device whose name starts with this gets the screen
+NAME_PREFIX = "ericbt-"
+# Seconds --all scans for devices at startup
+SCAN_SECONDS = 5.0
 # If you set this, scanning is skipped entirely:
 DEVICE_ADDRESS = None         # e.g. "AA:BB:CC:DD:EE:FF"
+# Otherwise the address found by the last scan is tried first (see
+# device_cache.py); it gets this many seconds before we scan again
+CACHED_CONNECT_TIMEOUT = 4.0
+# With --all, cached devices not seen for this many days are dropped
+# rather than tried forever
+CACHE_MAX_AGE_DAYS = 14
+# Seconds before the first attempt to reconnect after losing the device;
+# doubles (less some jitter) after every failed attempt, up to the limit
+RECONNECT_FIRST = 0.5
+RECONNECT_LIMIT = 30.0
 
-# Nordic UART Service UUIDs (must match your peripheral)
+# Nordic UART Service UUID (must match your peripheral; the RX and TX
+# characteristics are in fanout.py)
 NUS_SERVICE_UUID = "6E400001-B5A3-F393-E0A9-E50E24DCCA9E"
-RX_UUID = "6E400002-B5A3-F393-E0A9-E50E24DCCA9E"  # write
-TX_UUID = "6E400003-B5A3-F393-E0A9-E50E24DCCA9E"  # notify
-# --------------------------------------------------------------------
 
-async def send(client, payload: bytes, debug):
-    
-    if debug:
-        print(f"Sending {len(payload)} bytes:", repr(payload))
+# Unchanged screens are not sent; an empty keepalive frame goes out
+# instead once nothing has been sent for this many seconds (--keepalive)
+KEEPALIVE_SECONDS = 10.0
 
-    try:
-        # Write with response to keep ordering/flow control simple
-        await client.write_gatt_char(RX_UUID, payload, response=False)
-    except Exception as e:
-        print("Write failed:", e)
-        sys.exit(1)
+# With --profile auto: realtime while CPU use is at or above --alert-cpu,
+# idle once the load line has not changed for this many seconds, balanced
+# otherwise
+STEADY_SECONDS = 30
+
+# What the two rows show (--line0/--line1): format strings over the
+# sources in sources.py and any --plugin modules. Each source is sampled
+# at its own pace on the collector's threads, so the BLE loop never waits
+# for one
+LINE0 = "L1:{load:.2f} CPU:{cpu:2.0f}%"
+LINE1 = "UP:{uptime}"
 
-async def find_device_fast(name: str, service_uuid: str, timeout: float = 5.0):
+# Text pushed by other processes (--socket, --http; see push.py) shows
+# over the rows for this many seconds unless the update says otherwise.
+# A push wakes the render loop, but frames go out at most every
+# PUSH_MIN_SECONDS (the realtime profile's pace), so a burst makes one
+PUSH_TTL = 60.0
+PUSH_MIN_SECONDS = 0.1
+
+# With --pace adaptive, each device gets frames as fast as it acks them
+# without falling behind (see pacing.py), between these frames/s
+PACE_MIN_FPS = 1.0
+PACE_MAX_FPS = 50.0
+PACE_START_FPS = 10.0
+# --------------------------------------------------------------------
+
+async def find_device_fast(name: str, service_uuid: str, timeout: float = 5.0, strict=False,
+                           scan_lock=None):
     """
     Active scan + callback; stop as soon as we see a matching UUID or name.
+    With strict (several thingies about) only the name will do. The scan
+    holds scan_lock, if given, so scans take turns.
     Returns a Bleak device or None.
     """
     found = {"dev": None}
@@ -43,7 +87,7 @@ async def find_device_fast(name: str, service_uuid: str, timeout: float = 5.0):
     def on_adv(device, adv_data):
         # Prefer UUID match (fast, unambiguous)
         uuids = {u.lower() for u in (adv_data.service_uuids or [])}
-        if service_uuid.lower() in uuids:
+        if not strict and service_uuid.lower() in uuids:
             found["dev"] = device
             return
         # Fallback: match by local name if present
@@ -56,78 +100,290 @@ async def find_device_fast(name: str, service_uuid: str, timeout: float = 5.0):
         scanning_mode="active"          # Request scan response (faster metadata)
     )
 
-    await scanner.start()
-    try:
-        t0 = asyncio.get_running_loop().time()
-        while found["dev"] is None and (asyncio.get_running_loop().time() - t0) < timeout:
-            await asyncio.sleep(0.05)
-    finally:
-        await scanner.stop()
+    # Time to find the device is how long a reconnect takes to start; it
+    # depends on how often the device is advertising right now
+    async with scan_lock or asyncio.Lock():
+        t_scan = time.perf_counter()
+        await scanner.start()
+        try:
+            t0 = asyncio.get_running_loop().time()
+            while found["dev"] is None and (asyncio.get_running_loop().time() - t0) < timeout:
+                await asyncio.sleep(0.05)
+        finally:
+            await scanner.stop()
 
     if found["dev"]:
-        print(f"Found device: {found['dev'].name} [{found['dev'].address}]")
+        print(f"Found device: {found['dev'].name} [{found['dev'].address}] "
+              f"in {time.perf_counter() - t_scan:.2f} s")
     else:
         print("Device not found within timeout.")
     return found["dev"]
 
-def get_uptime():
+async def find_devices(prefix: str, service_uuid: str, timeout: float = SCAN_SECONDS,
+                       scan_lock=None):
+    """
+    Scan for timeout seconds and return {name: address} of every device
+    whose advertised name starts with prefix. The scan holds scan_lock,
+    if given.
+    """
+    found = {}
 
-    boot = datetime.fromtimestamp(psutil.boot_time())
-    delta = datetime.now() - boot
+    def on_adv(device, adv_data):
+        name = adv_data.local_name or device.name
+        if name and name.startswith(prefix) and name not in found:
+            print(f"Found device: {name} [{device.address}]")
+            found[name] = device.address
 
-    # Extract parts
-    days = delta.days
-    seconds = delta.seconds
+    scanner = BleakScanner(detection_callback=on_adv, service_uuids=[service_uuid],
+                           scanning_mode="active")
+    async with scan_lock or asyncio.Lock():
+        await scanner.start()
+        try:
+            await asyncio.sleep(timeout)
+        finally:
+            await scanner.stop()
+    return found
+
+def pick_profile(requested, cpu, alert_cpu, steady_for):
+    """
+    The profile to use now: the one asked for, or with "auto" realtime
+    during a CPU alert, idle once the stats are steady, balanced otherwise.
+    """
+    if requested != "auto":
+        return requested
+    if cpu >= alert_cpu:
+        return "realtime"
+    if steady_for >= STEADY_SECONDS:
+        return "idle"
+    return "balanced"
 
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    seconds = seconds % 60
+def print_latency(rtt):
+    """
+    Print the frame-to-ack times seen under each profile.
+    """
+    for name, (frames, total, worst) in rtt.stats.items():
+        print(f"{name or 'default'}: {frames} frames, "
+              f"mean {total / frames:.0f} ms, worst {worst:.0f} ms (send to ack)")
 
-    return f"{days} {hours:02d}:{minutes:02d}:{seconds:02d}"
+def print_counts(changes):
+    """
+    Print what happened to the rendered screens.
+    """
+    print(f"Frames: {changes.sent} sent, {changes.keepalives} keepalives, "
+          f"{changes.suppressed} unchanged not sent, {changes.coalesced} coalesced "
+          "while waiting for credit")
 
+async def connect_device(cache, name=DEVICE_NAME, rescan=False, disconnected_callback=None,
+                         strict=False, scan_lock=None):
+    """
+    Connect to the thingy called name: DEVICE_ADDRESS if set (for
+    DEVICE_NAME), else the address cached from the last run, else (or if
+    that fails) whatever an active scan finds. Returns a connected
+    BleakClient, or None if nothing was found. disconnected_callback(client)
+    is called if the connection drops. A scan holds scan_lock, if given.
+    """
+    address = DEVICE_ADDRESS if name == DEVICE_NAME else None
+    if not address and not rescan:
+        entry = cache.get(name)
+        if entry:
+            address = entry["address"]
+            print(f"Trying cached address {address} (last seen "
+                  f"{datetime.fromtimestamp(entry['last_seen']):%Y-%m-%d %H:%M})")
+    if address:
+        print(f"Connecting to {name}...")
+        t_connect = time.perf_counter()
+        client = BleakClient(address, timeout=CACHED_CONNECT_TIMEOUT,
+                             disconnected_callback=disconnected_callback)
+        try:
+            await client.connect()
+        except Exception as e:
+            print(f"Could not connect to {address}: {e}")
+        else:
+            print(f"Connected in {time.perf_counter() - t_connect:.2f} s")
+            return client
+        if address == DEVICE_ADDRESS:
+            return None
 
-async def main(backlight_off, debug):
-    # Fast path: use known MAC to avoid scanning entirely
-    if DEVICE_ADDRESS:
-        class _Stub:  # lightweight stub with .address
-            def __init__(self, address): self.address = address
-        device = _Stub(DEVICE_ADDRESS)
-    else:
-        device = await find_device_fast(DEVICE_NAME, NUS_SERVICE_UUID, timeout=5.0)
-        if not device:
-            return
+    device = await find_device_fast(name, NUS_SERVICE_UUID, timeout=5.0, strict=strict,
+                                    scan_lock=scan_lock)
+    if not device:
+        return None
 
     await asyncio.sleep(0.1)  # small settle delay
 
-    print("Connecting...")
-    async with BleakClient(device.address) as client:
-        if not client.is_connected:
-            print("Failed to connect.")
-            return
-        print("Connected!")
-        if backlight_off:
-            backlight= "off"
-        else:
-            backlight = "on"
+    print(f"Connecting to {name}...")
+    t_connect = time.perf_counter()
+    client = BleakClient(device, disconnected_callback=disconnected_callback)
+    await client.connect()
+    print(f"Connected in {time.perf_counter() - t_connect:.2f} s")
+    return client
 
-        data = {"LCD0": "", "LCD1": "", "BL": backlight}
+def start_collector(lines):
+    """
+    Start sampling, in the background, the sources the rows use (and the
+    CPU, which --profile auto goes by).
+    """
+    collector = Collector()
+    names = sources.fields(*lines)
+    if "cpu" not in names:
+        names.append("cpu")
+    sources.add_sources(collector, names)
+    collector.start()
+    return collector
 
-        tick = 0
-        cpu = 0
+def print_link(link):
+    """
+    Print how the connection held up.
+    """
+    print(f"Link: {link.reconnects} reconnects, {link.failures} failed attempts, "
+          f"down {link.downtime:.1f} s in all (longest {link.longest:.1f} s), "
+          f"{link.held} frames replaced while down")
 
+def print_worker(worker):
+    """
+    Print how one device got on.
+    """
+    print(f"{worker.name}: {worker.frames} frames, {worker.bytes} bytes, "
+          f"{worker.mailbox.replaced} screens replaced before it took them")
+    print_counts(worker.changes)
+    print_latency(worker.rtt)
+    print_pace(worker.pacer)
+    print_link(worker.link)
+
+def print_pace(pacer):
+    """
+    Print the frame rate adaptive pacing settled on.
+    """
+    if pacer is None:
+        return
+    print(f"Paced at {pacer.rate:.1f} frames/s, round trip {pacer.rtt_ms or 0:.0f} ms "
+          f"(quickest {pacer.base_ms or 0:.0f} ms), raised {pacer.raised} times, "
+          f"lowered {pacer.lowered}")
+
+def device_status(worker):
+    """
+    How one device is doing, for GET /status.
+    """
+    return {"name": worker.name, "up": worker.link.up, "frames": worker.frames,
+            "bytes": worker.bytes, "reconnects": worker.link.reconnects,
+            "rtt_ms": worker.rtt.last_ms and round(worker.rtt.last_ms),
+            "replaced": worker.mailbox.replaced,
+            "rate": worker.pacer and round(worker.pacer.rate, 1)}
+
+async def start_push(board, fanout, socket_path, http_port):
+    """
+    Start taking updates from other processes on the Unix socket (path,
+    or "" for the default one) and/or the loopback HTTP port asked for.
+    Returns the PushServer, or None if neither was.
+    """
+    if socket_path is None and http_port is None:
+        return None
+    server = PushServer(board, lambda: dict(board.status(),
+                                            devices=[device_status(w) for w in fanout.workers]))
+    if socket_path is not None:
+        await server.start_unix(socket_path or None)
+    if http_port is not None:
+        await server.start_http(http_port)
+    return server
+
+async def open_devices(cache, rescan, all_devices, scan_lock=None):
+    """
+    The device names to send to: DEVICE_NAME, or with all_devices every
+    NAME_PREFIX device one scan finds plus those cached from earlier runs
+    (they may just be off for now), unless not seen for CACHE_MAX_AGE_DAYS.
+    Scans again, backing off, until there is at least one.
+    """
+    if not all_devices:
+        return [DEVICE_NAME]
+    for name in cache.prune(CACHE_MAX_AGE_DAYS * 24 * 3600):
+        print(f"Forgetting {name}, not seen for {CACHE_MAX_AGE_DAYS} days")
+    backoff = Backoff(RECONNECT_FIRST, RECONNECT_LIMIT)
+    while True:
+        found = await find_devices(NAME_PREFIX, NUS_SERVICE_UUID, scan_lock=scan_lock)
+        for name, address in found.items():
+            # The workers connect straight to these
+            cache.remember(name, address)
+        names = set(found)
+        if not rescan:
+            names |= {n for n in cache.devices if n.startswith(NAME_PREFIX) and cache.get(n)}
+        if names:
+            return sorted(names)
+        delay = backoff.delay()
+        print(f"No thingies found, scanning again in {delay:.1f} s")
+        await asyncio.sleep(delay)
+
+async def main(backlight_off, debug, protocol, interval, profile, alert_cpu,
+               keepalive=KEEPALIVE_SECONDS, rescan=False, all_devices=False,
+               lines=(LINE0, LINE1), socket_path=None, http_port=None, pace="profile"):
+    # Sampling starts now so there are values by the time we connect
+    collector = start_collector(lines)
+
+    cache = DeviceCache()
+    # One scan at a time: workers reconnecting together would trip over
+    # each other's scans. Made here, in the running loop, as asyncio.Lock
+    # binds to the loop current at creation before Python 3.10.
+    scan_lock = asyncio.Lock()
+    names = await open_devices(cache, rescan, all_devices, scan_lock)
+
+    def remember(worker, session):
+        # Next time, connect straight to this address
+        cache.remember(worker.name, session.client.address, mtu=session.mtu)
+
+    def make_worker(name):
+        link = Link(lambda: connect_device(cache, name, rescan and not all_devices, link.lost,
+                                           strict=all_devices, scan_lock=scan_lock),
+                    Backoff(RECONNECT_FIRST, RECONNECT_LIMIT), name)
+        pacer = Pacer(PACE_MIN_FPS, PACE_MAX_FPS, PACE_START_FPS) if pace == "adaptive" else None
+        return DeviceWorker(name, link, protocol, backlight_off, keepalive, debug, remember, pacer)
+
+    # Each device gets every screen through its own queue, so a slow one
+    # cannot hold up the rest
+    fanout = FanOut(make_worker(name) for name in names)
+    print(f"Sending to {', '.join(names)}")
+
+    current = None
+    steady_since = time.monotonic()
+    last_load = None
+
+    board = Board(len(lines), ttl=PUSH_TTL)
+    server = await start_push(board, fanout, socket_path, http_port)
+
+    fanout.start()
+    try:
         while True:
-            
-            
-            tick += 1
-            if tick % 5 == 0:
-                cpu  = psutil.cpu_percent()
-                
-            data["LCD0"] = f"L1:{os.getloadavg()[0]:.2f} CPU:{cpu:2.0f}%    "[:16]
-            data["LCD1"] = f"UP:{get_uptime()}     "[:16]
-
-            payload = json.dumps(data).encode("utf-8")
-            await send(client, payload, debug)
-            await asyncio.sleep(0.5)
+            now = time.monotonic()
+            values = collector.snapshot()
+            cpu = values.get("cpu", 0)
+
+            rows = board.overlay([sources.render(line, values) for line in lines], now)
+
+            if rows[0] != last_load:
+                last_load = rows[0]
+                steady_since = now
+            name = pick_profile(profile, cpu, alert_cpu, now - steady_since)
+            if name != current:
+                current = name
+                p = frame_proto.PROFILES[name]
+                every = (f"every {interval or p[5]:g} s" if interval or pace != "adaptive"
+                         else "paced to each device")
+                print(f"Profile {name}: updates {every}, "
+                      f"meant for a {p[1] * 1.25:g}-{p[2] * 1.25:g} ms connection interval")
+            update_interval = interval or fanout.pace() or frame_proto.PROFILES[name][5]
+
+            # Rendered once, whatever the number of devices
+            fanout.publish(rows, name, update_interval)
+            board.published()
+            await board.wait(update_interval, PUSH_MIN_SECONDS)
+    finally:
+        if server is not None:
+            await server.close()
+            print(f"Pushed: {board.submissions} updates, {board.coalesced} coalesced, "
+                  f"{board.rejected} rejected")
+        collector.stop()
+        await fanout.close()
+        for worker in fanout.workers:
+            print_worker(worker)
+
 
 if __name__ == "__main__":
 
@@ -136,11 +392,53 @@ if __name__ == "__main__":
                         help="Turn on debug")
     parser.add_argument("--backlight-off", action='store_true',
                         help="Turn off Backlight by default")
+    parser.add_argument("--protocol", choices=("auto", "json", "binary"), default="auto",
+                        help="Frame format; auto uses binary if the device takes it")
+    parser.add_argument("--interval", type=float, default=None,
+                        help="Seconds between updates (default: the profile's)")
+    parser.add_argument("--profile", choices=("auto",) + tuple(frame_proto.PROFILES),
+                        default="auto",
+                        help="Connection profile; auto switches with the CPU load")
+    parser.add_argument("--alert-cpu", type=float, default=80,
+                        help="CPU %% at which auto switches to realtime (default 80)")
+    parser.add_argument("--all", action='store_true',
+                        help=f"Send to every {NAME_PREFIX}* device found, not just DEVICE_NAME")
+    parser.add_argument("--rescan", action='store_true',
+                        help="Scan for the device even if its address is cached")
+    parser.add_argument("--line0", default=LINE0,
+                        help="Top row, a format string over the sources (default %(default)r)")
+    parser.add_argument("--line1", default=LINE1,
+                        help="Bottom row (default %(default)r)")
+    parser.add_argument("--plugin", action="append", default=[], metavar="MODULE",
+                        help="Import MODULE for the sources it registers (repeatable)")
+    parser.add_argument("--socket", nargs="?", const="", default=None, metavar="PATH",
+                        help="Take screen updates on a Unix socket (default "
+                             "$XDG_RUNTIME_DIR/ericbt.sock)")
+    parser.add_argument("--http", type=int, default=None, metavar="PORT",
+                        help="Take screen updates over HTTP on 127.0.0.1:PORT")
+    parser.add_argument("--pace", choices=("profile", "adaptive"), default="profile",
+                        help="Frame rate: the profile's, or as fast as each device "
+                             "keeps up with")
+    parser.add_argument("--keepalive", type=float, default=KEEPALIVE_SECONDS,
+                        help="Seconds without a change before a keepalive is sent "
+                             f"(default {KEEPALIVE_SECONDS:g})")
 
     args = parser.parse_args()
+    for module in args.plugin:
+        importlib.import_module(module)
+    lines = (args.line0, args.line1)
+    try:
+        missing = [n for n in sources.fields(*lines) if n not in sources.REGISTRY]
+    except ValueError as e:
+        parser.error(f"bad row format: {e}")
+    if missing:
+        parser.error(f"no source called {', '.join(missing)}; "
+                     f"have {', '.join(sorted(sources.REGISTRY))}")
 
     try:
-        asyncio.run(main(args.backlight_off, args.debug))
+        asyncio.run(main(args.backlight_off, args.debug, args.protocol, args.interval,
+                         args.profile, args.alert_cpu, args.keepalive, args.rescan, args.all,
+                         lines, args.socket, args.http, args.pace))
     except KeyboardInterrupt:
         print("\nInterrupted by user.")
         sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,383 @@
+"""
+Sending one rendered screen to any number of thingies at once.
+
+The render loop calls FanOut.publish() once per update; each device has
+a DeviceWorker with its own Mailbox, Link and Session, so a slow or lost
+device only falls behind itself: its mailbox keeps just the latest
+screen and the others carry on.
+
+Also the per-connection pieces used by every worker: send(), negotiate(),
+on_notify(), wait_credit() and start_session(). Nothing here imports
+bleak; a client is anything with BleakClient's write_gatt_char(),
+read_gatt_char(), start_notify(), disconnect(), address and mtu_size.
+"""
+import asyncio
+import json
+import time
+
+import frame_proto
+import frame_state
+
+# Nordic UART Service characteristics (must match your peripheral)
+RX_UUID = "6E400002-B5A3-F393-E0A9-E50E24DCCA9E"  # write
+TX_UUID = "6E400003-B5A3-F393-E0A9-E50E24DCCA9E"  # notify
+
+# Seconds to wait for credits before sending anyway
+ACK_TIMEOUT = 3.0
+
+
+async def send(client, payload: bytes, debug, write_size=None, msg_id=0):
+    """
+    Write payload to the RX characteristic. With write_size (the ATT MTU
+    less 3, for firmware that reassembles chunks) a longer payload is split
+    into chunks; without, it goes in one write as before. Raises if a
+    write fails.
+    """
+    if debug:
+        print(f"Sending {len(payload)} bytes:", repr(payload))
+
+    writes = [payload] if write_size is None else frame_proto.split(payload, msg_id, write_size)
+    try:
+        for data in writes:
+            await client.write_gatt_char(RX_UUID, data, response=False)
+    except Exception as e:
+        print("Write failed:", e)
+        raise
+
+async def negotiate(client, protocol):
+    """
+    Pick the frame format: read the device's HELLO (the TX characteristic's
+    value) and use binary frames if it takes them and protocol allows it.
+    Returns ("json" or "binary", device capabilities, starting credits).
+    """
+    try:
+        hello = await client.read_gatt_char(TX_UUID)
+    except Exception as e:
+        print("Could not read device capabilities:", e)
+        hello = None
+    caps, max_frame, credits = frame_proto.parse_hello(hello)
+    if max_frame:
+        print(f"Device takes frames of up to {max_frame} bytes")
+    if protocol == "json":
+        return "json", caps, credits
+    if caps & frame_proto.CAP_BINARY:
+        print("Device takes binary frames")
+        return "binary", caps, credits
+    if protocol == "binary":
+        print("Device does not take binary frames, falling back to JSON")
+    return "json", caps, credits
+
+def on_notify(encoder, window, acked, rtt, debug, pacer=None):
+    """
+    Handler for the TX characteristic: a FT_RESYNC from the device means a
+    patch went missing, so the next frame is sent in full; a FT_ACK brings
+    fresh credits and times the frames it covers (for the pacer, if any);
+    a FT_PROFILE reports the connection parameters in use.
+    """
+    def handler(_, data):
+        if not frame_proto.is_binary(data):
+            return
+        if data[1] == frame_proto.FT_RESYNC:
+            if debug:
+                print("Resync requested at seq", frame_proto.frame_seq(data))
+            encoder.resync()
+        elif data[1] == frame_proto.FT_ACK:
+            now_ms = time.monotonic() * 1000
+            rtt_ms = rtt.acked(frame_proto.frame_seq(data), now_ms)
+            ack = frame_proto.parse_ack(data)
+            if pacer is not None and rtt_ms is not None and ack is not None:
+                pacer.acked(ack[0], rtt_ms, ack[2], now_ms)
+            if window is not None and window.on_ack(data):
+                if debug:
+                    print(f"Ack {window.acked}, send up to {window.limit}, "
+                          f"{window.queued} queued, {rtt.last_ms:.0f} ms")
+                acked.set()
+        elif data[1] == frame_proto.FT_PROFILE:
+            report = frame_proto.parse_profile_report(data)
+            if report:
+                profile_id, interval, latency, timeout = report
+                print(f"Profile {frame_proto.profile_name(profile_id)}: connection interval "
+                      f"{interval * 1.25:g} ms, latency {latency}, timeout {timeout * 10} ms"
+                      if interval else
+                      f"Profile {frame_proto.profile_name(profile_id)}: connection "
+                      "parameters not reported yet")
+    return handler
+
+async def wait_credit(window, acked, seq, timeout):
+    """
+    Wait up to timeout seconds for the device to grant credit for frame
+    seq. Returns True once it has.
+    """
+    if window is None or window.can_send(seq):
+        return True
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not window.can_send(seq):
+        acked.clear()
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return False
+        try:
+            await asyncio.wait_for(acked.wait(), remaining)
+        except asyncio.TimeoutError:
+            pass
+    return True
+
+class Session:
+    """
+    What was agreed with the device on one connection: frame format,
+    capabilities, MTU, write size and the credit window.
+    """
+    def __init__(self, client, protocol, caps, mtu, write_size, window):
+        self.client = client
+        self.protocol = protocol
+        self.caps = caps
+        self.mtu = mtu
+        self.write_size = write_size
+        self.window = window
+        self.acked = asyncio.Event()
+        self.json_seq = 0
+
+async def start_session(client, protocol, encoder, rtt, debug, pacer=None):
+    """
+    Set up a fresh connection: read the device's capabilities and
+    subscribe to its notifies.
+    """
+    mtu = getattr(client, "mtu_size", None)
+    protocol, caps, credits = await negotiate(client, protocol)
+    # Split frames to fit the MTU if the device can put them together
+    write_size = None
+    if caps & frame_proto.CAP_CHUNKS:
+        write_size = (mtu or 23) - 3
+        print(f"MTU {write_size + 3}, writes of up to {write_size} bytes")
+    # Only send as many frames as the device has room for; its acks
+    # count from the seq we carry on with
+    window = None
+    if caps & frame_proto.CAP_CREDITS:
+        window = frame_state.CreditWindow(credits, encoder.seq if protocol == "binary" else 0)
+        print(f"Flow control on, {credits} credits")
+    session = Session(client, protocol, caps, mtu, write_size, window)
+    if protocol == "binary" or window is not None:
+        await client.start_notify(TX_UUID, on_notify(encoder, window, session.acked, rtt, debug,
+                                                     pacer))
+    return session
+
+
+class Mailbox:
+    """
+    A queue of one: put() replaces whatever has not been taken yet
+    (counted in replaced), get() waits for the next item.
+    """
+    def __init__(self):
+        self._item = None
+        self._ready = asyncio.Event()
+        self.replaced = 0
+
+    def put(self, item):
+        if self._item is not None:
+            self.replaced += 1
+        self._item = item
+        self._ready.set()
+
+    def take(self):
+        """The item waiting, or None; does not wait."""
+        item, self._item = self._item, None
+        self._ready.clear()
+        return item
+
+    async def get(self, timeout=None):
+        """The next item, or None if none comes within timeout seconds."""
+        if self._item is None:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.take()
+
+
+class DeviceWorker:
+    """
+    Sends the screens published to its mailbox to one device: only the
+    changed ones plus keepalives, within the device's credits, with a
+    full frame of the latest screen after every (re)connect. Items are
+    (rows, profile name, seconds between updates). With a pacer (see
+    pacing.py) frames go no faster than it allows, newer screens replacing
+    the one waiting. frames and bytes count what was written.
+    """
+    def __init__(self, name, link, protocol="auto", backlight_off=False,
+                 keepalive=10.0, debug=False, on_connect=None, pacer=None):
+        self.name = name
+        self.link = link
+        self.protocol = protocol
+        self.backlight_off = backlight_off
+        self.debug = debug
+        # on_connect(worker, session), e.g. to cache the address
+        self.on_connect = on_connect
+        self.mailbox = Mailbox()
+        # The encoder (and its seq) carries on across reconnects
+        self.encoder = frame_state.DeltaEncoder()
+        self.rtt = frame_state.RttTracker()
+        self.changes = frame_state.ChangeFilter(keepalive)
+        self.pacer = pacer
+        self.session = None
+        self.frames = 0
+        self.bytes = 0
+        self._msg_id = 0
+        self._ready_at = 0.0
+
+    async def run(self):
+        rows = profile = current = stalled_since = None
+        interval = 1.0
+        while True:
+            if self.session is not None and not self.link.up:
+                # bleak told us the device went away
+                self.session = None
+            replay = False
+            if self.session is None:
+                # Keep the latest screen and wait (the first time, for as
+                # long as it takes) for the link to come back
+                item = self.mailbox.take()
+                if item is not None:
+                    rows, profile, interval = item
+                    self.link.hold(0, rows)
+                client = await self.link.wait(interval if self.link.connects else None)
+                if client is None:
+                    continue
+                try:
+                    self.session = await start_session(client, self.protocol, self.encoder,
+                                                       self.rtt, self.debug, self.pacer)
+                except Exception as e:
+                    self.link.lost(client, e)
+                    continue
+                if self.on_connect is not None:
+                    self.on_connect(self, self.session)
+                # Replay the whole screen: a full frame of the latest rows
+                rows = self.link.take().get(0, rows)
+                self.encoder.resync()
+                self.rtt.reset()
+                if self.pacer is not None:
+                    self.pacer.reset()
+                current = stalled_since = None
+                replay = True
+            else:
+                delay = self._ready_at - time.monotonic()
+                if delay > 0:
+                    # Not yet: the pacer says the device would fall behind
+                    await asyncio.sleep(delay)
+                item = await self.mailbox.get(interval)
+                if item is not None:
+                    rows, profile, interval = item
+            if rows is None:
+                # Nothing rendered yet
+                if replay:
+                    rows, profile, interval = await self._first()
+                else:
+                    continue
+            try:
+                stalled_since = await self._step(rows, profile, interval, replay, current,
+                                                 stalled_since)
+                current = profile
+            except Exception as e:
+                # The screen goes out again in full once we are back
+                self._lagging()
+                self.link.lost(self.session.client, e)
+                self.session = None
+
+    async def _first(self):
+        item = None
+        while item is None:
+            item = await self.mailbox.get()
+        return item
+
+    async def _step(self, rows, profile, interval, replay, current, stalled_since):
+        session = self.session
+        now = time.monotonic()
+        if profile != current and session.caps & frame_proto.CAP_PROFILES:
+            # Only firmware with CAP_PROFILES takes it
+            await send(session.client, frame_proto.encode_profile(frame_proto.PROFILES[profile][0]),
+                       self.debug)
+
+        if replay or (session.protocol == "binary" and self.encoder.shown is None):
+            # First frame, or the device asked for everything again
+            kind = frame_state.SEND
+        else:
+            kind = self.changes.check(rows, now)
+        if kind == frame_state.SKIP:
+            return stalled_since
+
+        # Rather than send more than the device can queue, wait (for the
+        # next update at most) for credit. The device re-acks every
+        # second, so if none comes for ACK_TIMEOUT the link is in trouble:
+        # send anyway.
+        encoder = self.encoder
+        seq = encoder.seq if session.protocol == "binary" else session.json_seq
+        if not await wait_credit(session.window, session.acked, (seq + 1) & 0xffff, interval):
+            self._lagging()
+            if stalled_since is None:
+                stalled_since = now
+            if now - stalled_since < ACK_TIMEOUT:
+                if kind == frame_state.SEND:
+                    self.changes.hold(rows)
+                return stalled_since
+            print(f"{self.name}: no credit from the device, sending anyway")
+
+        if session.protocol == "binary":
+            # Unchanged rows encode as an empty patch
+            payload = encoder.encode(rows, backlight=None if kind == frame_state.KEEPALIVE
+                                     else not self.backlight_off)
+            seq = encoder.seq
+        else:
+            # JSON frames carry their seq for the device to ack
+            session.json_seq = (session.json_seq + 1) & 0xffff
+            seq = session.json_seq
+            if kind == frame_state.SEND:
+                payload = json.dumps({"LCD0": rows[0], "LCD1": rows[1],
+                                      "BL": "off" if self.backlight_off else "on",
+                                      "seq": seq}).encode("utf-8")
+            else:
+                payload = json.dumps({"seq": seq}).encode("utf-8")
+        self._msg_id = (self._msg_id + 1) & 0xff
+        self.rtt.sent(seq, time.monotonic() * 1000, profile)
+        await send(session.client, payload, self.debug, session.write_size, self._msg_id)
+        self.changes.done(rows, now, kind)
+        self.frames += 1
+        self.bytes += len(payload)
+        if self.pacer is not None:
+            self._ready_at = now + self.pacer.interval
+        return None
+
+    def _lagging(self):
+        if self.pacer is not None and self.pacer.lagging(time.monotonic() * 1000) and self.debug:
+            print(f"{self.name}: falling behind, down to {self.pacer.rate:.1f} frames/s")
+
+
+class FanOut:
+    """
+    Runs a DeviceWorker per device and hands each published screen to all
+    of them.
+    """
+    def __init__(self, workers=()):
+        self.workers = list(workers)
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.ensure_future(w.run()) for w in self.workers]
+
+    def publish(self, rows, profile, interval):
+        item = (list(rows), profile, interval)
+        for w in self.workers:
+            w.mailbox.put(item)
+
+    def pace(self):
+        """Seconds between frames for the fastest paced device, or None if
+        none are paced."""
+        paced = [w.pacer.interval for w in self.workers if w.pacer is not None]
+        return min(paced) if paced else None
+
+    async def close(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for w in self.workers:
+            await w.link.close()
@@ -0,0 +1,150 @@
+"""
+The sender's state for each device it sends frame_proto frames to: what
+the device is showing (DeltaEncoder), which renders go out
+(ChangeFilter), how much it can queue (CreditWindow) and how long its
+acks take (RttTracker). The device never needs any of it, so it lives
+here rather than in frame_proto.py, which the firmware loads too.
+"""
+from frame_proto import encode_rows, encode_patch, parse_ack
+
+
+class DeltaEncoder:
+    """Sender side of FT_PATCH: remembers the rows the device should be
+    showing and encodes each update as a patch against them. The first
+    frame, and the first after resync(), is a full FT_ROWS frame."""
+
+    def __init__(self, display_id=0):
+        self.display_id = display_id
+        self.shown = None
+        self.seq = 0
+
+    def resync(self):
+        self.shown = None
+
+    def encode(self, rows, backlight=None):
+        self.seq = (self.seq + 1) & 0xffff
+        if self.shown is None:
+            frame = encode_rows(rows, self.display_id, backlight, self.seq)
+        else:
+            frame = encode_patch(self.shown, rows, self.display_id, backlight, self.seq)
+        self.shown = list(rows)
+        return frame
+
+
+# ChangeFilter.check() results
+SKIP = 0
+SEND = 1
+KEEPALIVE = 2
+
+
+class ChangeFilter:
+    """Sender side: decides which renders of the screen go out. A render
+    that differs from the last one sent is sent; an unchanged one is
+    skipped (suppressed) unless nothing has gone out for `keepalive`
+    seconds, when an empty keepalive frame is due instead. hold() records
+    a changed render that has to wait for credit; if a newer one replaces
+    it before it goes out, the two are coalesced into one frame. Counts
+    are kept in sent, keepalives, suppressed and coalesced."""
+
+    def __init__(self, keepalive):
+        self.keepalive = keepalive
+        self.last = None
+        self._sent_at = None
+        self._held = None
+        self.sent = 0
+        self.keepalives = 0
+        self.suppressed = 0
+        self.coalesced = 0
+
+    def check(self, rows, now):
+        """SEND, KEEPALIVE or SKIP for rows rendered at now (seconds)."""
+        if rows != self.last:
+            return SEND
+        if self._held is not None:
+            # Changed and changed back before it could be sent
+            self.coalesced += 1
+            self._held = None
+        if self._sent_at is None or now - self._sent_at >= self.keepalive:
+            return KEEPALIVE
+        self.suppressed += 1
+        return SKIP
+
+    def hold(self, rows):
+        if self._held is not None and rows != self._held:
+            self.coalesced += 1
+        self._held = list(rows)
+
+    def done(self, rows, now, kind):
+        """rows went out at now as kind (SEND or KEEPALIVE)."""
+        if kind == SEND:
+            self.sent += 1
+            self.last = list(rows)
+        else:
+            self.keepalives += 1
+        self._held = None
+        self._sent_at = now
+
+
+class CreditWindow:
+    """Sender side of FT_ACK flow control: can_send(seq) says whether frame
+    seq is within what the device last granted. Starts with the HELLO's
+    credits counted from seq."""
+
+    def __init__(self, credits, seq=0):
+        self.limit = (seq + credits) & 0xffff
+        self.acked = seq
+        self.queued = 0
+        self.acks = 0
+
+    def on_ack(self, buf):
+        ack = parse_ack(buf)
+        if ack is None:
+            return False
+        self.acked, credits, self.queued = ack
+        self.limit = (self.acked + credits) & 0xffff
+        self.acks += 1
+        return True
+
+    def can_send(self, seq):
+        return ((self.limit - seq) & 0xffff) < 0x8000
+
+
+class RttTracker:
+    """Times frames from being sent to the ack that covers them, grouped
+    by a label (e.g. the profile in use). Times are in ms from any clock.
+    stats[label] is [frames, total ms, worst ms]."""
+
+    def __init__(self):
+        self._sent = {}
+        self.stats = {}
+        self.last_ms = None
+
+    def sent(self, seq, now_ms, label=None):
+        if len(self._sent) >= 256:
+            # Never acked (e.g. the link went away); forget the oldest
+            self._sent.pop(next(iter(self._sent)))
+        self._sent[seq] = (now_ms, label)
+
+    def acked(self, seq, now_ms):
+        """Returns the time taken by the newest frame the ack covers, or
+        None if it covers none not already acked."""
+        rtt = None
+        for s in list(self._sent):
+            if ((seq - s) & 0xffff) < 0x8000:
+                t, label = self._sent.pop(s)
+                rtt = now_ms - t
+                st = self.stats.setdefault(label, [0, 0, 0])
+                st[0] += 1
+                st[1] += rtt
+                if rtt > st[2]:
+                    st[2] = rtt
+                self.last_ms = rtt
+        return rtt
+
+    def reset(self):
+        """Forget the frames still waiting for an ack (the link went)."""
+        self._sent = {}
+
+    def mean(self, label):
+        st = self.stats.get(label)
+        return st[1] / st[0] if st else None
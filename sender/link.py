@@ -0,0 +1,158 @@
+"""
+Keeps the sender connected: notices when the link goes (bleak's
+disconnected callback, or a failed write), reconnects in the background
+with jittered exponential backoff, and holds the latest frame for each
+display while it is down so the screen can be replayed once it is back.
+
+    link = Link(lambda: connect_device(cache, name, rescan, link.lost))
+    client = await link.wait(timeout)    # None while still down
+    ...
+    link.lost(client)                    # e.g. after a failed write
+    link.hold(display_id, rows)          # while down
+    for display_id, rows in link.take().items(): ...   # once back
+
+Nothing here imports bleak; connect is any coroutine function returning a
+connected client with an async disconnect(), or None.
+"""
+import asyncio
+import random
+import time
+
+
+class Backoff:
+    """
+    Delays between reconnect attempts: first, then doubling up to limit.
+    Each is shortened by a random part of up to jitter (0-1) of itself, so
+    several senders that lost the same device do not all retry in step.
+    """
+    def __init__(self, first=0.5, limit=30.0, jitter=0.5, rng=None):
+        self.first = first
+        self.limit = limit
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+        self.reset()
+
+    def reset(self):
+        self._next = self.first
+
+    def delay(self):
+        d = self._next
+        self._next = min(self.limit, self._next * 2)
+        return d * (1 - self.jitter * self.rng.random())
+
+
+class Link:
+    """
+    One connection to a device (name is only for messages) and how it has
+    held up: reconnects made, failures (attempts that did not connect),
+    downtime and longest outage in seconds, and held (frames replaced by a
+    newer one while down).
+    """
+    def __init__(self, connect, backoff=None, name=""):
+        self.connect = connect
+        self.name = name
+        self.backoff = backoff or Backoff()
+        self.client = None
+        self.connects = 0
+        self.reconnects = 0
+        self.failures = 0
+        self.downtime = 0.0
+        self.longest = 0.0
+        self.held = 0
+        self._latest = {}
+        self._up = asyncio.Event()
+        self._task = None
+        self._down_since = None
+        self._closing = False
+
+    @property
+    def up(self):
+        return self.client is not None
+
+    def lost(self, client=None, reason=None):
+        """
+        The link went away. Safe to call more than once, and from bleak's
+        disconnected callback: a client other than the current one (e.g.
+        an attempt that failed) is ignored.
+        """
+        if self.client is None or (client is not None and client is not self.client):
+            return
+        print(f"{self.name or 'Link'} lost" + (f": {reason}" if reason else ""))
+        old = self.client
+        self.client = None
+        self._up.clear()
+        self._down_since = time.monotonic()
+        if not self._closing:
+            # Make sure the stack lets go of it before we try again
+            asyncio.ensure_future(self._drop(old))
+            self._start()
+
+    async def wait(self, timeout=None):
+        """
+        The connected client, starting a (re)connect if there is none.
+        Returns None if still down after timeout seconds.
+        """
+        if self.client is None:
+            self._start()
+            try:
+                await asyncio.wait_for(self._up.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.client
+
+    def hold(self, display_id, rows):
+        """Keep rows as the latest frame for display_id while down."""
+        if display_id in self._latest:
+            self.held += 1
+        self._latest[display_id] = list(rows)
+
+    def take(self):
+        """The frames held while down, by display id; clears them."""
+        latest, self._latest = self._latest, {}
+        return latest
+
+    async def close(self):
+        self._closing = True
+        if self._task is not None:
+            self._task.cancel()
+        if self.client is not None:
+            await self._drop(self.client)
+            self.client = None
+
+    def _start(self):
+        if self._closing or (self._task is not None and not self._task.done()):
+            return
+        if self._down_since is None:
+            self._down_since = time.monotonic()
+        self._task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        self.backoff.reset()
+        while True:
+            try:
+                client = await self.connect()
+            except Exception as e:
+                print(f"{self.name or 'Link'}: connect failed:", e)
+                client = None
+            if client is not None:
+                break
+            self.failures += 1
+            delay = self.backoff.delay()
+            print(f"{self.name or 'Link'}: retrying in {delay:.1f} s")
+            await asyncio.sleep(delay)
+        down = time.monotonic() - self._down_since
+        self._down_since = None
+        self.connects += 1
+        if self.connects > 1:
+            self.reconnects += 1
+            self.downtime += down
+            self.longest = max(self.longest, down)
+            print(f"{self.name or 'Link'}: reconnected after {down:.1f} s")
+        self.client = client
+        self._up.set()
+
+    async def _drop(self, client):
+        try:
+            await client.disconnect()
+        except Exception:
+            pass
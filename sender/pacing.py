@@ -0,0 +1,94 @@
+"""
+Adaptive pacing: how many frames a second to send one device, found from
+how quickly it acks them (see frame_state.RttTracker).
+
+A frame's round trip covers the write, the device drawing it on the LCD
+and the ack coming back, so it grows as soon as either the link or the
+device's render path starts to fall behind. The device also draws only
+the latest of the frames waiting for it, so an ack that covers more than
+one frame, or reports frames still queued behind it, means we are sending
+faster than it draws. While acks come back about as fast as the quickest
+of the last few and show none of that, the Pacer raises the rate, doubling
+it every double_s; otherwise, or when credit runs out or a write fails, it
+cuts the rate by a factor. Acks for frames sent before a cut say nothing
+new, so they do not cut it again.
+
+    pacer = Pacer()
+    rtt_ms = rtt.acked(seq, now_ms)
+    if rtt_ms is not None:
+        pacer.acked(seq, rtt_ms, queued, now_ms)
+    ...
+    await asyncio.sleep(pacer.interval)    # between frames
+
+Nothing here imports bleak or asyncio.
+"""
+
+
+class Pacer:
+    """
+    The frame rate for one device, between low and high frames/s. rate is
+    the one chosen, rtt_ms the smoothed round trip and base_ms the
+    quickest of the last history; raised and lowered count the changes.
+    """
+    def __init__(self, low=1.0, high=50.0, start=10.0, double_s=0.5, backoff=0.7, rise=1.5,
+                 slack_ms=10.0, history=8):
+        self.low = low
+        self.high = high
+        self.double_s = double_s
+        self.backoff = backoff
+        # An ack lags if it took more than rise * base_ms + slack_ms
+        self.rise = rise
+        self.slack_ms = slack_ms
+        self.history = history
+        self.rate = min(high, max(low, start))
+        self.raised = 0
+        self.lowered = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the round trips seen (e.g. on a new connection, whose
+        parameters may differ); the rate carries on."""
+        self.rtt_ms = None
+        self.base_ms = None
+        self._recent = []
+        self._seq = None
+        self._last_ms = None
+        self._cut_ms = None
+
+    @property
+    def interval(self):
+        """Seconds between frames at the current rate."""
+        return 1.0 / self.rate
+
+    def acked(self, seq, rtt_ms, queued, now_ms):
+        """An ack for frame seq, sent rtt_ms ago, came back with queued
+        frames still waiting on the device."""
+        covered = 1 if self._seq is None else (seq - self._seq) & 0xffff
+        # Grow for the time since the last ack, but no more than half a
+        # doubling after a quiet spell
+        since_s = 0.0 if self._last_ms is None else (now_ms - self._last_ms) / 1000
+        self._seq = seq
+        self._last_ms = now_ms
+        self._recent.append(rtt_ms)
+        if len(self._recent) > self.history:
+            self._recent.pop(0)
+        self.base_ms = min(self._recent)
+        self.rtt_ms = rtt_ms if self.rtt_ms is None else self.rtt_ms + (rtt_ms - self.rtt_ms) / 8
+        if covered > 1 or queued or rtt_ms > self.base_ms * self.rise + self.slack_ms:
+            if self._cut_ms is None or now_ms - rtt_ms > self._cut_ms:
+                self.lagging(now_ms)
+        elif self.rate < self.high:
+            grow = 2 ** (min(since_s, self.double_s / 2) / self.double_s)
+            self.rate = min(self.high, self.rate * grow)
+            self.raised += 1
+
+    def lagging(self, now_ms):
+        """The device is falling behind: acks late, no credit or a write
+        failed. Returns True if the rate was cut."""
+        if self.rate <= self.low or (self._cut_ms is not None and
+                                     now_ms - self._cut_ms < (self.rtt_ms or 0)):
+            return False
+        self._cut_ms = now_ms
+        self.rate = max(self.low, self.rate * self.backoff)
+        self.lowered += 1
+        return True
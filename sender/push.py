@@ -0,0 +1,329 @@
+"""
+Lets other processes (cron jobs, alerting, CI) put text on the display
+through the one running sender, instead of each connecting on its own.
+
+An update is a JSON object with the rows to show, like the firmware's
+JSON frames, and optionally how many seconds to show them for (ttl, 0
+for until replaced) before the row goes back to its --line0/--line1
+template. A row set to null goes back straight away; {"clear": true}
+clears them all:
+
+    {"LCD0": "Backup done", "ttl": 300}
+    {"LCD1": "build #512 FAILED", "ttl": 0}
+
+Send them one per line to the Unix socket, which answers each with a
+line of JSON, or POST one to /screen on the loopback HTTP port as
+application/json (which a web page cannot send there without the
+browser asking first); GET /status reports what is shown and how the
+links are doing. HTTP requests must name 127.0.0.1 or localhost as
+their Host:
+
+    echo '{"LCD0": "Backup done"}' | nc -U $XDG_RUNTIME_DIR/ericbt.sock
+    curl -H 'Content-Type: application/json' -d '{"LCD0": "Backup done"}' \
+        http://127.0.0.1:8716/screen
+
+Updates only change the Board; the render loop picks up the latest text
+for each row, so a burst of them goes out as one frame. Nothing here
+imports bleak.
+"""
+import asyncio
+import errno
+import json
+import math
+import os
+import socket
+import stat
+import time
+
+# Longest update, or line on the Unix socket, taken
+MAX_REQUEST = 4096
+
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large", 415: "Unsupported Media Type"}
+
+# Host headers taken over HTTP. A web page that had its own name pointed
+# at 127.0.0.1 (DNS rebinding) still sends that name, so it is refused.
+_LOCAL_HOSTS = ("127.0.0.1", "localhost", "[::1]")
+
+
+def default_socket_path():
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if base:
+        return os.path.join(base, "ericbt.sock")
+    return f"/tmp/ericbt-{os.getuid()}.sock"
+
+
+def remove_stale_socket(path):
+    """
+    Remove the socket a sender that did not exit cleanly left at path.
+    Raises OSError, leaving it alone, if path is not a socket or a sender
+    is still listening on it.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, "exists and is not a socket", path)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        # Nobody listening
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, "another sender is listening on it", path)
+
+
+def _host_name(host):
+    # "127.0.0.1:8716" -> "127.0.0.1", "[::1]:8716" -> "[::1]"
+    if host.startswith("["):
+        return host[:host.find("]") + 1]
+    return host.partition(":")[0]
+
+
+class Board:
+    """
+    The latest pushed text for each row, shown over the templates until
+    its ttl runs out. Counts submissions, coalesced (rows replaced before
+    the render loop sent them) and rejected (updates that made no sense).
+    """
+    def __init__(self, rows=2, width=16, ttl=60.0):
+        self.width = width
+        self.ttl = ttl
+        # Per row: (text, time it expires or None), or None
+        self.rows = [None] * rows
+        self.submissions = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self._unsent = set()
+        self._changed = asyncio.Event()
+
+    def submit(self, update, now=None):
+        """
+        Apply one update (a dict, see above). Returns the row numbers it
+        set; raises ValueError, leaving the board as it was, if it is not
+        a valid update.
+        """
+        now = time.monotonic() if now is None else now
+        try:
+            changes = self._parse(update, now)
+        except ValueError:
+            self.rejected += 1
+            raise
+        self.submissions += 1
+        for row, entry in changes.items():
+            if row in self._unsent:
+                self.coalesced += 1
+            self._unsent.add(row)
+            self.rows[row] = entry
+        self._changed.set()
+        return sorted(changes)
+
+    def _parse(self, update, now):
+        if not isinstance(update, dict):
+            raise ValueError("expected a JSON object")
+        ttl = update.get("ttl", self.ttl)
+        if (isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl < 0
+                or not math.isfinite(ttl)):
+            raise ValueError("ttl must be a number of seconds, 0 for no limit")
+        expires = now + ttl if ttl else None
+        changes = {}
+        if update.get("clear"):
+            changes = {row: None for row in range(len(self.rows))}
+        for row in range(len(self.rows)):
+            key = f"LCD{row}"
+            if key not in update:
+                continue
+            text = update[key]
+            if text is None:
+                changes[row] = None
+            elif isinstance(text, str):
+                changes[row] = (text.ljust(self.width)[:self.width], expires)
+            else:
+                raise ValueError(f"{key} must be a string or null")
+        if not changes:
+            raise ValueError("nothing to show: give " +
+                             ", ".join(f"LCD{row}" for row in range(len(self.rows))) +
+                             " or clear")
+        return changes
+
+    def overlay(self, rows, now=None):
+        """rows with the pushed text that has not expired put over them."""
+        now = time.monotonic() if now is None else now
+        shown = list(rows)
+        for row, entry in enumerate(self.rows):
+            if entry is None:
+                continue
+            text, expires = entry
+            if expires is not None and now >= expires:
+                self.rows[row] = None
+            else:
+                shown[row] = text
+        return shown
+
+    def published(self):
+        """The render loop has sent what is on the board."""
+        self._unsent.clear()
+        self._changed.clear()
+
+    async def wait(self, timeout, min_gap=0.0):
+        """
+        Wait timeout seconds, or less if something is pushed meanwhile,
+        but at least min_gap: bursts wait for the next frame together
+        rather than each making one.
+        """
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        await asyncio.sleep(min(min_gap, timeout))
+        if self._unsent:
+            return
+        try:
+            await asyncio.wait_for(self._changed.wait(), max(0.0, end - loop.time()))
+        except asyncio.TimeoutError:
+            pass
+
+    def status(self, now=None):
+        now = time.monotonic() if now is None else now
+        return {"pushed": [None if e is None else
+                           {"text": e[0], "ttl": None if e[1] is None else round(e[1] - now, 1)}
+                           for e in self.rows],
+                "submissions": self.submissions, "coalesced": self.coalesced,
+                "rejected": self.rejected}
+
+
+class PushServer:
+    """
+    The Unix socket and loopback HTTP front ends for a Board. status() is
+    called for GET /status and {"status": true} on the socket, and should
+    return a dict that json can write.
+    """
+    def __init__(self, board, status=None):
+        self.board = board
+        self.status = status or board.status
+        self.path = None
+        self.port = None
+        self._servers = []
+
+    async def start_unix(self, path=None):
+        path = path or default_socket_path()
+        remove_stale_socket(path)
+        # Only this user gets to write on the screen, from the moment the
+        # socket exists
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._unix_client, path,
+                                                     limit=MAX_REQUEST)
+        finally:
+            os.umask(umask)
+        self.path = path
+        self._servers.append(server)
+        print(f"Taking updates on {self.path}")
+
+    async def start_http(self, port, host="127.0.0.1"):
+        server = await asyncio.start_server(self._http_client, host, port, limit=MAX_REQUEST)
+        self._servers.append(server)
+        # The port picked, if asked for 0
+        self.port = server.sockets[0].getsockname()[1]
+        print(f"Taking updates on http://{host}:{self.port}/screen")
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def _handle(self, body):
+        # (ok, reply) for one update
+        try:
+            update = json.loads(body)
+            if isinstance(update, dict) and update.get("status"):
+                return True, self.status()
+            return True, {"ok": True, "rows": self.board.submit(update)}
+        except ValueError as e:
+            return False, {"ok": False, "error": str(e)}
+
+    async def _unix_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than MAX_REQUEST; the rest of the stream is lost
+                    writer.write(b'{"ok": false, "error": "update too long"}\n')
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                _, reply = self._handle(line)
+                writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _http_client(self, reader, writer):
+        try:
+            code, reply = await self._http_request(reader)
+            body = json.dumps(reply).encode("utf-8") + b"\n"
+            writer.write(f"HTTP/1.1 {code} {_REASONS[code]}\r\n"
+                         "Content-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n"
+                         "Connection: close\r\n\r\n".encode("latin-1") + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _http_request(self, reader):
+        # Just enough HTTP/1.1 for curl and the like: one request per
+        # connection, body sized by Content-Length
+        request = (await reader.readline()).decode("latin-1").split()
+        length = 0
+        content_type = ""
+        host = ""
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            name = name.strip().lower()
+            value = value.strip()
+            if name == "content-length":
+                # Not int(), which takes "-5" and " +5 "
+                length = int(value) if value.isdigit() else None
+            elif name == "content-type":
+                content_type = value.split(";")[0].strip().lower()
+            elif name == "host":
+                host = value.lower()
+        if len(request) < 2 or length is None:
+            return 400, {"ok": False, "error": "bad request"}
+        if _host_name(host) not in _LOCAL_HOSTS:
+            return 403, {"ok": False, "error": "Host must be 127.0.0.1 or localhost"}
+        method, target = request[0], request[1].split("?")[0]
+        if target == "/status":
+            if method != "GET":
+                return 405, {"ok": False, "error": "use GET"}
+            return 200, self.status()
+        if target != "/screen":
+            return 404, {"ok": False, "error": "try POST /screen or GET /status"}
+        if method != "POST":
+            return 405, {"ok": False, "error": "use POST"}
+        if content_type != "application/json":
+            # A form or text/plain POST is what a web page can send here
+            # unasked
+            return 415, {"ok": False, "error": "send Content-Type: application/json"}
+        if length > MAX_REQUEST:
+            return 413, {"ok": False, "error": "update too long"}
+        ok, reply = self._handle(await reader.readexactly(length))
+        return (200 if ok else 400), reply
@@ -0,0 +1,164 @@
+"""
+The values the sender can show, as plugins for the Collector.
+
+A source is registered under a name with its sampling interval, and
+optionally a timeout and a max_interval (see collector.py). The decorated
+function is a factory: it is called once and returns the function that
+takes a sample, so a source can keep state such as the last counter
+reading for a rate.
+
+    from sources import source
+
+    @source("wan", interval=10.0, timeout=2.0, max_interval=120.0)
+    def wan():
+        def sample():
+            return poll_router()["wan"]
+        return sample
+
+Save that in a module on the path and load it with --plugin MODULE. The
+screen rows are format strings over the names, e.g.
+"L1:{load:.2f} CPU:{cpu:2.0f}%"; a name without a value yet shows as "--".
+psutil is only imported by the sources that need it.
+"""
+import os
+import string
+import time
+from datetime import datetime
+
+# name -> (factory, interval, timeout, max_interval)
+REGISTRY = {}
+
+
+def source(name, interval, timeout=None, max_interval=None):
+    """Register the decorated factory as source name."""
+    def register(factory):
+        REGISTRY[name] = (factory, interval, timeout, max_interval)
+        return factory
+    return register
+
+
+def fields(*templates):
+    """The source names used by row templates, in order of first use."""
+    names = []
+    for template in templates:
+        for _, field, _, _ in string.Formatter().parse(template):
+            if field is not None:
+                name = field.split(".")[0].split("[")[0]
+                if name and name not in names:
+                    names.append(name)
+    return names
+
+
+def add_sources(collector, names):
+    """Add the named sources to collector. Raises KeyError for a name
+    nothing has registered."""
+    for name in names:
+        if name not in REGISTRY:
+            raise KeyError(f"no source called {name!r}; have {', '.join(sorted(REGISTRY))}")
+        factory, interval, timeout, max_interval = REGISTRY[name]
+        collector.add(name, factory(), interval, timeout, max_interval)
+
+
+class _RowFormatter(string.Formatter):
+
+    def get_value(self, key, args, kwargs):
+        return kwargs.get(key)
+
+    def format_field(self, value, spec):
+        if value is None:
+            return "--"
+        try:
+            return format(value, spec)
+        except (TypeError, ValueError):
+            return str(value)
+
+
+_formatter = _RowFormatter()
+
+
+def render(template, values, width=16):
+    """A screen row: template filled in from values (a Snapshot or dict),
+    padded or cut to width."""
+    return _formatter.vformat(template, (), values).ljust(width)[:width]
+
+
+def _rate(read):
+    # Per-second rate of a growing counter, in thousands
+    last = [None, 0.0]
+
+    def sample():
+        now = time.monotonic()
+        value = read()
+        rate = 0.0
+        if last[0] is not None and now > last[1]:
+            rate = (value - last[0]) / (now - last[1]) / 1000
+        last[0], last[1] = value, now
+        return rate
+    return sample
+
+
+# -------- Built in sources --------
+@source("cpu", interval=2.5)
+def cpu():
+    import psutil
+    return psutil.cpu_percent
+
+
+@source("load", interval=1.0)
+def load():
+    return lambda: os.getloadavg()[0]
+
+
+@source("uptime", interval=1.0)
+def uptime():
+    import psutil
+
+    def sample():
+        boot = datetime.fromtimestamp(psutil.boot_time())
+        delta = datetime.now() - boot
+
+        # Extract parts
+        days = delta.days
+        seconds = delta.seconds
+
+        hours = seconds // 3600
+        minutes = (seconds % 3600) // 60
+        seconds = seconds % 60
+
+        return f"{days} {hours:02d}:{minutes:02d}:{seconds:02d}"
+    return sample
+
+
+@source("net_rx", interval=1.0)
+def net_rx():
+    import psutil
+    return _rate(lambda: psutil.net_io_counters().bytes_recv)
+
+
+@source("net_tx", interval=1.0)
+def net_tx():
+    import psutil
+    return _rate(lambda: psutil.net_io_counters().bytes_sent)
+
+
+@source("disk_read", interval=1.0)
+def disk_read():
+    import psutil
+    return _rate(lambda: psutil.disk_io_counters().read_bytes)
+
+
+@source("disk_write", interval=1.0)
+def disk_write():
+    import psutil
+    return _rate(lambda: psutil.disk_io_counters().write_bytes)
+
+
+@source("temp", interval=5.0, timeout=1.0, max_interval=60.0)
+def temp():
+    import psutil
+
+    def sample():
+        # The hottest sensor, to the degree (so it changes less often)
+        readings = [t.current for ts in psutil.sensors_temperatures().values() for t in ts]
+        return round(max(readings)) if readings else None
+    return sample
@@ -0,0 +1,99 @@
+# Fast-then-slow advertising. First checks BLEUART on the host bluetooth
+# stand-in: fast after boot and after a disconnect, slow once service() is
+# called past the fast window, and the same prebuilt payloads every time.
+# Then a model of what the intervals cost and buy: how long a sender that
+# starts scanning some seconds after a disconnect takes to find the device
+# and connect (the find_device_fast + connect times it prints), and how
+# many advertising events the radio sends while nobody is connected. Each
+# event is heard by the scanner with probability HEARD; the stack adds
+# 0-10 ms of random delay to each one. Run with:
+#
+#   python3 tests/host/run.py tests/bench_advertising.py
+
+import random
+import utime
+from ble_uart import BLEUART, ADV_FAST_US, ADV_SLOW_US, ADV_FAST_MS
+
+HEARD = 0.7
+SETTLE_S = 0.1        # the sender's pause between finding and connecting
+TRIALS = 2000
+IDLE_S = 600
+
+
+def check_uart():
+    uart = BLEUART(max_connections=1)
+    bt = uart._ble
+    adv, resp = uart._adv, uart._resp
+    assert bt.advertising == (ADV_FAST_US, adv, resp), bt.advertising
+    assert not uart.service()
+    utime.sleep_ms(ADV_FAST_MS)
+    assert uart.service()
+    assert bt.advertising == (ADV_SLOW_US, adv, resp), bt.advertising
+    assert not uart.service()
+    utime.sleep_ms(5000)
+    bt.connect(0)
+    assert uart.adv_interval_us == 0
+    assert uart.connect_ms >= ADV_FAST_MS + 5000, uart.connect_ms
+    assert not uart.service()
+    bt.disconnect(0)
+    assert bt.advertising[0] == ADV_FAST_US
+    # The payloads are the ones built at init, not rebuilt per advertise
+    assert bt.advertising[1] is adv and bt.advertising[2] is resp
+    utime.sleep_ms(100)
+    bt.connect(0)
+    assert 100 <= uart.connect_ms < 1000, uart.connect_ms
+    print("fast after boot/disconnect, slow after {} s: ok".format(ADV_FAST_MS // 1000))
+
+
+def interval_at(t, fast_us, slow_us, fast_s):
+    return (fast_us if t < fast_s else slow_us) / 1_000_000
+
+
+def next_heard(t, phase, fast_us, slow_us, fast_s, rng):
+    # Walk the advertising events from the disconnect (phase) on until one
+    # at or after t is heard
+    e = phase
+    while True:
+        if e >= t and rng.random() < HEARD:
+            return e
+        e += interval_at(e, fast_us, slow_us, fast_s) + rng.random() * 0.01
+
+
+def reconnect(delay_s, fast_us, slow_us, fast_s, rng):
+    times = []
+    for _ in range(TRIALS):
+        phase = rng.random() * 0.01
+        found = next_heard(delay_s, phase, fast_us, slow_us, fast_s, rng)
+        # Connecting needs another event once the sender is ready
+        connected = next_heard(found + SETTLE_S, phase, fast_us, slow_us, fast_s, rng)
+        times.append(connected - delay_s)
+    times.sort()
+    return sum(times) / len(times), times[len(times) * 95 // 100]
+
+
+def events(fast_us, slow_us, fast_s):
+    t = n = 0
+    while t < IDLE_S:
+        t += interval_at(t, fast_us, slow_us, fast_s) + 0.005
+        n += 1
+    return n
+
+
+def main():
+    check_uart()
+    fast_s = ADV_FAST_MS / 1000
+    modes = (("fast only", ADV_FAST_US, ADV_FAST_US, IDLE_S),
+             ("slow only", ADV_SLOW_US, ADV_SLOW_US, 0),
+             ("fast->slow", ADV_FAST_US, ADV_SLOW_US, fast_s))
+    print()
+    print("mode        scan after s  reconnect ms (p95)  adv events in {} s idle".format(IDLE_S))
+    for name, fast_us, slow_us, window in modes:
+        rng = random.Random(1)
+        n = events(fast_us, slow_us, window)
+        for delay_s in (1, 10, 60):
+            mean, p95 = reconnect(delay_s, fast_us, slow_us, window, rng)
+            print("{:11s} {:12d} {:12.0f} ({:5.0f}) {:24d}".format(
+                name, delay_s, mean * 1000, p95 * 1000, n))
+
+
+main()
@@ -0,0 +1,51 @@
+# Time spent waiting on the controller per frame with fixed worst-case
+# delays versus polling the busy flag. Runs against a fake bus that
+# emulates the busy flag (about 1.5 ms for clear/home). Upload fake_i2c.py,
+# pico_i2c_lcd.py and lcd_api.py, then run this file.
+
+import utime
+from fake_i2c import BusyFakeI2C
+from pico_i2c_lcd import I2cLcd
+from custom_char import get_arrow_chars
+
+I2C_ADDR = 0x27
+I2C_NUM_ROWS = 2
+I2C_NUM_COLS = 16
+
+FRAMES = 10
+ROWS = ("L1:0.42 CPU:12% ", "UP:3 04:05:06   ")
+
+
+def frame(lcd, t):
+    # A full redraw with a clear and one spinner glyph upload
+    lcd.clear()
+    lcd.custom_char(t % 8, get_arrow_chars()[t % 8])
+    for y, text in enumerate(ROWS):
+        lcd.move_to(0, y)
+        lcd.putstr(text)
+
+
+def measure(busy_flag, wired=True):
+    i2c = BusyFakeI2C(wired=wired)
+    lcd = I2cLcd(i2c, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS, busy_flag=busy_flag)
+    i2c.reset()
+    wait0 = lcd.wait_us
+    t0 = utime.ticks_us()
+    for t in range(FRAMES):
+        frame(lcd, t)
+    elapsed = utime.ticks_diff(utime.ticks_us(), t0)
+    return ((lcd.wait_us - wait0) // FRAMES, elapsed // FRAMES,
+            i2c.reads // FRAMES, lcd.busy_flag)
+
+
+def main():
+    print("mode               wait us/frame  frame us  reads/frame  busy flag")
+    for name, busy_flag, wired in (("fixed delays", False, True),
+                                   ("busy flag", True, True),
+                                   ("busy flag, no R/W", True, False)):
+        wait, elapsed, reads, active = measure(busy_flag, wired)
+        print("{:18s} {:14d} {:9d} {:12d}  {}".format(
+            name, wait, elapsed, reads, "on" if active else "off"))
+
+
+main()
@@ -0,0 +1,120 @@
+# The sender's BLE loop with its values sampled inline, as it used to,
+# and read from the background Collector in sender/collector.py. The loop
+# wants to write every TICK_MS; one source stands in for polling a router
+# and takes ROUTER_MS each time. Inline, every router poll makes the write
+# that much late; with the collector the loop only reads the latest
+# snapshot. Runs in real time under CPython only (it needs threads):
+#
+#   python3 tests/host/run.py tests/bench_collector.py
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+from collector import Collector
+
+TICK_MS = 20
+ROUTER_MS = 300
+RUN_S = 3.0
+
+
+def router():
+    time.sleep(ROUTER_MS / 1000)
+    return "wan up"
+
+
+def sources():
+    n = [0]
+
+    def counter():
+        n[0] += 1
+        return n[0]
+    return (("count", counter, 0.1), ("router", router, 1.0))
+
+
+def check():
+    c = Collector()
+    c.add("ok", lambda: 1, 0.01)
+    state = {"fail": False}
+
+    def flaky():
+        if state["fail"]:
+            raise OSError("router went away")
+        return "up"
+    c.add("flaky", flaky, 0.01)
+    with c:
+        time.sleep(0.05)
+        state["fail"] = True
+        time.sleep(0.05)
+        snap = c.snapshot()
+    assert snap.get("ok") == 1 and snap.get("flaky") == "up", dict(snap.values)
+    assert c.sources["flaky"].errors > 0
+    try:
+        snap.values["ok"] = 2
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("snapshot values should be read-only")
+    print("snapshots read-only, last value kept through errors: ok")
+
+
+async def ble_loop(read):
+    # Writes are due every TICK_MS; how late does each one go out?
+    late = []
+    due = time.monotonic()
+    end = due + RUN_S
+    while due < end:
+        read()
+        late.append((time.monotonic() - due) * 1000)
+        due += TICK_MS / 1000
+        await asyncio.sleep(max(0.0, due - time.monotonic()))
+    return late
+
+
+def inline():
+    due = {}
+
+    def read():
+        now = time.monotonic()
+        for name, fn, interval in srcs:
+            if now >= due.get(name, 0):
+                fn()
+                due[name] = now + interval
+    srcs = sources()
+    return asyncio.run(ble_loop(read))
+
+
+def collected():
+    c = Collector()
+    for name, fn, interval in sources():
+        c.add(name, fn, interval)
+    with c:
+        ages = []
+
+        def read():
+            ages.append((time.monotonic() - c.snapshot().taken) * 1000)
+        late = asyncio.run(ble_loop(read))
+    return late, c, ages
+
+
+def main():
+    check()
+    print()
+    print("values     writes  mean late ms  worst late ms")
+    late = inline()
+    print("{:9s} {:7d} {:13.1f} {:14.1f}".format("inline", len(late),
+                                                 sum(late) / len(late), max(late)))
+    late_c, c, ages = collected()
+    print("{:9s} {:7d} {:13.1f} {:14.1f}".format("collector", len(late_c),
+                                                 sum(late_c) / len(late_c), max(late_c)))
+    router_src = c.sources["router"]
+    print("router: {} samples, worst {:.0f} ms on its own thread".format(
+        router_src.samples, router_src.worst_ms))
+    print("snapshot age when read: mean {:.1f} ms, worst {:.1f} ms".format(
+        sum(ages) / len(ages), max(ages)))
+    assert max(late_c) < max(late)
+
+
+main()
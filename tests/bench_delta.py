@@ -0,0 +1,88 @@
+# Bytes on air for full-row frames against patches of the cells that
+# changed, for the sender's load/uptime screen at a few update rates. Some
+# writes are dropped on the way; the device refuses the patch after a gap,
+# asks for a resync and the screen has to end up right anyway (checked on
+# the HD44780 emulator). Run with:
+#
+#   python3 tests/host/run.py tests/bench_delta.py
+
+import os
+import sys
+from fake_i2c import FakeI2C
+from hd44780_emu import Hd44780Emu
+from pico_i2c_lcd import I2cLcd, GcPolicy
+from displays import Display, RenderScheduler
+import frame_proto
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+import frame_state
+
+SECONDS = 600
+LOSE_EVERY = 37     # drop every 37th write
+
+
+def screen(t):
+    # What ericBLESender shows t seconds in: load changes every 5 s,
+    # uptime every second
+    load = (t // 5) * 7 % 300
+    cpu = (t // 5) * 13 % 100
+    up = 86400 + 3600 + t
+    return ["L1:{:.2f} CPU:{:2d}%    ".format(load / 100, cpu)[:16],
+            "UP:{} {:02d}:{:02d}:{:02d}     ".format(
+                up // 86400, up // 3600 % 24, up // 60 % 60, up % 60)[:16]]
+
+
+def run(interval_ms, delta):
+    devices = {0x27: Hd44780Emu(2, 16)}
+    i2c = FakeI2C(freq=400_000, devices=devices)
+    scheduler = RenderScheduler([Display(0, I2cLcd(i2c, 0x27, 2, 16, gc_policy=GcPolicy()))])
+    encoder = frame_state.DeltaEncoder()
+    check = frame_proto.SeqCheck()
+    air = 0
+    writes = 0
+    resyncs = 0
+    for tick in range(SECONDS * 1000 // interval_ms):
+        rows = screen(tick * interval_ms // 1000)
+        if delta:
+            frame = encoder.encode(rows, backlight=True)
+        else:
+            encoder.seq += 1
+            frame = frame_proto.encode_rows(rows, backlight=True, seq=encoder.seq)
+        writes += 1
+        air += len(frame) + frame_proto.AIR_OVERHEAD
+        if writes % LOSE_EVERY == 0:
+            continue
+        if not check.accept(frame, len(frame)):
+            resyncs += 1
+            air += frame_proto.HEADER_SIZE + frame_proto.AIR_OVERHEAD
+            encoder.resync()
+            continue
+        scheduler.begin_frame()
+        frame_proto.parse(frame, len(frame), scheduler)
+        scheduler.end_frame()
+        while scheduler.step():
+            pass
+    # One more update so a resync asked for at the very end is served
+    rows = screen(SECONDS)
+    frame = encoder.encode(rows, backlight=True) if delta else frame_proto.encode_rows(rows)
+    assert check.accept(frame, len(frame))
+    scheduler.begin_frame()
+    frame_proto.parse(frame, len(frame), scheduler)
+    scheduler.end_frame()
+    while scheduler.step():
+        pass
+    for row in range(2):
+        assert devices[0x27].text(row) == rows[row], (devices[0x27].text(row), rows[row])
+    return air // writes, air * 1000 // (SECONDS * 1000), resyncs
+
+
+def main():
+    print("interval ms  bytes/update (full / delta)  bytes/s (full / delta)  resyncs")
+    for interval_ms in (1000, 500, 250, 100):
+        full = run(interval_ms, False)
+        delta = run(interval_ms, True)
+        print("{:11d} {:13d} / {:<13d} {:10d} / {:<12d} {:d}".format(
+            interval_ms, full[0], delta[0], full[1], delta[1], delta[2]))
+
+
+main()
@@ -0,0 +1,83 @@
+# The sender's device cache (sender/device_cache.py): round trip through
+# the file, old entries pruned, a corrupt or missing file read as empty,
+# and a failed save that does not stop the sender. Then a model of startup
+# time with and without it. Without, the sender scans until it hears the
+# device, pauses SETTLE_S, and connects on the next advertising event it
+# hears. With, it connects on the first event heard. Each event is heard
+# with probability HEARD, and the stack adds 0-10 ms of delay to each (the
+# same model as bench_advertising.py). CPython only:
+#
+#   python3 tests/host/run.py tests/bench_device_cache.py
+
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+from device_cache import DeviceCache
+from ble_uart import ADV_FAST_US, ADV_SLOW_US
+
+HEARD = 0.7
+SETTLE_S = 0.1
+TRIALS = 2000
+
+
+def check():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ericbt", "devices.json")
+        cache = DeviceCache(path)
+        assert cache.get("ericbt-04Ws") is None
+        cache.remember("ericbt-04Ws", "AA:BB:CC:DD:EE:FF", mtu=247)
+        entry = DeviceCache(path).get("ericbt-04Ws")
+        assert entry["address"] == "AA:BB:CC:DD:EE:FF" and entry["mtu"] == 247, entry
+        assert not os.path.exists(path + ".tmp")
+        cache.forget("ericbt-04Ws")
+        assert DeviceCache(path).get("ericbt-04Ws") is None
+        # Entries not seen for too long are dropped, on disk too
+        cache.remember("ericbt-old", "AA:BB:CC:DD:EE:01")
+        cache.remember("ericbt-new", "AA:BB:CC:DD:EE:02")
+        cache.devices["ericbt-old"]["last_seen"] -= 100
+        assert cache.prune(50) == ["ericbt-old"]
+        assert sorted(DeviceCache(path).devices) == ["ericbt-new"]
+        with open(path, "w") as f:
+            f.write("{not json")
+        assert DeviceCache(path).devices == {}
+        # A directory where the file should be: saving fails, quietly
+        blocked = DeviceCache(os.path.join(path, "devices.json"))
+        blocked.remember("ericbt-04Ws", "AA:BB:CC:DD:EE:FF")
+        assert blocked.get("ericbt-04Ws")
+    print("round trip, pruning, bad file, failed save: ok")
+
+
+def heard(t, interval_s, rng):
+    # The first advertising event at or after t that the PC hears
+    e = rng.random() * interval_s
+    while True:
+        if e >= t and rng.random() < HEARD:
+            return e
+        e += interval_s + rng.random() * 0.01
+
+
+def startup(interval_s, cached, rng):
+    times = []
+    for _ in range(TRIALS):
+        t = 0.0 if cached else heard(0.0, interval_s, rng) + SETTLE_S
+        times.append(heard(t, interval_s, rng))
+    times.sort()
+    return sum(times) / len(times), times[len(times) * 95 // 100]
+
+
+def main():
+    check()
+    print()
+    print("advertising ms  start      to connected ms (p95)")
+    rng = random.Random(1)
+    for interval_us in (ADV_FAST_US, ADV_SLOW_US):
+        for cached in (False, True):
+            mean, p95 = startup(interval_us / 1_000_000, cached, rng)
+            print("{:14.1f}  {:9s} {:15.0f} ({:5.0f})".format(
+                interval_us / 1000, "cached" if cached else "scan", mean * 1000, p95 * 1000))
+
+
+main()
@@ -0,0 +1,143 @@
+# One sender feeding many thingies through sender/fanout.py, against a
+# simulated BLE backend. Each SimClient stands in for a BleakClient. A
+# write waits for its device's next connection event (every INTERVAL_MS)
+# and then for the PC's one radio, which needs SLOT_MS per packet. Acks
+# come back the same way. Each device takes RENDER_MS to draw a frame,
+# queues up to SLOTS frames and acks with credits like the firmware. The
+# screen changes on every publish, every TICK_MS. The table shows how
+# frames/s summed over all devices scales with the number of devices.
+# Then a device that takes 50x longer to render, to check that it does
+# not hold the others back. Runs in real time under CPython:
+#
+#   python3 tests/host/run.py tests/bench_fanout.py
+
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+from fanout import DeviceWorker, FanOut, TX_UUID
+from link import Link, Backoff
+import frame_proto
+
+INTERVAL_MS = 7.5
+SLOT_MS = 1.25
+RENDER_MS = 2.0
+SLOTS = 4
+TICK_MS = 5
+RUN_S = 1.5
+
+
+class SimRadio:
+
+    def __init__(self):
+        self.free_at = 0.0
+        self.packets = 0
+
+    async def send(self, phase):
+        # Book the first slot at or after this connection's next event
+        # that the radio has free, and wait for it to pass
+        loop = asyncio.get_running_loop()
+        interval = INTERVAL_MS / 1000
+        t = loop.time()
+        event = phase + (-(-(t - phase) // interval)) * interval
+        start = max(event, self.free_at)
+        self.free_at = start + SLOT_MS / 1000
+        self.packets += 1
+        await asyncio.sleep(self.free_at - t)
+
+
+class SimClient:
+
+    def __init__(self, radio, n, render_ms=RENDER_MS):
+        self.radio = radio
+        self.address = "SIM:{:02d}".format(n)
+        self.mtu_size = 247
+        self.render_ms = render_ms
+        self.phase = random.Random(n).random() * INTERVAL_MS / 1000
+        self.queue = asyncio.Queue()
+        self.check = frame_proto.SeqCheck()
+        self.handler = None
+        self.rendered = 0
+        self._task = asyncio.ensure_future(self._device())
+
+    async def read_gatt_char(self, uuid):
+        caps = frame_proto.CAP_JSON | frame_proto.CAP_BINARY | frame_proto.CAP_CREDITS
+        return frame_proto.encode_hello(caps, 512, SLOTS)
+
+    async def start_notify(self, uuid, handler):
+        assert uuid == TX_UUID
+        self.handler = handler
+
+    async def write_gatt_char(self, uuid, data, response=False):
+        await self.radio.send(self.phase)
+        self.queue.put_nowait(bytes(data))
+
+    async def disconnect(self):
+        self._task.cancel()
+
+    async def _device(self):
+        while True:
+            frame = await self.queue.get()
+            if not self.check.accept(frame, len(frame)):
+                continue
+            await asyncio.sleep(self.render_ms / 1000)
+            self.rendered += 1
+            if self.queue.empty() or self.rendered % SLOTS == 0:
+                ack = frame_proto.encode_ack(frame_proto.frame_seq(frame),
+                                             SLOTS - self.queue.qsize(), self.queue.qsize())
+                await self.radio.send(self.phase)
+                self.handler(None, ack)
+
+
+async def run(count, slow=None):
+    radio = SimRadio()
+    clients = {}
+
+    def make_worker(n):
+        async def connect():
+            clients[n] = SimClient(radio, n, RENDER_MS * 50 if n == slow else RENDER_MS)
+            return clients[n]
+        link = Link(connect, Backoff(0.01, 0.1), "sim{}".format(n))
+        return DeviceWorker("sim{}".format(n), link, protocol="binary", keepalive=10.0)
+
+    fanout = FanOut(make_worker(n) for n in range(count))
+    fanout.start()
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    k = 0
+    while loop.time() - start < RUN_S:
+        k += 1
+        fanout.publish(["frame {:8d}".format(k), "devices {:2d}".format(count)], "realtime",
+                       TICK_MS / 1000)
+        await asyncio.sleep(TICK_MS / 1000)
+    elapsed = loop.time() - start
+    counts = [clients[n].rendered for n in range(count)]
+    await fanout.close()
+    return [c / elapsed for c in counts], radio.packets / elapsed
+
+
+def quiet(count, slow=None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(run(count, slow))
+
+
+def main():
+    print("devices  frames/s total  per device (min)  radio packets/s")
+    for count in (1, 2, 4, 8, 12):
+        rates, packets = quiet(count)
+        print("{:7d} {:15.0f} {:11.0f} ({:4.0f}) {:16.0f}".format(
+            count, sum(rates), sum(rates) / count, min(rates), packets))
+    fast, _ = quiet(4)
+    mixed, _ = quiet(4, slow=0)
+    print()
+    print("4 devices, one rendering {:.0f} ms a frame: the slow one {:.0f} frames/s, "
+          "the rest {:.0f} (all fast: {:.0f})".format(
+              RENDER_MS * 50, mixed[0], min(mixed[1:]), min(fast)))
+    assert min(mixed[1:]) > 0.7 * min(fast)
+
+
+main()
@@ -0,0 +1,89 @@
+# A sender that updates the 16x2 faster than it can be drawn, with and
+# without credit flow control. main.py runs on the host (see
+# fake_device.py): BLEUART on the bluetooth stand-in queues frames into
+# its ring and render_task() drains it, renders (the I2C wire time moves
+# the clock on) and acks. Without credits the ring overflows, frames are
+# replaced and patches go missing, so the device keeps asking for full
+# frames. With credits the sender waits. The bus runs at 100 kHz; the BLE
+# link's own capacity is not modelled. Run with:
+#
+#   python3 tests/host/run.py tests/bench_flow_control.py
+
+import os
+import sys
+import utime
+from fake_device import FakeDevice
+import frame_proto
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+import frame_state
+
+RUN_MS = 3000
+CONN = 0
+
+
+def screen(t):
+    # Every cell changes every frame
+    return [chr(0x41 + (t + row) % 26) * 16 for row in range(2)]
+
+
+def run(interval_us, flow):
+    device = FakeDevice(freq=100_000)
+    device.connect(CONN)
+    ring = device.main.rx_ring
+
+    encoder = frame_state.DeltaEncoder()
+    window = frame_state.CreditWindow(device.main.RX_SLOTS)
+    sent = up = down = resyncs = stalls = 0
+    start = utime.ticks_us()
+    due = start
+    end = start + RUN_MS * 1000
+
+    def deliver():
+        # The sender reading the TX notifies
+        nonlocal down, resyncs
+        for _, data in device.notified():
+            down += len(data) + frame_proto.AIR_OVERHEAD
+            if data[1] == frame_proto.FT_RESYNC:
+                resyncs += 1
+                encoder.resync()
+            else:
+                window.on_ack(data)
+
+    while utime.ticks_diff(utime.ticks_us(), end) < 0:
+        now = utime.ticks_us()
+        while utime.ticks_diff(now, due) >= 0:
+            if flow and not window.can_send((encoder.seq + 1) & 0xffff):
+                stalls += 1
+                due = now
+                break
+            frame = encoder.encode(screen(sent))
+            device.write(CONN, frame)
+            sent += 1
+            up += len(frame) + frame_proto.AIR_OVERHEAD
+            due += interval_us
+        if not len(ring):
+            utime.sleep_us(max(1, utime.ticks_diff(due, now)))
+            continue
+        device.step()
+        deliver()
+
+    # Let the sender finish on a full frame so the screen can be checked
+    encoder.resync()
+    device.write(CONN, encoder.encode(screen(sent)))
+    device.step()
+    assert device.text(0) == screen(sent)[0], device.text(0)
+    secs = RUN_MS / 1000
+    return (sent, ring.dropped, resyncs, stalls, int(up / secs), int(down / secs))
+
+
+def main():
+    print("interval us  mode     frames  replaced  resyncs  stalls  up B/s  down B/s")
+    for interval_us in (20_000, 5_000, 2_000, 1_000):
+        for flow in (False, True):
+            r = run(interval_us, flow)
+            print("{:11d}  {:7s} {:6d} {:9d} {:8d} {:7d} {:7d} {:9d}".format(
+                interval_us, "credits" if flow else "none", *r))
+
+
+main()
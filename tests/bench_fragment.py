@@ -0,0 +1,83 @@
+# Frames bigger than one BLE write: writes and bytes on air per frame at
+# a few ATT MTUs once frames are split into chunks, and what one write
+# would have to carry without. Every chunked frame is put back together
+# by frame_proto.Reassembler and drawn on the HD44780 emulator (a 16x2
+# and a 20x4). Run with:
+#
+#   python3 tests/host/run.py tests/bench_fragment.py
+
+import json
+from fake_i2c import FakeI2C
+from hd44780_emu import Hd44780Emu
+from pico_i2c_lcd import I2cLcd, GcPolicy
+from displays import Display, RenderScheduler
+import frame_proto
+
+MTUS = (23, 64, 128, 185, 247)
+MAX_FRAME = 512
+
+
+def rows(t, count, cols):
+    return [("{}:{}:".format(t, row) + "abcdefghijklmnopqrstuvwxyz0123456789")[:cols]
+            for row in range(count)]
+
+
+def frames(t):
+    a = rows(t, 2, 16)
+    b = rows(t, 4, 20)
+    json16 = {"LCD0": a[0], "LCD1": a[1], "BL": "on"}
+    json_both = dict(json16, D1={"LCD{}".format(i): s for i, s in enumerate(b)})
+    records = [(0, i, 0, s) for i, s in enumerate(a)] + [(1, i, 0, s) for i, s in enumerate(b)]
+    return (("json 16x2", json.dumps(json16).encode()),
+            ("bin 16x2", frame_proto.encode_rows(a, backlight=True, seq=t)),
+            ("json 16x2+20x4", json.dumps(json_both).encode()),
+            ("bin 16x2+20x4", frame_proto.encode_records(records, backlight=True, seq=t)))
+
+
+def deliver(scheduler, buf, n):
+    if buf[0] == frame_proto.PROTO_VERSION:
+        scheduler.begin_frame()
+        frame_proto.parse(buf, n, scheduler)
+        scheduler.end_frame()
+    else:
+        scheduler.route(json.loads(bytes(buf[:n]).decode("utf-8")))
+    while scheduler.step():
+        pass
+
+
+def main():
+    devices = {0x27: Hd44780Emu(2, 16), 0x26: Hd44780Emu(4, 20)}
+    i2c = FakeI2C(freq=400_000, devices=devices)
+    scheduler = RenderScheduler([Display(0, I2cLcd(i2c, 0x27, 2, 16, gc_policy=GcPolicy())),
+                                 Display(1, I2cLcd(i2c, 0x26, 4, 20, gc_policy=GcPolicy()))])
+    r = frame_proto.Reassembler(MAX_FRAME)
+    print("frame             bytes  " + "  ".join("MTU {:3d}".format(m) for m in MTUS)
+          + "   (writes / bytes on air)")
+    t = 0
+    for name, _ in frames(0):
+        line = ""
+        size = 0
+        for mtu in MTUS:
+            t += 1
+            frame = dict(frames(t))[name]
+            size = len(frame)
+            writes = frame_proto.split(frame, t, mtu - 3)
+            n = 0
+            for w in writes:
+                if len(writes) == 1:
+                    n = len(w)
+                    r.buf[:n] = w
+                else:
+                    n = r.feed(w)
+            assert n == len(frame) and bytes(r.buf[:n]) == frame
+            deliver(scheduler, r.buf, n)
+            assert devices[0x27].text(0) == rows(t, 2, 16)[0]
+            if name.endswith("20x4"):
+                assert devices[0x26].text(3) == rows(t, 4, 20)[3]
+            air = sum(len(w) + frame_proto.AIR_OVERHEAD for w in writes)
+            line += "  {:2d} / {:<4d}".format(len(writes), air)
+        print("{:16s} {:5d} {}".format(name, size, line))
+    print("dropped:", r.dropped)
+
+
+main()
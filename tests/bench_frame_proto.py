@@ -0,0 +1,90 @@
+# Bytes on air and device-side decode time for the JSON and binary frame
+# formats, for a 16x2 update and one also driving a 20x4 second display.
+# Decoding covers everything from the received bytes up to the frame
+# buffers (no LCD writes); the screens are checked on the HD44780 emulator
+# afterwards. On a PC json.loads is C code and the binary parser is not, so
+# only the device's decode times compare like with like. Upload fake_i2c.py, hd44780_emu.py, frame_proto.py,
+# displays.py, glyph_cache.py, pico_i2c_lcd.py and lcd_api.py, or run:
+#
+#   python3 tests/host/run.py tests/bench_frame_proto.py
+
+import json
+import utime
+from fake_i2c import FakeI2C
+from hd44780_emu import Hd44780Emu
+from pico_i2c_lcd import I2cLcd, GcPolicy
+from displays import Display, RenderScheduler
+import frame_proto
+
+FRAMES = 200
+
+
+def build():
+    devices = {0x27: Hd44780Emu(2, 16), 0x26: Hd44780Emu(4, 20)}
+    i2c = FakeI2C(freq=400_000, devices=devices)
+    displays = [Display(0, I2cLcd(i2c, 0x27, 2, 16, gc_policy=GcPolicy())),
+                Display(1, I2cLcd(i2c, 0x26, 4, 20, gc_policy=GcPolicy()))]
+    return RenderScheduler(displays), devices
+
+
+def rows16(t):
+    return ["L1:{:.2f} CPU:{:2d}%".format(t / 100, t % 100)[:16],
+            "UP:0 {:02d}:{:02d}:{:02d}   ".format(t // 3600, t // 60 % 60, t % 60)[:16]]
+
+
+def rows20(t):
+    return ["disk {:3d}%".format(t % 101), "net {:5d} kB/s".format(t * 7 % 10000),
+            "temp {:2d}C".format(40 + t % 30), "#" * (t % 21)]
+
+
+def json_frame(t, two):
+    a = rows16(t)
+    data = {"LCD0": a[0], "LCD1": a[1], "BL": "on"}
+    if two:
+        data["D1"] = {"LCD{}".format(i): s for i, s in enumerate(rows20(t))}
+    return json.dumps(data).encode()
+
+
+def binary_frame(t, two):
+    records = [(0, row, 0, s) for row, s in enumerate(rows16(t))]
+    if two:
+        records += [(1, row, 0, s) for row, s in enumerate(rows20(t))]
+    return frame_proto.encode_records(records, backlight=True, seq=t)
+
+
+def run(two, binary):
+    scheduler, devices = build()
+    frames = [(binary_frame if binary else json_frame)(t, two) for t in range(FRAMES)]
+    size = max(len(f) for f in frames)
+    buf = bytearray(size)
+    mv = memoryview(buf)
+    decode_us = 0
+    for f in frames:
+        n = len(f)
+        buf[:n] = f
+        t0 = utime.ticks_us()
+        if binary:
+            scheduler.begin_frame()
+            frame_proto.parse(mv, n, scheduler)
+            scheduler.end_frame()
+        else:
+            scheduler.route(json.loads(bytes(buf[:n]).decode("utf-8")))
+        decode_us += utime.ticks_diff(utime.ticks_us(), t0)
+    while scheduler.step():
+        pass
+    last = rows16(FRAMES - 1)
+    assert devices[0x27].text(0).rstrip() == last[0].rstrip(), devices[0x27].text(0)
+    if two:
+        assert devices[0x26].text(2).rstrip() == rows20(FRAMES - 1)[2]
+    return size + frame_proto.AIR_OVERHEAD, decode_us // FRAMES
+
+
+def main():
+    print("frame         bytes on air (json / binary)  decode us (json / binary)")
+    for two, name in ((False, "16x2"), (True, "16x2 + 20x4")):
+        j = run(two, False)
+        b = run(two, True)
+        print("{:12s} {:14d} / {:<14d} {:12d} / {:d}".format(name, j[0], b[0], j[1], b[1]))
+
+
+main()
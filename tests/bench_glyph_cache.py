@@ -0,0 +1,136 @@
+# CGRAM uploads needed to show a spinner, a bar graph and an icon together
+# when there are more glyphs than the 8 CGRAM slots. Runs against a fake
+# bus. Then that a Display puts back glyphs whose slot was recycled, also
+# on a page that was hidden at the time. Upload fake_i2c.py,
+# glyph_cache.py, displays.py, custom_char.py, pico_i2c_lcd.py and
+# lcd_api.py, then run this file.
+
+from fake_i2c import FakeI2C
+from pico_i2c_lcd import I2cLcd
+from glyph_cache import GlyphCache
+from displays import Display
+from custom_char import get_arrow_chars
+
+I2C_ADDR = 0x27
+I2C_NUM_ROWS = 2
+I2C_NUM_COLS = 16
+
+FRAMES = 64
+
+
+def bar(n):
+    # n of 5 columns filled from the left
+    row = (0x1f << (5 - n)) & 0x1f
+    return [row] * 8
+
+
+ICONS = {"bell": [0x04, 0x0e, 0x0e, 0x0e, 0x1f, 0x00, 0x04, 0x00],
+         "wifi": [0x00, 0x0e, 0x11, 0x04, 0x0a, 0x00, 0x04, 0x00]}
+
+
+def scene(t):
+    # Glyph names used by frame t: spinner, a 3-cell bar graph and an icon
+    level = (t // 4) % 16
+    cells = []
+    for i in range(3):
+        cells.append("bar{}".format(max(0, min(5, level - i * 5))))
+    return ["arrow{}".format(t % 8)] + cells + [("bell", "wifi")[(t // 16) % 2]]
+
+
+def register(cache):
+    for idx, charmap in enumerate(get_arrow_chars()):
+        cache.add("arrow{}".format(idx), charmap)
+    for n in range(6):
+        cache.add("bar{}".format(n), bar(n))
+    for name, charmap in ICONS.items():
+        cache.add(name, charmap)
+
+
+def run_naive(lcd, cache):
+    # Upload every glyph a frame needs into fixed slots, every frame
+    uploads = 0
+    for t in range(FRAMES):
+        for slot, name in enumerate(scene(t)):
+            lcd.custom_char(slot, cache.glyphs[name])
+            uploads += 1
+            lcd.draw(slot, 1, chr(slot))
+        lcd.flush()
+    return uploads
+
+
+def run_cached(lcd, cache):
+    for t in range(FRAMES):
+        cache.begin_frame()
+        for x, name in enumerate(scene(t)):
+            lcd.draw(x, 1, cache.char(name))
+        lcd.flush()
+        cache.stale()
+    return cache.uploads
+
+
+def check_display():
+    # Nine glyphs on screen, eight slots: each update recycles a slot that
+    # is in use, and the cells showing it must not be left with the new
+    # glyph
+    i2c = FakeI2C()
+    lcd = I2cLcd(i2c, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
+    display = Display(0, lcd)
+    register(display.glyphs)
+    names = ["bar{}".format(n) for n in range(6)] + list(ICONS) + ["arrow0"]
+    for t in range(FRAMES):
+        x = t % len(names)
+        display.draw_glyph(x, 0, names[x])
+        display.end_update()
+        lcd.flush()
+        for (x, y), name in display._glyph_at[None].items():
+            code = lcd.shadow[y * I2C_NUM_COLS + x]
+            assert code == 0x20 or display.glyphs.slot_name[code & 7] == name, (t, x, name)
+        assert not display.glyphs.stale()
+    print("display puts back glyphs whose slot was recycled: ok")
+
+
+def check_pages():
+    # Page 1 shows four glyphs, then page 2 (shown) uses eight others, so
+    # every slot page 1 used goes to another glyph while it is hidden. Its
+    # cells must show their own glyphs again once it is back on screen.
+    i2c = FakeI2C()
+    lcd = I2cLcd(i2c, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
+    display = Display(0, lcd)
+    register(display.glyphs)
+    for page in (1, 2):
+        display.add_page(page)
+    display.show_page(1)
+    for x, name in enumerate(["bar0", "bar1", "bell", "wifi"]):
+        display.draw_glyph(x, 0, name)
+    display.end_update()
+    lcd.flush()
+    display.show_page(2)
+    for x in range(8):
+        display.draw_glyph(x, 1, "arrow{}".format(x))
+    display.end_update()
+    lcd.flush()
+    display.show_page(1)
+    lcd.flush()
+    for (x, y), name in display._glyph_at[1].items():
+        code = lcd.shadow[y * I2C_NUM_COLS + x]
+        assert display.glyphs.shows(code, name), (x, name)
+    print("hidden pages get their glyphs back when shown: ok")
+
+
+def main():
+    check_display()
+    check_pages()
+    print("{} frames, {} distinct glyphs".format(FRAMES, 8 + 6 + len(ICONS)))
+    print("mode       uploads  bus bytes")
+    for name, run in (("naive", run_naive), ("cached", run_cached)):
+        i2c = FakeI2C()
+        lcd = I2cLcd(i2c, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
+        cache = GlyphCache(lcd)
+        register(cache)
+        i2c.reset()
+        uploads = run(lcd, cache)
+        print("{:8s} {:9d} {:10d}".format(name, uploads, i2c.bytes))
+    print("cache hits:", cache.hits, "evictions:", cache.evictions)
+
+
+main()
@@ -0,0 +1,39 @@
+# I2C transaction count benchmark for a full 16x2 screen refresh.
+# Runs against a fake bus, so no LCD is needed. Upload fake_i2c.py,
+# pico_i2c_lcd.py and lcd_api.py, then run this file.
+
+from fake_i2c import FakeI2C, LegacyI2cLcd
+from pico_i2c_lcd import I2cLcd
+
+I2C_ADDR = 0x27
+I2C_NUM_ROWS = 2
+I2C_NUM_COLS = 16
+
+ROWS = ("L1:0.42 CPU:12% ", "UP:3 04:05:06   ")
+
+
+def refresh(lcd):
+    for y, text in enumerate(ROWS):
+        lcd.move_to(0, y)
+        lcd.putstr(text)
+
+
+def measure(cls):
+    i2c = FakeI2C(freq=500_000)
+    lcd = cls(i2c, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
+    i2c.reset()
+    refresh(lcd)
+    return i2c.transactions, i2c.bytes, i2c.wire_time_us()
+
+
+def main():
+    print("driver      transactions   bytes   wire us @500kHz")
+    results = []
+    for name, cls in (("legacy", LegacyI2cLcd), ("batched", I2cLcd)):
+        t, b, us = measure(cls)
+        results.append(t)
+        print("{:10s} {:13d} {:7d} {:17d}".format(name, t, b, us))
+    print("transactions reduced {}x".format(results[0] // max(results[1], 1)))
+
+
+main()
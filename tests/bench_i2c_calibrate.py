@@ -0,0 +1,44 @@
+# Checks calibrate_i2c() against fake buses that start failing above a
+# given frequency, and times the calibration; then against one that cannot
+# be set up above a frequency. Upload fake_i2c.py, pico_i2c_lcd.py and
+# lcd_api.py, then run this file.
+
+import utime
+from fake_i2c import FakeI2C
+from pico_i2c_lcd import calibrate_i2c, CAL_FREQS
+
+I2C_ADDR = 0x27
+
+
+def limited(top):
+    # A peripheral that cannot be set up above top Hz (at all, if None)
+    def make(freq):
+        if top is None or freq > top:
+            raise ValueError("freq {} not supported".format(freq))
+        return FakeI2C(freq=freq)
+    return make
+
+
+def main():
+    print("fails above   picked      ms  stopped at")
+    for max_freq in (50_000, 100_000, 450_000, 800_000, None):
+        t0 = utime.ticks_ms()
+        i2c, freq, failure = calibrate_i2c(lambda f: FakeI2C(freq=f, max_freq=max_freq), I2C_ADDR)
+        dt = utime.ticks_diff(utime.ticks_ms(), t0)
+        expected = 0
+        for f in CAL_FREQS:
+            if max_freq is None or f <= max_freq:
+                expected = f
+        print("{:>10s} {:>9d} {:7d}  {:10s}  {}".format(
+            str(max_freq), freq, dt, str(failure[0]) if failure else "-",
+            "ok" if freq == expected else "WRONG"))
+
+    # Bus setup failing with ValueError stops stepping up too
+    i2c, freq, failure = calibrate_i2c(limited(400_000), I2C_ADDR)
+    assert freq == 400_000 and failure[0] == 500_000 and isinstance(failure[1], ValueError)
+    i2c, freq, failure = calibrate_i2c(limited(None), I2C_ADDR)
+    assert i2c is None and freq == 0 and isinstance(failure[1], ValueError)
+    print("bus that cannot be set up (ValueError): ok")
+
+
+main()
@@ -0,0 +1,121 @@
+# A write that fails part way through a render. The fake bus fails the
+# n-th write of a flush (for every write the flush makes), the error is
+# caught as render_task does, and the next flush has to put the screen
+# right: the HD44780 emulator must then show the new text. The same for a
+# putstr() and for the sliced rendering RenderScheduler does. Run with:
+#
+#   python3 tests/host/run.py tests/bench_i2c_errors.py
+
+import sys
+from fake_i2c import FakeI2C
+from hd44780_emu import Hd44780Emu
+from pico_i2c_lcd import I2cLcd, GcPolicy
+from displays import Display, RenderScheduler
+
+I2C_ADDR = 0x27
+BEFORE = ("L1:0.42 CPU:12%     ", "UP:3 04:05:06       ",
+          "rack 20x4 row two   ", "rack 20x4 row three ")
+AFTER = ("HELLO WORLD, AGAIN  ", "uptime 3d 4h 5m 7s  ",
+         "THE THIRD ROW       ", "and the fourth one! ")
+
+
+def setup():
+    emu = Hd44780Emu(4, 20)
+    i2c = FakeI2C(devices={I2C_ADDR: emu})
+    lcd = I2cLcd(i2c, I2C_ADDR, 4, 20, gc_policy=GcPolicy())
+    return emu, i2c, lcd
+
+
+def draw(lcd, rows):
+    for y, text in enumerate(rows):
+        lcd.draw(0, y, text)
+
+
+def shows(emu, rows):
+    return all(emu.text(y) == text for y, text in enumerate(rows))
+
+
+def writes_per_flush():
+    emu, i2c, lcd = setup()
+    draw(lcd, BEFORE)
+    lcd.flush()
+    draw(lcd, AFTER)
+    i2c.reset()
+    lcd.flush()
+    return i2c.transactions
+
+
+def flush_case(n):
+    # Fail write n of the flush, then flush again
+    emu, i2c, lcd = setup()
+    draw(lcd, BEFORE)
+    lcd.flush()
+    draw(lcd, AFTER)
+    i2c.fail_write(n)
+    failed = False
+    try:
+        lcd.flush()
+    except OSError:
+        failed = True
+    resent = lcd.flush()
+    return failed and not lcd.dirty() and shows(emu, AFTER), resent
+
+
+def putstr_case():
+    emu, i2c, lcd = setup()
+    draw(lcd, BEFORE)
+    lcd.flush()
+    lcd.move_to(0, 0)
+    i2c.fail_write()
+    try:
+        lcd.putstr(AFTER[0])
+    except OSError:
+        pass
+    lcd.flush()
+    return shows(emu, (AFTER[0],) + BEFORE[1:])
+
+
+def scheduler_case(cells_per_slice):
+    # A slice fails: render_task prints the error and renders again on its
+    # next pass
+    emu, i2c, lcd = setup()
+    display = Display(0, lcd)
+    scheduler = RenderScheduler([display], cells_per_slice)
+    scheduler.route({"LCD0": BEFORE[0], "LCD1": BEFORE[1]})
+    while scheduler.step():
+        pass
+    scheduler.route({"LCD0": AFTER[0], "LCD1": AFTER[1], "LCD2": AFTER[2], "LCD3": AFTER[3]})
+    # Sliced, let the first slice through
+    i2c.fail_write(1 if cells_per_slice else 0)
+    try:
+        while scheduler.step():
+            pass
+    except OSError:
+        pass
+    else:
+        return False
+    while scheduler.step():
+        pass
+    return shows(emu, AFTER)
+
+
+def main():
+    writes = writes_per_flush()
+    failed = 0
+    print("failed write  repaired  cells resent")
+    for n in range(writes):
+        ok, resent = flush_case(n)
+        failed += not ok
+        print("{:7d} of {:d} {:>9s} {:13d}".format(n + 1, writes, "ok" if ok else "NO", resent))
+    ok = putstr_case()
+    failed += not ok
+    print("putstr        {:>9s}".format("ok" if ok else "NO"))
+    for cells in (0, 16):
+        ok = scheduler_case(cells)
+        failed += not ok
+        print("scheduler {:3d} {:>9s}".format(cells, "ok" if ok else "NO"))
+    if failed:
+        sys.exit(1)
+
+
+main()
@@ -0,0 +1,121 @@
+# Measures chars/second and heap allocations per frame for the original
+# driver (fresh bytes per nibble, gc.collect() per byte) against I2cLcd
+# with a GcPolicy. Runs against a fake bus, so no LCD is needed.
+# Upload fake_i2c.py, pico_i2c_lcd.py and lcd_api.py, then run this file.
+# Heap bytes are everything allocated per frame, from gc.mem_alloc() with
+# the collector disabled; under CPython, which frees garbage at once, they
+# are the most a frame had allocated on top of what it started with.
+
+import gc
+import utime
+import fake_i2c
+import pico_i2c_lcd
+from fake_i2c import FakeI2C, LegacyI2cLcd
+from pico_i2c_lcd import I2cLcd, GcPolicy
+
+I2C_ADDR = 0x27
+I2C_NUM_ROWS = 2
+I2C_NUM_COLS = 16
+
+FRAMES = 50
+ROWS = ("L1:0.42 CPU:12% ", "UP:3 04:05:06   ")
+CHARS_PER_FRAME = len(ROWS[0]) + len(ROWS[1])
+
+
+def frame(lcd):
+    for y, text in enumerate(ROWS):
+        lcd.move_to(0, y)
+        lcd.putstr(text)
+
+
+class NullI2C:
+    # A bus that allocates nothing itself (FakeI2C's counters do), so the
+    # heap figures are the driver's alone
+    def writeto(self, addr, buf):
+        pass
+
+    def readfrom_into(self, addr, buf):
+        pass
+
+
+class _CountingGc:
+    # Replaces the driver's gc module while counting allocations, so that
+    # per-byte collections neither run nor hide what was allocated.
+    def __init__(self):
+        self.calls = 0
+
+    def collect(self):
+        self.calls += 1
+
+    def mem_free(self):
+        return 1 << 30
+
+
+def _mem_alloc():
+    # MicroPython only: with the collector disabled this grows by every
+    # byte allocated, even if it is garbage straight away
+    try:
+        return gc.mem_alloc()
+    except AttributeError:
+        return None
+
+
+def allocations_per_frame(lcd):
+    # Heap bytes allocated per frame. CPython frees garbage as soon as it
+    # is dropped, so there the figure is tracemalloc's peak above what was
+    # in use when the frame started: every short-lived object a write
+    # makes shows up in it, however quickly it goes
+    counting = _CountingGc()
+    saved = pico_i2c_lcd.gc, fake_i2c.gc
+    pico_i2c_lcd.gc = fake_i2c.gc = counting
+    tracemalloc = None
+    if _mem_alloc() is None:
+        import tracemalloc
+        tracemalloc.start()
+    # Anything made once and kept (e.g. the batch views) is made now
+    frame(lcd)
+    gc.collect()
+    gc.disable()
+    try:
+        if tracemalloc:
+            worst = 0
+            for _ in range(FRAMES):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                frame(lcd)
+                worst = max(worst, tracemalloc.get_traced_memory()[1] - before)
+            used = worst
+        else:
+            before = _mem_alloc()
+            for _ in range(FRAMES):
+                frame(lcd)
+            used = (_mem_alloc() - before) // FRAMES
+    finally:
+        gc.enable()
+        if tracemalloc:
+            tracemalloc.stop()
+        pico_i2c_lcd.gc, fake_i2c.gc = saved
+    return used, counting.calls // FRAMES
+
+
+def chars_per_second(lcd):
+    t0 = utime.ticks_us()
+    for _ in range(FRAMES):
+        frame(lcd)
+    dt = utime.ticks_diff(utime.ticks_us(), t0)
+    return FRAMES * CHARS_PER_FRAME * 1_000_000 // max(dt, 1)
+
+
+def main():
+    print("{} frames of {} chars".format(FRAMES, CHARS_PER_FRAME))
+    print("driver      chars/s  heap bytes/frame  gc.collect/frame")
+    for name, driver, policy in (("before", LegacyI2cLcd, None),
+                                 ("after", I2cLcd, GcPolicy(frames=FRAMES))):
+        heap, collects = allocations_per_frame(
+            driver(NullI2C(), I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS, gc_policy=policy))
+        lcd = driver(FakeI2C(), I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS, gc_policy=policy)
+        print("{:10s} {:8d} {:17d} {:17d}".format(
+            name, chars_per_second(lcd), heap, collects))
+
+
+main()
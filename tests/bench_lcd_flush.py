@@ -0,0 +1,62 @@
+# Compares rewriting both rows every tick with draw() + flush(), which
+# only sends the cells that changed. Runs against a fake bus.
+# Upload fake_i2c.py, pico_i2c_lcd.py and lcd_api.py, then run this file.
+
+from fake_i2c import FakeI2C
+from pico_i2c_lcd import I2cLcd
+
+I2C_ADDR = 0x27
+I2C_NUM_ROWS = 2
+I2C_NUM_COLS = 16
+
+TICKS = 20
+
+
+def frames():
+    # Status screens like the sender's: load/CPU rarely change, uptime ticks
+    for t in range(TICKS):
+        cpu = 12 if t < 10 else 13
+        yield ("L1:0.42 CPU:{:2d}% ".format(cpu),
+               "UP:3 04:05:{:02d}  ".format(t % 60),
+               chr(t % 8))
+
+
+def full_rewrite(lcd):
+    for row0, row1, arrow in frames():
+        lcd.move_to(0, 0)
+        lcd.putstr(row0)
+        lcd.move_to(0, 1)
+        lcd.putstr(row1[:15])
+        lcd.move_to(15, 1)
+        lcd.putchar(arrow)
+
+
+def diffed(lcd):
+    for row0, row1, arrow in frames():
+        lcd.draw(0, 0, row0)
+        lcd.draw(0, 1, row1[:15])
+        lcd.draw(15, 1, arrow)
+        lcd.flush()
+
+
+def measure(render):
+    i2c = FakeI2C()
+    lcd = I2cLcd(i2c, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
+    i2c.reset()
+    render(lcd)
+    return i2c, lcd
+
+
+def main():
+    print("{} ticks of a 16x2 status screen".format(TICKS))
+    print("mode          bytes/tick  transactions/tick")
+    full, _ = measure(full_rewrite)
+    diff, lcd = measure(diffed)
+    for name, i2c in (("full rewrite", full), ("flush", diff)):
+        print("{:12s} {:11d} {:18d}".format(
+            name, i2c.bytes // TICKS, i2c.transactions // TICKS))
+    print("cells written:", lcd.cells_written, "skipped:", lcd.cells_skipped)
+    print("bus bytes reduced {}x".format(full.bytes // max(diff.bytes, 1)))
+
+
+main()
@@ -0,0 +1,112 @@
+# Two centrals on one 16x2: a fast sender that writes whenever it has
+# credit and a slow one sending every 100 ms. If each is granted all the
+# free ring slots, together they overrun the ring: frames get replaced and
+# patches lost, so the device keeps asking for full frames. With the free
+# slots shared out between them nothing is lost. Also checks that
+# advertising carries on while there is room for another central, and that
+# each central's page shows what it sent when its turn comes. main.py runs
+# on the host, on the bluetooth stand-in (see fake_device.py); the bus
+# runs at 100 kHz:
+#
+#   python3 tests/host/run.py tests/bench_multi_central.py
+
+import os
+import sys
+import utime
+from fake_device import FakeDevice
+import frame_proto
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+import frame_state
+
+RUN_MS = 2000
+SLOW_US = 100_000
+FAST, SLOW = 1, 2
+
+
+class Central:
+
+    def __init__(self, handle, name, credits):
+        self.handle = handle
+        self.name = name
+        self.encoder = frame_state.DeltaEncoder()
+        self.window = frame_state.CreditWindow(credits)
+        self.sent = 0
+        self.resyncs = 0
+        self.rows = None
+
+    def frame(self):
+        self.sent += 1
+        self.rows = ["{} {:5d}".format(self.name, self.sent).ljust(16),
+                     "from central {}".format(self.handle).ljust(16)]
+        return self.encoder.encode(self.rows)
+
+
+def run(split):
+    device = FakeDevice(freq=100_000)
+    main = device.main
+    ring = main.rx_ring
+    if not split:
+        # How acks went before: every sender granted all the free slots
+        def send_acks(ble):
+            for conn_handle, seq in main.last_seq.items():
+                ble.notify(frame_proto.encode_ack(seq, ring.free(), len(ring)), conn_handle)
+        main.send_acks = send_acks
+    credits = main.RX_SLOTS // main.MAX_CENTRALS
+    centrals = {FAST: Central(FAST, "fast", credits), SLOW: Central(SLOW, "slow", credits)}
+    for h in centrals:
+        device.connect(h)
+    device.step()
+    start = utime.ticks_us()
+    due = start
+
+    while utime.ticks_diff(utime.ticks_us(), start) < RUN_MS * 1000:
+        now = utime.ticks_us()
+        slow = centrals[SLOW]
+        if (utime.ticks_diff(now, due) >= 0
+                and slow.window.can_send((slow.encoder.seq + 1) & 0xffff)):
+            device.write(SLOW, slow.frame())
+            due += SLOW_US
+        # The fast sender's writes land after the slow one's
+        fast = centrals[FAST]
+        while fast.window.can_send((fast.encoder.seq + 1) & 0xffff):
+            device.write(FAST, fast.frame())
+        device.step()
+        for h, data in device.notified():
+            if data[1] == frame_proto.FT_RESYNC:
+                centrals[h].encoder.resync()
+                centrals[h].resyncs += 1
+            else:
+                centrals[h].window.on_ack(data)
+        utime.sleep_us(1000)
+
+    # Each page, when shown, holds its central's latest rows
+    for h in (FAST, SLOW):
+        main.scheduler.show_page(h)
+        while main.scheduler.step():
+            pass
+        assert device.text(0) == centrals[h].rows[0], device.text(0)
+    for h in (FAST, SLOW):
+        device.disconnect(h)
+    return centrals, ring.dropped
+
+
+def main():
+    device = FakeDevice()
+    bt = device.ble
+    device.connect(FAST)
+    assert bt.advertising is not None, "should still advertise with one central"
+    device.connect(SLOW)
+    assert bt.advertising is None, "should stop advertising when full"
+    device.disconnect(FAST)
+    assert bt.advertising is not None
+
+    print("credits   central  sent  resyncs  replaced (both)")
+    for split in (False, True):
+        centrals, dropped = run(split)
+        for c in centrals.values():
+            print("{:8s}  {:7s} {:5d} {:8d} {:9d}".format(
+                "split" if split else "all free", c.name, c.sent, c.resyncs, dropped))
+
+
+main()
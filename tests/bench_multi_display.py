@@ -0,0 +1,82 @@
+# Refresh latency with several displays on one bus. While every other
+# display redraws its whole screen, the last display gets a two-character
+# update; rendering one display at a time makes it wait for all the others,
+# slices keep it bounded. First checks that updates reach the right
+# display, and that ones of the wrong shape are refused. Runs on the
+# HD44780 emulator:
+#
+#   python3 tests/host/run.py tests/bench_multi_display.py
+
+from fake_i2c import FakeI2C
+from hd44780_emu import Hd44780Emu
+from pico_i2c_lcd import I2cLcd, GcPolicy
+from displays import Display, RenderScheduler
+
+TICKS = 10
+
+
+def build(count, cells_per_slice):
+    devices = {}
+    geometry = []
+    for i in range(count):
+        rows, cols = ((2, 16), (4, 20))[i % 2]
+        devices[0x20 + i] = Hd44780Emu(rows, cols)
+        geometry.append((0x20 + i, rows, cols))
+    i2c = FakeI2C(freq=400_000, devices=devices)
+    displays = []
+    for display_id, (addr, rows, cols) in enumerate(geometry):
+        lcd = I2cLcd(i2c, addr, rows, cols, gc_policy=GcPolicy())
+        displays.append(Display(display_id, lcd))
+    return RenderScheduler(displays, cells_per_slice), devices
+
+
+def run(count, cells_per_slice):
+    scheduler, devices = build(count, cells_per_slice)
+    displays = scheduler.displays
+    worst = 0
+    for t in range(TICKS):
+        for d in displays[:-1]:
+            fill = chr(0x41 + (t + d.id) % 26) * d.lcd.num_columns
+            data = {}
+            for row in range(d.lcd.num_lines):
+                data["LCD{}".format(row)] = fill
+            d.apply(data)
+        displays[-1].apply({"LCD0": "{:02d}".format(t)})
+        while scheduler.step():
+            pass
+        worst = max(worst, displays[-1].latency_ms)
+        assert devices[0x20 + count - 1].text(0).startswith("{:02d}".format(t))
+    return worst, max(d.max_latency_ms for d in displays)
+
+
+def check_routing():
+    # "D<id>" keys reach their display; an update of the wrong shape is
+    # refused whole, so nothing of it is drawn
+    scheduler, devices = build(2, 0)
+    scheduler.route({"LCD0": "first", "D1": {"LCD3": "disk 93%"}})
+    while scheduler.step():
+        pass
+    assert devices[0x20].text(0).startswith("first")
+    assert devices[0x21].text(3).startswith("disk 93%")
+    for bad in ([1, 2], {"D0": "x"}, {"LCD1": "ok", "D1": {"LCD0": 5}}, {"LCD0": None}):
+        try:
+            scheduler.route(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("{!r} should be refused".format(bad))
+    assert not scheduler.dirty()
+    print("routing, and updates of the wrong shape refused: ok")
+
+
+def main():
+    check_routing()
+    print("displays  small update ms (whole / sliced)  worst display ms (whole / sliced)")
+    for count in (1, 2, 4, 8):
+        whole = run(count, 0)
+        sliced = run(count, 16)
+        print("{:8d} {:17d} / {:<15d} {:17d} / {:d}".format(
+            count, whole[0], sliced[0], whole[1], sliced[1]))
+
+
+main()
@@ -0,0 +1,174 @@
+# Adaptive pacing (sender/pacing.py) against a simulated thingy. First
+# the Pacer on its own: it climbs while acks come back quickly and cuts
+# back when they lag, but not again for frames sent before the cut. Then one DeviceWorker sending a
+# screen that changes on every frame to a SimClient that behaves like the
+# firmware: writes and acks wait for the next connection event (every
+# INTERVAL_MS), received frames queue in SLOTS slots, and each pass takes
+# what is queued, draws once (RENDER_MS, which changes every PHASE_S to
+# stand in for a slower LCD or a busier bus) and acks, after PHASE_S to
+# warm up at the first. Fixed rates send
+# frames the device never gets to draw, which then wait and come back
+# late; adaptive pacing follows the device. Runs in real time under
+# CPython:
+#
+#   python3 tests/host/run.py tests/bench_pacing.py
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+from fanout import DeviceWorker, FanOut, TX_UUID
+from link import Link, Backoff
+from pacing import Pacer
+import frame_proto
+
+INTERVAL_MS = 7.5
+SLOTS = 4
+RENDER_MS = (4, 40, 12)
+PHASE_S = 1.5
+
+
+def check():
+    pacer = Pacer(low=1, high=20, start=5, double_s=0.2, backoff=0.5)
+    for k in range(4):
+        pacer.acked(k, 20.0, 0, k * 100.0)
+    assert 10 < pacer.rate < 20
+    for k in range(4, 30):
+        pacer.acked(k, 20.0, 0, k * 100.0)
+    assert pacer.rate == 20 and pacer.lowered == 0 and pacer.base_ms == 20
+    # A late ack halves it; acks for frames sent before that do not
+    pacer.acked(30, 80.0, 0, 3000.0)
+    pacer.acked(31, 80.0, 0, 3050.0)
+    assert pacer.rate == 10 and pacer.lowered == 1
+    # An ack covering two frames: the device only drew the second
+    pacer.acked(33, 20.0, 0, 3200.0)
+    assert pacer.rate == 5
+    # Frames piling up on the device
+    pacer.acked(34, 20.0, 2, 3300.0)
+    assert pacer.rate == 2.5
+    for k in range(10):
+        pacer.lagging(5000.0 + k * 1000)
+    assert pacer.rate == 1
+    pacer.reset()
+    assert pacer.rtt_ms is None and pacer.rate == 1
+    print("pacer: climbs on quick acks, cuts once per lag, stays in range: ok")
+
+
+class SimClient:
+
+    def __init__(self):
+        self.address = "SIM:00"
+        self.mtu_size = 247
+        self.render_ms = RENDER_MS[0]
+        self.ring = []
+        self.arrived = asyncio.Event()
+        self.check = frame_proto.SeqCheck()
+        self.handler = None
+        self.drawn = 0
+        self._task = asyncio.ensure_future(self._device())
+
+    async def _event(self):
+        # Wait for the next connection event
+        loop = asyncio.get_running_loop()
+        interval = INTERVAL_MS / 1000
+        t = loop.time()
+        await asyncio.sleep(interval - t % interval)
+
+    async def read_gatt_char(self, uuid):
+        caps = frame_proto.CAP_JSON | frame_proto.CAP_BINARY | frame_proto.CAP_CREDITS
+        return frame_proto.encode_hello(caps, 512, SLOTS)
+
+    async def start_notify(self, uuid, handler):
+        assert uuid == TX_UUID
+        self.handler = handler
+
+    async def write_gatt_char(self, uuid, data, response=False):
+        await self._event()
+        if len(self.ring) < SLOTS:
+            self.ring.append(bytes(data))
+        self.arrived.set()
+
+    async def disconnect(self):
+        self._task.cancel()
+
+    async def _device(self):
+        while True:
+            await self.arrived.wait()
+            self.arrived.clear()
+            seq = None
+            while self.ring:
+                frame = self.ring.pop(0)
+                if self.check.accept(frame, len(frame)):
+                    seq = frame_proto.frame_seq(frame)
+            if seq is None:
+                continue
+            await asyncio.sleep(self.render_ms / 1000)
+            self.drawn += 1
+            ack = frame_proto.encode_ack(seq, SLOTS - len(self.ring), len(self.ring))
+            await self._event()
+            self.handler(None, ack)
+
+
+async def run(rate):
+    # rate frames/s, or None for adaptive
+    client = SimClient()
+
+    async def connect():
+        return client
+    pacer = None if rate else Pacer(1.0, 100.0, 10.0)
+    worker = DeviceWorker("sim", Link(connect, Backoff(0.01, 0.1)), protocol="binary",
+                          keepalive=10.0, pacer=pacer)
+    fanout = FanOut([worker])
+    fanout.start()
+    loop = asyncio.get_running_loop()
+    phases = []
+    k = 0
+    for n, render_ms in enumerate((RENDER_MS[0],) + RENDER_MS):
+        client.render_ms = render_ms
+        sent, drawn = worker.frames, client.drawn
+        stats = worker.rtt.stats.setdefault(render_ms, [0, 0, 0])
+        end = loop.time() + PHASE_S
+        while loop.time() < end:
+            k += 1
+            interval = 1 / rate if rate else fanout.pace()
+            fanout.publish(["frame {:8d}".format(k), "render {:3d} ms".format(render_ms)],
+                           render_ms, interval)
+            await asyncio.sleep(interval)
+        if n == 0:
+            # Warming up
+            continue
+        phases.append(((worker.frames - sent) / PHASE_S, (client.drawn - drawn) / PHASE_S,
+                       stats[1] / stats[0] if stats[0] else 0, pacer and pacer.rate))
+    await fanout.close()
+    return phases
+
+
+def quiet(rate):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(run(rate))
+
+
+def main():
+    check()
+    print()
+    print("pacing     render ms  sent/s  drawn/s  mean round trip ms  rate")
+    results = {}
+    for label, rate in (("10/s", 10), ("50/s", 50), ("100/s", 100), ("adaptive", None)):
+        results[label] = quiet(rate)
+        for render_ms, (sent, drawn, rtt, pace) in zip(RENDER_MS, results[label]):
+            print("{:9s} {:10d} {:7.0f} {:8.0f} {:19.0f} {:>5s}".format(
+                label, render_ms, sent, drawn, rtt, "" if pace is None else "{:.0f}".format(pace)))
+    adaptive, slow, fast = results["adaptive"], results["10/s"], results["100/s"]
+    for (sent, drawn, rtt, _), (_, slow_drawn, _, _), (_, fast_drawn, fast_rtt, _) in zip(
+            adaptive, slow, fast):
+        # Nearly everything sent gets drawn, well above the fixed rate and
+        # not far off flat out, without the wait
+        assert drawn > 0.8 * sent
+        assert drawn > 1.5 * slow_drawn and drawn > 0.5 * fast_drawn
+        assert rtt < fast_rtt + 2
+
+
+main()
@@ -0,0 +1,78 @@
+# End-to-end latency for each connection profile in frame_proto.PROFILES,
+# at the fastest and slowest connection interval the profile allows. A
+# write waits for the next connection event, is drawn on the HD44780
+# emulator (taking the I2C wire time) and the ack waits for the next event
+# after that. Also shows how often the radio has to wake up, the cost side
+# of the choice. Run with:
+#
+#   python3 tests/host/run.py tests/bench_profiles.py
+
+import os
+import sys
+import utime
+from fake_i2c import FakeI2C
+from hd44780_emu import Hd44780Emu
+from pico_i2c_lcd import I2cLcd, GcPolicy
+from displays import Display, RenderScheduler
+import frame_proto
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+import frame_state
+
+SECONDS = 60
+
+
+def screen(ms):
+    t = ms // 1000
+    return ["L1:{:.2f} CPU:{:2d}%   ".format((t // 5) % 300 / 100, (t // 5) * 13 % 100)[:16],
+            "UP:1 01:{:02d}:{:02d}     ".format(t // 60 % 60, t % 60)[:16]]
+
+
+def next_event(t_us, interval_us):
+    # Connection events fall on multiples of the interval
+    return -(-t_us // interval_us) * interval_us
+
+
+def run(update_ms, interval_us):
+    devices = {0x27: Hd44780Emu(2, 16)}
+    i2c = FakeI2C(freq=400_000, devices=devices)
+    scheduler = RenderScheduler([Display(0, I2cLcd(i2c, 0x27, 2, 16, gc_policy=GcPolicy()))])
+    encoder = frame_state.DeltaEncoder()
+    busy_until = 0
+    to_screen = to_ack = worst = 0
+    updates = SECONDS * 1000 // update_ms
+    for k in range(updates):
+        sent = k * update_ms * 1000 + 300     # sender's clock is not aligned
+        frame = encoder.encode(screen(k * update_ms), backlight=True)
+        start = max(next_event(sent, interval_us), busy_until)
+        t0 = utime.ticks_us()
+        scheduler.begin_frame()
+        frame_proto.parse(frame, len(frame), scheduler)
+        scheduler.end_frame()
+        while scheduler.step():
+            pass
+        done = start + utime.ticks_diff(utime.ticks_us(), t0)
+        busy_until = done
+        acked = next_event(done, interval_us)
+        to_screen += done - sent
+        to_ack += acked - sent
+        worst = max(worst, acked - sent)
+    assert devices[0x27].text(1) == screen((updates - 1) * update_ms)[1]
+    return to_screen // updates / 1000, to_ack // updates / 1000, worst / 1000
+
+
+def main():
+    print("profile   interval ms  update ms  to screen ms  to ack ms (worst)  "
+          "events/s  idle wakeups/s")
+    for name, p in sorted(frame_proto.PROFILES.items(), key=lambda item: item[1][0]):
+        _, imin, imax, latency, _, update_s, _ = p
+        for units in (imin, imax):
+            interval_us = units * 1250
+            screen_ms, ack_ms, worst_ms = run(int(update_s * 1000), interval_us)
+            events = 1_000_000 / interval_us
+            print("{:9s} {:11.2f} {:10d} {:13.1f} {:10.1f} ({:5.1f}) {:9.1f} {:15.1f}".format(
+                name, interval_us / 1000, int(update_s * 1000), screen_ms, ack_ms, worst_ms,
+                events, events / (latency + 1)))
+
+
+main()
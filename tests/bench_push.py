@@ -0,0 +1,203 @@
+# The sender's push API (sender/push.py). First the Board: ttl, clearing,
+# bad updates, coalescing. Then a real Unix socket and loopback HTTP
+# server, talked to like nc and curl would, and what is already at the
+# socket's path: a live socket, a file, a stale socket. Then PRODUCERS
+# processes each pushing UPDATES updates, one every GAP_S, over the socket
+# into the sender's render loop (a frame every INTERVAL_S, sooner after a
+# push but no more often than every MIN_GAP_S): frames made against
+# updates taken, and how long the last update took to go out. Runs in
+# real time under CPython:
+#
+#   python3 tests/host/run.py tests/bench_push.py
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+from push import Board, PushServer
+
+PRODUCERS = 20
+UPDATES = 50
+GAP_S = 0.02
+INTERVAL_S = 0.5
+MIN_GAP_S = 0.1
+
+
+def check_board():
+    board = Board(ttl=10.0)
+    assert board.submit({"LCD0": "Backup done"}, now=0.0) == [0]
+    assert board.submit({"LCD1": "build FAILED", "ttl": 0}, now=0.0) == [1]
+    assert board.overlay(["a", "b"], now=5.0) == ["Backup done     ", "build FAILED    "]
+    assert board.overlay(["a", "b"], now=11.0) == ["a", "build FAILED    "]
+    assert board.coalesced == 0
+    board.submit({"LCD0": "one"}, now=12.0)
+    board.submit({"LCD0": "two"}, now=12.0)
+    assert board.coalesced == 2
+    board.published()
+    board.submit({"LCD0": "three"}, now=13.0)
+    assert board.coalesced == 2
+    board.submit({"LCD0": None}, now=13.0)
+    assert board.overlay(["a", "b"], now=13.0)[0] == "a"
+    board.submit({"clear": True}, now=13.0)
+    assert board.overlay(["a", "b"], now=13.0) == ["a", "b"]
+    for bad in ([1, 2], {}, {"LCD0": 5}, {"LCD0": "x", "ttl": -1}, {"LCD2": "x"},
+                {"LCD0": "x", "ttl": float("nan")}, {"LCD0": "x", "ttl": float("inf")}):
+        try:
+            board.submit(bad, now=14.0)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"{bad!r} should be rejected")
+    assert board.rejected == 7 and board.overlay(["a", "b"], now=14.0) == ["a", "b"]
+    print("board: ttl, clear, coalescing and bad updates: ok")
+
+
+async def http(port, request, host=b"127.0.0.1"):
+    # request is the request line and any headers; Host is added
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    line, _, rest = request.partition(b"\r\n")
+    writer.write(line + b"\r\nHost: %s:%d\r\n" % (host, port) + rest)
+    data = await reader.read()
+    writer.close()
+    head, _, body = data.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+async def check_servers(path):
+    board = Board()
+    server = PushServer(board)
+    await server.start_unix(path)
+    await server.start_http(0)
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(b'{"LCD0": "Backup done"}\nnot json\n{"status": true}\n')
+    replies = [json.loads(await reader.readline()) for _ in range(3)]
+    writer.close()
+    assert replies[0] == {"ok": True, "rows": [0]}, replies[0]
+    assert not replies[1]["ok"]
+    assert replies[2]["pushed"][0]["text"] == "Backup done     "
+
+    body = b'{"LCD1": "build #512 ok"}'
+    code, reply = await http(server.port, b"POST /screen HTTP/1.1\r\n"
+                             b"Content-Type: application/json; charset=utf-8\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+    assert code == 200 and reply["rows"] == [1], (code, reply)
+    # What a web page could post here without asking first
+    code, _ = await http(server.port, b"POST /screen HTTP/1.1\r\nContent-Type: text/plain\r\n"
+                         b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+    assert code == 415
+    code, reply = await http(server.port, b"GET /status HTTP/1.1\r\n\r\n")
+    assert code == 200 and reply["submissions"] == 2, reply
+    code, _ = await http(server.port, b"POST /screen HTTP/1.1\r\nContent-Type: application/json"
+                         b"\r\nContent-Length: 3\r\n\r\n[1]")
+    assert code == 400
+    code, _ = await http(server.port, b"GET /nowhere HTTP/1.1\r\n\r\n")
+    assert code == 404
+    code, _ = await http(server.port, b"GET /screen HTTP/1.1\r\n\r\n")
+    assert code == 405
+    # Lengths int() would take, or choke on
+    for length in (b"-5", b"five", b"+3"):
+        code, _ = await http(server.port, b"POST /screen HTTP/1.1\r\nContent-Type: application/json"
+                             b"\r\nContent-Length: %s\r\n\r\n[1]" % length)
+        assert code == 400, (length, code)
+    # A page on another name that resolves to 127.0.0.1
+    code, _ = await http(server.port, b"POST /screen HTTP/1.1\r\nContent-Type: application/json"
+                         b"\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body),
+                         host=b"attacker.example")
+    assert code == 403
+    code, _ = await http(server.port, b"GET /status HTTP/1.1\r\n\r\n", host=b"localhost")
+    assert code == 200
+
+    # A second sender on the same path leaves the first one's socket be,
+    # and so does anything that finds a file there
+    try:
+        await PushServer(Board()).start_unix(path)
+    except OSError:
+        pass
+    else:
+        raise AssertionError("took over a socket still in use")
+    other = path + ".txt"
+    with open(other, "w") as f:
+        f.write("not a socket")
+    try:
+        await PushServer(Board()).start_unix(other)
+    except OSError:
+        pass
+    else:
+        raise AssertionError("removed a file that is not a socket")
+    assert os.path.exists(other)
+    await server.close()
+    assert not os.path.exists(path)
+
+    # One left behind by a sender that crashed is replaced
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    server = PushServer(Board())
+    await server.start_unix(path)
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    await server.close()
+
+
+async def producer(path, n, sent):
+    reader, writer = await asyncio.open_unix_connection(path)
+    for k in range(UPDATES):
+        writer.write(json.dumps({"LCD1": "job {:2d} at {:3d}".format(n, k)}).encode() + b"\n")
+        sent[0] = time.monotonic()
+        await reader.readline()
+        await asyncio.sleep(GAP_S)
+    writer.close()
+
+
+async def burst(path):
+    board = Board()
+    server = PushServer(board)
+    await server.start_unix(path)
+    frames = []
+    sent = [0.0]
+
+    async def render_loop():
+        while True:
+            frames.append((time.monotonic(), board.overlay(["CPU 12%", "UP 3 01:02:03"])))
+            board.published()
+            await board.wait(INTERVAL_S, MIN_GAP_S)
+
+    loop_task = asyncio.ensure_future(render_loop())
+    await asyncio.sleep(INTERVAL_S)
+    start = time.monotonic()
+    before = len(frames)
+    await asyncio.gather(*(producer(path, n, sent) for n in range(PRODUCERS)))
+    took = time.monotonic() - start
+    await asyncio.sleep(INTERVAL_S)
+    loop_task.cancel()
+    await server.close()
+    last = board.rows[1][0]
+    shown_at = next(t for t, rows in frames if rows[1] == last)
+    return board, len(frames) - before, took, (shown_at - sent[0]) * 1000
+
+
+def main():
+    check_board()
+    with tempfile.TemporaryDirectory() as tmp:
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(check_servers(os.path.join(tmp, "check.sock")))
+            board, frames, took, delay = asyncio.run(burst(os.path.join(tmp, "burst.sock")))
+    print("Unix socket and HTTP: updates, status and errors: ok")
+    print()
+    print("{} producers x {} updates in {:.2f} s: {} frames, {} coalesced, "
+          "last update out after {:.0f} ms".format(PRODUCERS, UPDATES, took, frames,
+                                                    board.coalesced, delay))
+    assert board.submissions == PRODUCERS * UPDATES
+    assert frames <= (took + INTERVAL_S) / MIN_GAP_S + 2
+    assert delay < MIN_GAP_S * 1000 + 50
+
+
+main()
@@ -0,0 +1,78 @@
+# What putstr() costs with the original putchar(), which re-addressed
+# after every character, and with the current one, which relies on the
+# controller's auto-increment and only sends an address on newlines and
+# line wraps: DDRAM address commands, bytes on the bus and the time they
+# take on the wire at 100 kHz. Both have to leave the same text on the
+# emulated HD44780. Runs against a fake bus. Upload fake_i2c.py,
+# hd44780_emu.py, pico_i2c_lcd.py and lcd_api.py, then run this file.
+
+from fake_i2c import FakeI2C
+from hd44780_emu import Hd44780Emu
+from pico_i2c_lcd import I2cLcd
+
+I2C_ADDR = 0x27
+
+CASES = (
+    (2, 16, "L1:0.42 CPU:12% "),
+    (2, 16, "Hello\nWorld"),
+    (2, 16, "https://github.com/electronf99/"),
+    (4, 20, "A status line that wraps over three of the four rows"),
+)
+
+
+class CountingLcd(I2cLcd):
+
+    def __init__(self, *args):
+        self.commands = 0
+        I2cLcd.__init__(self, *args)
+
+    def hal_write_command(self, cmd):
+        self.commands += 1
+        I2cLcd.hal_write_command(self, cmd)
+
+
+class PerCharLcd(CountingLcd):
+    # The original putchar(): the cursor's address is sent again after
+    # every character
+
+    def putchar(self, char):
+        if char == '\n':
+            if not self.implied_newline:
+                self.cursor_x = self.num_columns
+        else:
+            self.hal_write_data(ord(char) & 0xff)
+            self.cursor_x += 1
+        if self.cursor_x >= self.num_columns:
+            self.cursor_x = 0
+            self.cursor_y += 1
+            self.implied_newline = (char != '\n')
+        if self.cursor_y >= self.num_lines:
+            self.cursor_y = 0
+        self._addr = None
+        self.move_to(self.cursor_x, self.cursor_y)
+
+
+def run(cls, lines, cols, text):
+    # (commands, bus bytes, wire time in us, what the screen shows)
+    emu = Hd44780Emu(lines, cols)
+    i2c = FakeI2C(freq=100_000, devices={I2C_ADDR: emu})
+    lcd = cls(i2c, I2C_ADDR, lines, cols)
+    lcd.move_to(0, 0)
+    lcd.commands = 0
+    i2c.reset()
+    lcd.putstr(text)
+    return lcd.commands, i2c.bytes, i2c.wire_time_us(), [emu.text(y) for y in range(lines)]
+
+
+def main():
+    print("geometry  chars    commands    bus bytes    wire us")
+    print("                   old   new   old   new   old   new")
+    for lines, cols, text in CASES:
+        old = run(PerCharLcd, lines, cols, text)
+        new = run(CountingLcd, lines, cols, text)
+        assert old[3] == new[3], (old[3], new[3])
+        print("{:>2d}x{:<6d} {:5d} {:5d} {:5d} {:5d} {:5d} {:5d} {:5d}".format(
+            cols, lines, len(text), old[0], new[0], old[1], new[1], old[2], new[2]))
+
+
+main()
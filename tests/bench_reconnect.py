@@ -0,0 +1,106 @@
+# The sender's reconnect handling (sender/link.py). First Link itself,
+# under asyncio with a fake device: a drop is noticed, the reconnect
+# retries through failures, frames held while down keep only the latest
+# per display, and the counts come out right. Then a model of SENDERS
+# senders that lose the same device at t=0, which comes back OUTAGE_S
+# later. Every attempt takes ATTEMPT_S and succeeds if the device is back
+# when it starts. The table compares retry every second, plain doubling
+# and doubling with jitter: attempts made, the most attempts started in
+# any 100 ms after the first ones at t=0 (the crowd the device sees),
+# and time from the device being back to reconnected. CPython only:
+#
+#   python3 tests/host/run.py tests/bench_reconnect.py
+
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+from link import Link, Backoff
+
+SENDERS = 20
+OUTAGE_S = 61.3
+ATTEMPT_S = 1.0
+
+
+class FakeClient:
+
+    def __init__(self, n):
+        self.n = n
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+
+async def check():
+    device = {"up": True, "tries": 0, "made": 0}
+
+    async def connect():
+        device["tries"] += 1
+        if not device["up"]:
+            return None
+        device["made"] += 1
+        return FakeClient(device["made"])
+
+    link = Link(connect, Backoff(0.01, 0.05))
+    first = await link.wait()
+    assert first.n == 1 and link.up
+    device["up"] = False
+    link.lost(first, "radio")
+    link.lost(first)                         # said twice
+    await asyncio.sleep(0)
+    assert not link.up and not first.connected
+    for t in range(5):
+        link.hold(0, ["frame {}".format(t), ""])
+    link.hold(1, ["other display", ""])
+    assert await link.wait(0.05) is None     # still down
+    stale = FakeClient(99)
+    link.lost(stale)                         # not ours: ignored
+    device["up"] = True
+    second = await link.wait(1.0)
+    assert second.n == 2 and link.up
+    held = link.take()
+    assert held == {0: ["frame 4", ""], 1: ["other display", ""]}, held
+    assert link.take() == {}
+    assert link.reconnects == 1 and link.failures >= 2 and link.held == 4
+    assert link.downtime > 0.05 and link.longest == link.downtime
+    await link.close()
+    print("drop, retries, latest frame per display, counts: ok")
+
+
+def attempts(strategy, rng):
+    if strategy == "every 1 s":
+        backoff = Backoff(1.0, 1.0, jitter=0)
+    elif strategy == "doubling":
+        backoff = Backoff(0.5, 30.0, jitter=0)
+    else:
+        backoff = Backoff(0.5, 30.0, jitter=0.5, rng=rng)
+    t = 0.0
+    starts = []
+    while True:
+        starts.append(t)
+        if t >= OUTAGE_S:
+            return starts
+        t += ATTEMPT_S + backoff.delay()
+
+
+def main():
+    asyncio.run(check())
+    print()
+    print("retry        attempts each  busiest 100 ms  back to reconnected s (worst)")
+    for strategy in ("every 1 s", "doubling", "jittered"):
+        rng = random.Random(1)
+        runs = [attempts(strategy, rng) for _ in range(SENDERS)]
+        slots = {}
+        for starts in runs:
+            for t in starts[1:]:
+                slots[int(t * 10)] = slots.get(int(t * 10), 0) + 1
+        waits = [starts[-1] - OUTAGE_S for starts in runs]
+        print("{:11s} {:14.1f} {:15d} {:11.1f} ({:5.1f})".format(
+            strategy, sum(len(s) for s in runs) / SENDERS, max(slots.values()),
+            sum(waits) / len(waits), max(waits)))
+
+
+main()
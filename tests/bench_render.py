@@ -0,0 +1,101 @@
+# Rendering regression benchmark for LcdApi/I2cLcd. Each scenario renders
+# through the HD44780 emulator, checks the emulated screen shows what was
+# drawn, and fails if bus bytes per frame go over budget or if a byte
+# reached the controller while it was still busy. Meant for CI:
+#
+#   python3 tests/host/run.py tests/bench_render.py
+
+import sys
+import utime
+from fake_i2c import FakeI2C
+from hd44780_emu import Hd44780Emu
+from pico_i2c_lcd import I2cLcd, GcPolicy
+
+I2C_ADDR = 0x27
+FRAMES = 40
+MARQUEE = "https://github.com/electronf99/eric-LCD-BT-thingy "
+
+
+def status_flush(lcd, t):
+    # The sender's status screen: mostly the uptime seconds change
+    rows = ("L1:0.42 CPU:{:2d}% ".format(12 + t // 20),
+            "UP:3 04:05:{:02d} ".format(t % 60))
+    for y, text in enumerate(rows):
+        lcd.draw(0, y, text)
+    lcd.flush()
+    return rows
+
+
+def status_putstr(lcd, t):
+    rows = ("L1:0.42 CPU:{:2d}% ".format(12 + t // 20),
+            "UP:3 04:05:{:02d}   ".format(t % 60))
+    for y, text in enumerate(rows):
+        lcd.move_to(0, y)
+        lcd.putstr(text)
+    return rows
+
+
+def marquee(lcd, t):
+    i = t % len(MARQUEE)
+    row = (MARQUEE[i:] + MARQUEE[:i])[:16]
+    lcd.move_to(0, 1)
+    lcd.putstr(row)
+    return (None, row)
+
+
+def rack_20x4(lcd, t):
+    # Every cell of a 20x4 screen changes each frame
+    rows = []
+    for y in range(4):
+        rows.append("{}{:02d}".format(chr(0x41 + (t + y) % 26) * 18, t % 100))
+        lcd.draw(0, y, rows[y])
+    lcd.flush()
+    return rows
+
+
+# name, render, lines, columns, bus byte budget per frame
+SCENARIOS = (
+    ("status 16x2 flush", status_flush, 2, 16, 32),
+    ("status 16x2 putstr", status_putstr, 2, 16, 144),
+    ("marquee 16x2", marquee, 2, 16, 72),
+    ("rack 20x4 flush", rack_20x4, 4, 20, 352),
+)
+
+
+def run(render, lines, cols):
+    emu = Hd44780Emu(lines, cols)
+    i2c = FakeI2C(devices={I2C_ADDR: emu})
+    lcd = I2cLcd(i2c, I2C_ADDR, lines, cols, gc_policy=GcPolicy(frames=FRAMES))
+    i2c.reset()
+    errors = 0
+    cpu_us = 0
+    t_start = utime.ticks_us()
+    for t in range(FRAMES):
+        t0 = utime.ticks_us()
+        rows = render(lcd, t)
+        cpu_us += utime.ticks_diff(utime.ticks_us(), t0)
+        for y, text in enumerate(rows):
+            if text is not None and emu.text(y)[:len(text)] != text:
+                errors += 1
+    total_us = utime.ticks_diff(utime.ticks_us(), t_start)
+    return i2c, emu, total_us, errors
+
+
+def main():
+    print("scenario             bytes/frame  xfers/frame  us/frame  fps  result")
+    failed = 0
+    for name, render, lines, cols, budget in SCENARIOS:
+        i2c, emu, total_us, errors = run(render, lines, cols)
+        per_frame = i2c.bytes // FRAMES
+        ok = errors == 0 and per_frame <= budget and emu.busy_violations == 0
+        failed += not ok
+        print("{:20s} {:11d} {:12d} {:9d} {:4d}  {}".format(
+            name, per_frame, i2c.transactions // FRAMES, total_us // FRAMES,
+            FRAMES * 1_000_000 // max(total_us, 1),
+            "ok" if ok else "FAIL ({} bad rows, {} while busy, budget {})".format(
+                errors, emu.busy_violations, budget)))
+    if failed:
+        sys.exit(1)
+
+
+main()
@@ -0,0 +1,138 @@
+# Metric-source plugins (sender/sources.py) on the Collector. First the
+# row templates: missing values, bad format specs, a plugin registered
+# with @source and a call that never returns. Then a router poll that
+# hangs for HANG_S: with a timeout its last value stays on screen and the
+# other sources carry on. Then a slow sensor (it changes every CHANGE_S)
+# sampled every INTERVAL_S, fixed and with a max_interval: samples taken
+# against how long a change takes to show. Runs in real time under
+# CPython only (it needs threads):
+#
+#   python3 tests/host/run.py tests/bench_sources.py
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+from collector import Collector
+import sources
+
+HANG_S = 0.5
+INTERVAL_S = 0.01
+MAX_INTERVAL_S = 0.16
+CHANGE_S = 0.4
+RUN_S = 2.0
+
+
+def check():
+    assert sources.fields("L1:{load:.2f} CPU:{cpu:2.0f}%", "UP:{uptime} {cpu}") == \
+        ["load", "cpu", "uptime"]
+    assert sources.render("CPU:{cpu:2.0f}%", {"cpu": 7.4}) == "CPU: 7%".ljust(16)
+    assert sources.render("CPU:{cpu:2.0f}%", {}) == "CPU:--%".ljust(16)
+    assert sources.render("UP:{uptime:.1f}", {"uptime": "3 01:02:03"}) == "UP:3 01:02:03   "
+    assert sources.render("{a}{a}{a}{a}{a}", {"a": "abcd"}) == "abcdabcdabcdabcd"
+
+    @sources.source("bench_wan", interval=0.01, timeout=0.05)
+    def bench_wan():
+        return lambda: "wan up"
+    c = Collector()
+    sources.add_sources(c, ["bench_wan"])
+    try:
+        sources.add_sources(c, ["no_such_source"])
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("an unknown source should raise KeyError")
+    with c:
+        time.sleep(0.05)
+        assert c.snapshot().get("bench_wan") == "wan up"
+    del sources.REGISTRY["bench_wan"]
+
+    # A call that never returns is left on a daemon thread, so it cannot
+    # hold up the sender's exit
+    forever = threading.Event()
+    c = Collector()
+    c.add("stuck", forever.wait, 0.01, timeout=0.02)
+    with c:
+        time.sleep(0.05)
+    stuck = [t for t in threading.enumerate() if t.name.startswith("collector-stuck")]
+    assert stuck and all(t.daemon for t in stuck), stuck
+    forever.set()
+    print("templates, missing values, bad specs, plugins and stuck calls: ok")
+
+
+def hung():
+    # The router answers, then hangs for HANG_S, then answers again
+    state = {"hang": False, "n": 0}
+
+    def router():
+        if state["hang"]:
+            time.sleep(HANG_S)
+        return "wan up"
+
+    def counter():
+        state["n"] += 1
+        return state["n"]
+    c = Collector()
+    c.add("router", router, 0.02, timeout=0.05)
+    c.add("count", counter, 0.02)
+    with c:
+        time.sleep(0.1)
+        state["hang"] = True
+        before = c.snapshot().get("count")
+        time.sleep(HANG_S / 2)
+        snap = c.snapshot()
+        state["hang"] = False
+        time.sleep(HANG_S)
+    router_src = c.sources["router"]
+    print("router hung {:.0f} ms: shown {!r} meanwhile, count went {} -> {}, "
+          "{} timeouts, {} rounds late".format(HANG_S * 1000, snap.get("router"), before,
+                                               snap.get("count"), router_src.timeouts,
+                                               router_src.late))
+    assert snap.get("router") == "wan up"
+    assert snap.get("count") > before
+    assert router_src.timeouts >= 1 and router_src.late >= 1
+
+
+def sensor(max_interval):
+    start = time.monotonic()
+    calls = [0]
+
+    def temp():
+        calls[0] += 1
+        return int((time.monotonic() - start) / CHANGE_S)
+    c = Collector()
+    c.add("temp", temp, INTERVAL_S, max_interval=max_interval)
+    lags = []
+    seen = 0
+    with c:
+        end = start + RUN_S
+        while time.monotonic() < end:
+            value = c.snapshot().get("temp")
+            if value is not None and value > seen:
+                # How long after the change did it show?
+                lags.append((time.monotonic() - start - value * CHANGE_S) * 1000)
+                seen = value
+            time.sleep(0.002)
+    return calls[0], lags
+
+
+def main():
+    check()
+    print()
+    hung()
+    print()
+    print("sampling      samples  changes  mean lag ms  worst lag ms")
+    for label, max_interval in (("fixed", None), ("max_interval", MAX_INTERVAL_S)):
+        calls, lags = sensor(max_interval)
+        print("{:12s} {:8d} {:8d} {:12.0f} {:13.0f}".format(
+            label, calls, len(lags), sum(lags) / len(lags), max(lags)))
+        if max_interval is None:
+            fixed = calls
+        else:
+            assert calls < fixed / 2
+            assert max(lags) < max_interval * 1000 + 50
+
+
+main()
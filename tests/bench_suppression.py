@@ -0,0 +1,104 @@
+# The sender's loop with and without frame_state.ChangeFilter, in virtual
+# time: a screen that changes every second (the uptime clock) and one
+# that changes once a minute, at each profile's update interval. Without
+# the filter every render is sent; with it unchanged renders are dropped
+# and a keepalive goes out after KEEPALIVE_S of quiet. Frames go through
+# SeqCheck and parse() onto the HD44780 emulator, so the I2C traffic and
+# final screen are real. Last, a device that only acks once a second,
+# to show changed renders being coalesced while the sender waits for
+# credit. Run with:
+#
+#   python3 tests/host/run.py tests/bench_suppression.py
+
+import os
+import sys
+from fake_i2c import FakeI2C
+from hd44780_emu import Hd44780Emu
+from pico_i2c_lcd import I2cLcd, GcPolicy
+from displays import Display, RenderScheduler
+import frame_proto
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sender"))
+import frame_state
+
+RUN_S = 600
+KEEPALIVE_S = 10.0
+
+
+def clock(t):
+    t = int(t)
+    return ["L1:0.42 CPU: 7% ", "UP:3 {:02d}:{:02d}:{:02d}".format(t // 3600, t // 60 % 60, t % 60)]
+
+
+def static(t):
+    t = int(t) // 60
+    return ["WAN up  {:3d} Mb/s".format(90 + t % 7), "clients: {:2d}".format(12 + t % 3)]
+
+
+def run(screen, interval, filtered, ack_every=None):
+    devices = {0x27: Hd44780Emu(2, 16)}
+    i2c = FakeI2C(freq=400_000, devices=devices)
+    scheduler = RenderScheduler([Display(0, I2cLcd(i2c, 0x27, 2, 16, gc_policy=GcPolicy()))])
+    check = frame_proto.SeqCheck()
+    encoder = frame_state.DeltaEncoder()
+    window = frame_state.CreditWindow(4)
+    changes = frame_state.ChangeFilter(KEEPALIVE_S)
+    frames = air = 0
+    next_ack = ack_every
+    pending = None
+    t = 0.0
+    while t < RUN_S:
+        rows = screen(t)
+        kind = frame_state.SEND
+        if filtered and encoder.shown is not None:
+            kind = changes.check(rows, t)
+        if ack_every is not None and t >= next_ack:
+            # The busy device acks what it has taken, once a second
+            if pending is not None:
+                window.on_ack(frame_proto.encode_ack(pending, 4, 0))
+            next_ack += ack_every
+        if kind != frame_state.SKIP:
+            if not window.can_send((encoder.seq + 1) & 0xffff):
+                if kind == frame_state.SEND:
+                    changes.hold(rows)
+            else:
+                frame = encoder.encode(rows, None if kind == frame_state.KEEPALIVE else True)
+                frames += 1
+                air += len(frame) + frame_proto.AIR_OVERHEAD
+                assert check.accept(frame, len(frame))
+                scheduler.begin_frame()
+                frame_proto.parse(frame, len(frame), scheduler)
+                scheduler.end_frame()
+                while scheduler.step():
+                    pass
+                if ack_every is None:
+                    window.on_ack(frame_proto.encode_ack(encoder.seq, 4, 0))
+                else:
+                    pending = encoder.seq
+                changes.done(rows, t, kind)
+        t += interval
+    assert devices[0x27].text(1).rstrip() == encoder.shown[1]
+    return frames, changes, air, i2c.bytes
+
+
+def main():
+    print("screen  interval s  filter  frames  keepalive  suppressed  air B  I2C B")
+    for name, screen in (("clock", clock), ("static", static)):
+        for interval in (0.1, 0.5, 2.0):
+            for filtered in (False, True):
+                frames, changes, air, i2c = run(screen, interval, filtered)
+                print("{:7s} {:10.1f}  {:6s} {:6d} {:10d} {:11d} {:6d} {:6d}".format(
+                    name, interval, "on" if filtered else "off", frames,
+                    changes.keepalives, changes.suppressed, air, i2c))
+    frames, changes, air, i2c = run(clock, 0.1, True, ack_every=1.0)
+    print()
+    print("acks once a second, 0.1 s updates: {} frames, {} coalesced".format(
+        frames, changes.coalesced))
+    assert changes.coalesced == 0    # the clock changes once a second, after the ack
+    frames, changes, air, i2c = run(lambda t: clock(t * 10), 0.1, True, ack_every=1.0)
+    print("... screen changing every update: {} frames, {} coalesced".format(
+        frames, changes.coalesced))
+    assert changes.coalesced > 0
+
+
+main()
@@ -0,0 +1,108 @@
+# main.py on the host, for benches that need the device's own receive
+# loop rather than a copy of it. FakeDevice imports main.py afresh (so
+# every run starts from boot) on the machine stand-in's emulated 16x2,
+# hooks it up to a BLEUART on the bluetooth stand-in the way main_async()
+# does, and steps render_task() by hand: step() resumes it until it is
+# waiting for the next frame. What the firmware prints goes to `log`.
+# Run the benches that use it with tests/host/run.py.
+
+import contextlib
+import io
+import sys
+import displays
+import machine
+from hd44780_emu import Hd44780Emu
+from ble_uart import BLEUART
+
+I2C_ADDR = 0x27
+
+
+class _Flag:
+    # MicroPython's asyncio.ThreadSafeFlag, for a coroutine stepped with
+    # send(): wait() suspends while the flag is clear
+
+    def __init__(self):
+        self._set = False
+        self.waiting = False
+
+    def set(self):
+        self._set = True
+
+    async def wait(self):
+        while not self._set:
+            self.waiting = True
+            await _Suspend()
+        self.waiting = False
+        self._set = False
+
+
+class _Suspend:
+
+    def __await__(self):
+        yield
+
+
+class _Asyncio:
+    # The parts of MicroPython's asyncio that render_task() and
+    # RenderScheduler.run() use and CPython's lacks
+    ThreadSafeFlag = _Flag
+
+    @staticmethod
+    async def sleep_ms(ms):
+        await _Suspend()
+
+
+class FakeDevice:
+    # freq, if given, is the bus speed to run at instead of the one
+    # calibrate_i2c() picked
+
+    def __init__(self, freq=None):
+        self.log = io.StringIO()
+        self.emu = machine.DEVICES[I2C_ADDR] = Hd44780Emu(2, 16)
+        sys.modules.pop("main", None)
+        with contextlib.redirect_stdout(self.log):
+            import main
+            main.asyncio = displays.asyncio = _Asyncio
+            if freq is not None:
+                main.i2c.freq = freq
+            self.uart = BLEUART(rx_buf_size=main.RX_BUF_SIZE,
+                                max_connections=main.MAX_CENTRALS)
+        self.main = main
+        self.ble = self.uart._ble
+        # As main_async() sets things up
+        main.adv_name = self.uart.adv_name
+        main.rx_ring.flag = self.flag = _Asyncio.ThreadSafeFlag()
+        self.uart.set_on_connect(main.on_connect)
+        self.uart.set_on_disconnect(main.on_disconnect)
+        self.uart.set_rx_ring(main.rx_ring)
+        main.scheduler.show_status("bt: " + main.adv_name)
+        self.flag.set()
+        self._task = main.render_task(self.uart)
+        self.step()
+
+    def connect(self, conn_handle):
+        with contextlib.redirect_stdout(self.log):
+            self.ble.connect(conn_handle)
+
+    def disconnect(self, conn_handle):
+        with contextlib.redirect_stdout(self.log):
+            self.ble.disconnect(conn_handle)
+
+    def write(self, conn_handle, frame):
+        # A central writing to the RX characteristic
+        self.ble.write(conn_handle, self.uart._rx_handle, frame)
+
+    def step(self):
+        with contextlib.redirect_stdout(self.log):
+            self._task.send(None)
+            while not self.flag.waiting:
+                self._task.send(None)
+
+    def notified(self):
+        # What was notified since the last call: [(conn_handle, data)]
+        sent = [(conn_handle, data) for conn_handle, _, data in self.ble.notified]
+        self.ble.notified.clear()
+        return sent
+
+    def text(self, y):
+        return self.emu.text(y)
@@ -0,0 +1,170 @@
+# Fake I2C bus for exercising I2cLcd without a display attached.
+# Upload alongside pico_i2c_lcd.py and lcd_api.py to run the bench_* scripts,
+# or run them on a PC with tests/host/run.py.
+
+from pico_i2c_lcd import I2cLcd, MASK_RS, MASK_RW, MASK_E, SHIFT_BACKLIGHT, SHIFT_DATA
+import utime
+import gc
+
+
+class FakeI2C:
+    # Stands in for SoftI2C/I2C and counts what would have gone over the wire.
+    # Reads return the last byte written, like the PCF8574's quasi-
+    # bidirectional pins. Above max_freq every third read comes back with a
+    # flipped bit and every fifth write fails with EIO.
+    #
+    # devices maps addresses to emulated devices (see hd44780_emu.py) which
+    # get every byte written and answer reads; other addresses then fail
+    # with ENODEV. fail_write(n) lets n more writes through and fails the
+    # one after with EIO, whatever the frequency.
+
+    def __init__(self, freq=500_000, max_freq=None, devices=None):
+        self.freq = freq
+        self.max_freq = max_freq
+        self.devices = devices
+        self.pins = 0
+        self._errors = 0
+        self._clocks = 0
+        self._fail_in = 0
+        self.reset()
+
+    def reset(self):
+        self.transactions = 0
+        self.bytes = 0
+
+    def scan(self):
+        if self.devices is not None:
+            return sorted(self.devices)
+        return [0x27]
+
+    def _device(self, addr):
+        if self.devices is None:
+            return None
+        if addr not in self.devices:
+            raise OSError(19)
+        return self.devices[addr]
+
+    def _wire(self, clocks):
+        # Let a host clock (tests/host/utime.py) see the bus time pass. The
+        # clocks are summed so that rounding to whole microseconds doesn't
+        # add up over many bytes
+        advance = getattr(utime, "advance_us", None)
+        if advance:
+            before = self._clocks * 1_000_000 // self.freq
+            self._clocks += clocks
+            advance(self._clocks * 1_000_000 // self.freq - before)
+
+    def _unreliable(self):
+        return self.max_freq is not None and self.freq > self.max_freq
+
+    def fail_write(self, after=0):
+        self._fail_in = after + 1
+
+    def writeto(self, addr, buf):
+        if self._fail_in:
+            self._fail_in -= 1
+            if not self._fail_in:
+                raise OSError(5)
+        if self._unreliable():
+            self._errors += 1
+            if self._errors % 5 == 0:
+                raise OSError(5)
+        device = self._device(addr)
+        self.transactions += 1
+        self.bytes += len(buf)
+        # Start + address byte, then each byte reaches the device as its
+        # 9th clock goes by, so the device sees the time between them
+        self._wire(1 + 9)
+        for byte in buf:
+            self._wire(9)
+            if device:
+                device.write(byte)
+        self._wire(1)
+        if len(buf):
+            self.pins = buf[len(buf) - 1]
+        return len(buf)
+
+    def readfrom_into(self, addr, buf):
+        device = self._device(addr)
+        self.transactions += 1
+        self.bytes += len(buf)
+        self._wire(1 + 9)
+        for i in range(len(buf)):
+            self._wire(9)
+            buf[i] = device.read() if device else self.pins
+        self._wire(1)
+        if self._unreliable():
+            self._errors += 1
+            if self._errors % 3 == 0:
+                buf[0] ^= 0x10
+
+    def wire_time_us(self):
+        # Start + address byte + payload bytes (9 clocks each with ACK) + stop
+        clocks = self.transactions * (1 + 9 + 1) + self.bytes * 9
+        return clocks * 1_000_000 // self.freq
+
+
+class BusyFakeI2C(FakeI2C):
+    # Also answers busy flag reads: the controller reports busy for busy_us
+    # after a clear or home command. With wired=False every read comes back
+    # with the data lines high, like a backpack without R/W connected.
+
+    def __init__(self, freq=500_000, busy_us=1520, wired=True):
+        FakeI2C.__init__(self, freq)
+        self.busy_us = busy_us
+        self.wired = wired
+        self._busy_until = utime.ticks_us()
+
+    def reset(self):
+        FakeI2C.reset(self)
+        self.reads = 0
+
+    def writeto(self, addr, buf):
+        n = len(buf)
+        if n >= 4 and not buf[n - 1] & (MASK_RS | MASK_RW):
+            cmd = (buf[n - 4] & 0xf0) | (buf[n - 2] >> 4)
+            if cmd in (1, 2):
+                self._busy_until = utime.ticks_add(utime.ticks_us(), self.busy_us)
+        return FakeI2C.writeto(self, addr, buf)
+
+    def readfrom_into(self, addr, buf):
+        self.transactions += 1
+        self.bytes += len(buf)
+        self.reads += 1
+        self._wire(1 + 9 + 1 + len(buf) * 9)
+        if not self.wired:
+            buf[0] = 0xff
+        elif utime.ticks_diff(self._busy_until, utime.ticks_us()) > 0:
+            buf[0] = 0x80
+        else:
+            buf[0] = 0x00
+
+
+class LegacyI2cLcd(I2cLcd):
+    # The original driver write path: four writeto() calls and four fresh
+    # bytes objects per byte sent, then a gc.collect(). Kept here so
+    # benchmarks can compare against it.
+
+    def hal_batch_begin(self):
+        pass
+
+    def hal_batch_end(self):
+        pass
+
+    def _write_legacy(self, flags, value):
+        byte = flags | (((value >> 4) & 0x0f) << SHIFT_DATA)
+        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
+        self.i2c.writeto(self.i2c_addr, bytes([byte]))
+        byte = flags | ((value & 0x0f) << SHIFT_DATA)
+        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
+        self.i2c.writeto(self.i2c_addr, bytes([byte]))
+
+    def hal_write_command(self, cmd):
+        self._write_legacy(self.backlight << SHIFT_BACKLIGHT, cmd)
+        if cmd <= 3:
+            utime.sleep_ms(5)
+        gc.collect()
+
+    def hal_write_data(self, data):
+        self._write_legacy(MASK_RS | (self.backlight << SHIFT_BACKLIGHT), data)
+        gc.collect()
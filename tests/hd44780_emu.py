@@ -0,0 +1,161 @@
+# HD44780 behind a PCF8574 backpack, emulated from the I2C byte stream.
+# Attach it to a FakeI2C to check what I2cLcd actually puts on screen.
+
+import utime
+from pico_i2c_lcd import MASK_RS, MASK_RW, MASK_E, SHIFT_BACKLIGHT, SHIFT_DATA
+
+# Execution times from the HD44780 datasheet (270 kHz oscillator)
+EXEC_US = 37
+CLEAR_US = 1520
+
+
+class Hd44780Emu:
+
+    # Every byte written to the PCF8574 sets its pins; the LCD latches the
+    # data nibble on the falling edge of E. Decoded commands and data are
+    # applied to DDRAM/CGRAM, and reads with R/W high return the busy flag
+    # and address counter. rw_wired=False models a backpack with R/W tied to
+    # ground, where "reads" are clocked in as writes.
+
+    def __init__(self, num_lines=2, num_columns=16, rw_wired=True):
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        self.rw_wired = rw_wired
+        self.ddram = bytearray(b" " * 0x80)
+        self.cgram = bytearray(64)
+        self.addr = 0
+        self.cgram_mode = False
+        self.four_bit = False
+        self.two_lines = False
+        self.increment = True
+        self.display_on = False
+        self.backlight = False
+        self.pins = 0
+        self._nibble = None
+        self._read_low = False
+        self._busy_until = utime.ticks_us()
+        self.reset_counts()
+
+    def reset_counts(self):
+        self.commands = 0
+        self.data = 0
+        self.bytes = 0
+        self.reads = 0
+        self.busy_violations = 0
+
+    # -------- PCF8574 side --------
+    def write(self, byte):
+        self.bytes += 1
+        prev = self.pins
+        self.pins = byte
+        self.backlight = bool(byte & (1 << SHIFT_BACKLIGHT))
+        if prev & MASK_E and not byte & MASK_E:
+            if prev & MASK_RW and self.rw_wired:
+                if self.four_bit:
+                    self._read_low = not self._read_low
+            else:
+                self._latch(prev >> SHIFT_DATA, prev & MASK_RS)
+
+    def read(self):
+        # What the PCF8574 pins read back: the LCD drives D4-D7 while R/W
+        # and E are high, otherwise the pins show what was last written.
+        self.reads += 1
+        pins = self.pins
+        if pins & MASK_E and pins & MASK_RW and self.rw_wired and not pins & MASK_RS:
+            if self._read_low:
+                nibble = self.addr & 0x0f
+            else:
+                nibble = (self.addr >> 4) & 0x07
+                if self.busy():
+                    nibble |= 0x08
+            pins = (pins & 0x0f) | (nibble << SHIFT_DATA)
+        return pins
+
+    def busy(self):
+        return utime.ticks_diff(self._busy_until, utime.ticks_us()) > 0
+
+    # -------- HD44780 side --------
+    def _latch(self, nibble, rs):
+        if not self.four_bit:
+            self._execute(nibble << 4, rs)
+            return
+        if self._nibble is None:
+            self._nibble = nibble
+        else:
+            value = (self._nibble << 4) | nibble
+            self._nibble = None
+            self._execute(value, rs)
+
+    def _execute(self, value, rs):
+        if self.busy():
+            self.busy_violations += 1
+        exec_us = EXEC_US
+        if rs:
+            self.data += 1
+            if self.cgram_mode:
+                self.cgram[self.addr & 0x3f] = value & 0x1f
+                self.addr = (self.addr + 1) & 0x3f
+            else:
+                self.ddram[self.addr] = value
+                self._advance()
+        else:
+            self.commands += 1
+            if value & 0x80:
+                self.cgram_mode = False
+                self.addr = value & 0x7f
+            elif value & 0x40:
+                self.cgram_mode = True
+                self.addr = value & 0x3f
+            elif value & 0x20:
+                self.four_bit = not value & 0x10
+                self.two_lines = bool(value & 0x08)
+            elif value & 0x10:
+                pass    # cursor/display shift is not emulated
+            elif value & 0x08:
+                self.display_on = bool(value & 0x04)
+            elif value & 0x04:
+                self.increment = bool(value & 0x02)
+            elif value & 0x02:
+                self.addr = 0
+                self.cgram_mode = False
+                exec_us = CLEAR_US
+            elif value & 0x01:
+                for i in range(len(self.ddram)):
+                    self.ddram[i] = 0x20
+                self.addr = 0
+                self.cgram_mode = False
+                exec_us = CLEAR_US
+        self._busy_until = utime.ticks_add(utime.ticks_us(), exec_us)
+
+    def _advance(self):
+        step = 1 if self.increment else -1
+        if self.two_lines:
+            a = self.addr + step
+            if a == 0x28:
+                a = 0x40
+            elif a == 0x68:
+                a = 0x00
+            elif a == 0x3f:
+                a = 0x27
+            elif a == -1:
+                a = 0x67
+            self.addr = a
+        else:
+            self.addr = (self.addr + step) % 0x50
+
+    # -------- Inspection --------
+    def line_addr(self, y):
+        addr = 0x40 if y & 1 else 0
+        if y & 2:
+            addr += self.num_columns
+        return addr
+
+    def row(self, y):
+        base = self.line_addr(y)
+        return bytes(self.ddram[base:base + self.num_columns])
+
+    def text(self, y):
+        return "".join(chr(c) for c in self.row(y))
+
+    def glyph(self, slot):
+        return list(self.cgram[slot * 8:slot * 8 + 8])
@@ -0,0 +1,107 @@
+# CPython stand-in for MicroPython's bluetooth module: enough of BLE for
+# ble_uart.BLEUART to run on a PC. Scripts play the central with connect(),
+# write() and disconnect(), which raise the same IRQs a real one would;
+# notifies end up in `notified` and the current advertising in
+# `advertising`.
+
+ADDR_PUBLIC = 0
+ADDR_RANDOM = 1
+
+_IRQ_CENTRAL_CONNECT = 1
+_IRQ_CENTRAL_DISCONNECT = 2
+_IRQ_GATTS_WRITE = 3
+_IRQ_CONNECTION_UPDATE = 27
+
+
+class UUID:
+
+    def __init__(self, value):
+        self._value = value
+
+    def __bytes__(self):
+        if isinstance(self._value, int):
+            return bytes((self._value & 0xff, self._value >> 8))
+        return bytes(reversed(bytes.fromhex(self._value.replace("-", ""))))
+
+    def __eq__(self, other):
+        return isinstance(other, UUID) and bytes(self) == bytes(other)
+
+    def __hash__(self):
+        return hash(bytes(self))
+
+
+class BLE:
+
+    def __init__(self):
+        self._active = False
+        self._irq = None
+        self._values = {}
+        self._next_handle = 1
+        self._config = {"mac": (ADDR_PUBLIC, b"\x24\x0a\xc4\x12\x34\x56"), "mtu": 23}
+        self.notified = []
+        self.advertising = None
+        self.adv_count = 0
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = bool(value)
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config[args[0]]
+        self._config.update(kwargs)
+
+    def irq(self, handler):
+        self._irq = handler
+
+    def gatts_register_services(self, services):
+        handles = []
+        for _, chars in services:
+            service_handles = []
+            for _ in chars:
+                # Each characteristic takes a value and a declaration handle
+                self._next_handle += 2
+                service_handles.append(self._next_handle)
+            handles.append(tuple(service_handles))
+        return tuple(handles)
+
+    def gatts_set_buffer(self, value_handle, size, append=False):
+        pass
+
+    def gatts_read(self, value_handle):
+        return self._values.get(value_handle, b"")
+
+    def gatts_write(self, value_handle, data):
+        self._values[value_handle] = bytes(data)
+
+    def gatts_notify(self, conn_handle, value_handle, data=None):
+        if data is None:
+            data = self._values.get(value_handle, b"")
+        self.notified.append((conn_handle, value_handle, bytes(data)))
+
+    def gap_advertise(self, interval_us, adv_data=None, resp_data=None, connectable=True):
+        if interval_us is None:
+            self.advertising = None
+        else:
+            self.advertising = (interval_us, adv_data, resp_data)
+            self.adv_count += 1
+
+    def gap_disconnect(self, conn_handle):
+        self.disconnect(conn_handle)
+
+    # -------- The central's side --------
+    def connect(self, conn_handle=0, addr=b"\x00\x00\x00\x00\x00\x01"):
+        # Like the real stack, a connection ends advertising
+        self.advertising = None
+        self._irq(_IRQ_CENTRAL_CONNECT, (conn_handle, ADDR_PUBLIC, addr))
+
+    def disconnect(self, conn_handle=0, addr=b"\x00\x00\x00\x00\x00\x01"):
+        self._irq(_IRQ_CENTRAL_DISCONNECT, (conn_handle, ADDR_PUBLIC, addr))
+
+    def update_params(self, conn_handle, interval, latency, timeout):
+        self._irq(_IRQ_CONNECTION_UPDATE, (conn_handle, interval, latency, timeout, 0))
+
+    def write(self, conn_handle, value_handle, data):
+        self._values[value_handle] = bytes(data)
+        self._irq(_IRQ_GATTS_WRITE, (conn_handle, value_handle))
@@ -0,0 +1,35 @@
+# CPython stand-in for the parts of MicroPython's machine module used here.
+# I2C and SoftI2C talk to emulated devices on one shared bus; by default a
+# 16x2 HD44780 behind a PCF8574 at 0x27, the same as the real thingy.
+
+from fake_i2c import FakeI2C
+from hd44780_emu import Hd44780Emu
+
+DEVICES = {0x27: Hd44780Emu(2, 16)}
+
+
+class Pin:
+
+    IN = 0
+    OUT = 1
+
+    def __init__(self, id, mode=-1, value=None):
+        self.id = id
+        self._value = value or 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+
+
+class SoftI2C(FakeI2C):
+
+    def __init__(self, scl=None, sda=None, freq=400_000, timeout=50_000):
+        FakeI2C.__init__(self, freq=freq, devices=DEVICES)
+
+
+class I2C(FakeI2C):
+
+    def __init__(self, id=0, scl=None, sda=None, freq=400_000):
+        FakeI2C.__init__(self, freq=freq, devices=DEVICES)
@@ -0,0 +1,27 @@
+# Runs the tests/ scripts under CPython with the stand-ins in this folder
+# taking the place of machine, utime and micropython.
+#
+#   python3 tests/host/run.py                  # every tests/bench_*.py
+#   python3 tests/host/run.py tests/scani2c.py # one script
+
+import glob
+import os
+import runpy
+import sys
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+TESTS = os.path.dirname(HOST)
+ROOT = os.path.dirname(TESTS)
+
+
+def main(argv):
+    sys.path[:0] = [HOST, TESTS, ROOT]
+    scripts = argv or sorted(glob.glob(os.path.join(TESTS, "bench_*.py")))
+    for script in scripts:
+        print("==", os.path.relpath(script, ROOT))
+        runpy.run_path(script, run_name="__main__")
+        print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,42 @@
+# CPython stand-in for MicroPython's utime, for running the LCD code on a
+# Linux box. Sleeps don't block: they advance a virtual clock that the
+# ticks_* functions include, so busy waits and pacing still see time pass
+# while benchmarks run at full speed. The fake I2C bus advances the same
+# clock by the time each transfer would take on the wire.
+
+import time as _time
+
+_virtual_us = 0
+
+
+def advance_us(us):
+    global _virtual_us
+    _virtual_us += int(us)
+
+
+def ticks_us():
+    return int(_time.perf_counter() * 1_000_000) + _virtual_us
+
+
+def ticks_ms():
+    return ticks_us() // 1000
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def ticks_diff(ticks1, ticks2):
+    return ticks1 - ticks2
+
+
+def sleep_us(us):
+    advance_us(us)
+
+
+def sleep_ms(ms):
+    advance_us(ms * 1000)
+
+
+def sleep(seconds):
+    advance_us(seconds * 1_000_000)